@@ -1,6 +1,8 @@
 from django.contrib import admin
 
-from .models import Comment, Follow, Group, Post
+from . import search
+from .models import (Comment, Follow, Group, GroupTrend, Post, PostTrend,
+                     QueuedTask, Recommendation, UserStats)
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -26,19 +28,85 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        post_ids = search.get_backend().search_posts(search_term)
+        return queryset.filter(pk__in=post_ids), False
+
 
 class CommentAdmin(admin.ModelAdmin):
     list_display = ("post", )
     list_filter = ("created", )
     search_fields = ("text",)
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        comment_ids = search.get_backend().search_comments(search_term)
+        return queryset.filter(pk__in=comment_ids), False
+
 
 class FollowAdmin(admin.ModelAdmin):
     list_display = ("pk", "author", "user",)
     list_filter = ("author", "user",)
 
 
+class UserStatsAdmin(admin.ModelAdmin):
+    list_display = ("user",
+                    "posts_count",
+                    "followers_count",
+                    "following_count",
+                    )
+    readonly_fields = ("posts_count",
+                       "followers_count",
+                       "following_count",
+                       )
+
+
+class RecommendationAdmin(admin.ModelAdmin):
+    list_display = ("user",
+                    "rank",
+                    "candidate",
+                    "score",
+                    "reason",
+                    )
+    list_filter = ("reason",)
+    raw_id_fields = ("user", "candidate",)
+
+
+class PostTrendAdmin(admin.ModelAdmin):
+    list_display = ("post",
+                    "score",
+                    "updated",
+                    )
+    raw_id_fields = ("post",)
+
+
+class GroupTrendAdmin(admin.ModelAdmin):
+    list_display = ("group",
+                    "score",
+                    "updated",
+                    )
+
+
+class QueuedTaskAdmin(admin.ModelAdmin):
+    list_display = ("pk",
+                    "name",
+                    "status",
+                    "attempts",
+                    "run_at",
+                    )
+    list_filter = ("status", "name",)
+    readonly_fields = ("created", "locked_at", "last_error",)
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
+admin.site.register(UserStats, UserStatsAdmin)
+admin.site.register(Recommendation, RecommendationAdmin)
+admin.site.register(PostTrend, PostTrendAdmin)
+admin.site.register(GroupTrend, GroupTrendAdmin)
+admin.site.register(QueuedTask, QueuedTaskAdmin)
@@ -0,0 +1,186 @@
+import math
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import islice
+
+from django.db import connection
+from django.utils import timezone
+
+from . import counters, recommendations, search, timeline
+from .models import Comment, Follow, Group, Post, User
+
+BATCH_SIZE = 500
+
+
+@contextmanager
+def scratch_database(verbosity=0, name=None):
+    """
+    Создает временную тестовую БД, чтобы замеры не трогали рабочие данные.
+    Для SQLite `name` задает файл вместо БД в памяти.
+    """
+    old_name = connection.settings_dict['NAME']
+    if name is not None:
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = name
+    connection.creation.create_test_db(verbosity=verbosity,
+                                       autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """
+    Отключает auto_now_add у полей, чтобы bulk_create сохранил даты.
+    """
+    previous = [(field, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in previous:
+            field.auto_now_add = value
+
+
+def power_law_weights(count, alpha):
+    """
+    Накопленные веса распределения Ципфа: k-й элемент выбирается
+    с вероятностью, пропорциональной 1 / k ** alpha.
+    """
+    weights = []
+    total = 0
+    for rank in range(1, count + 1):
+        total += 1 / rank ** alpha
+        weights.append(total)
+    return weights
+
+
+def seed(users=1000, groups=20, posts=50000, comments=100000,
+         follows=20000, alpha=1.2, random_seed=1):
+    """
+    Заполняет БД синтетическими данными пакетными вставками.
+    Авторы постов и подписок распределены по степенному закону
+    с показателем `alpha`: немногие авторы пишут и читаются больше всех.
+    """
+    rng = random.Random(random_seed)
+    now = timezone.now()
+    User.objects.bulk_create(
+        (User(username=f'bench_{number}') for number in range(users)),
+        batch_size=BATCH_SIZE,
+    )
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    popularity = power_law_weights(len(user_ids), alpha)
+    Group.objects.bulk_create(
+        (Group(title=f'Группа {number}', slug=f'bench-{number}',
+               description='Группа для замеров')
+         for number in range(groups)),
+        batch_size=BATCH_SIZE,
+    )
+    group_ids = list(Group.objects.values_list('pk', flat=True)) + [None]
+    with explicit_dates(Post._meta.get_field('pub_date'),
+                        Comment._meta.get_field('created')):
+        authors = rng.choices(user_ids, cum_weights=popularity, k=posts)
+        Post.objects.bulk_create(
+            (Post(text=f'Пост {number}',
+                  author_id=author_id,
+                  group_id=rng.choice(group_ids),
+                  pub_date=now - timedelta(seconds=posts - number))
+             for number, author_id in enumerate(authors)),
+            batch_size=BATCH_SIZE,
+        )
+        post_ids = list(Post.objects.values_list('pk', flat=True))
+        Comment.objects.bulk_create(
+            (Comment(post_id=rng.choice(post_ids),
+                     author_id=rng.choice(user_ids),
+                     text=f'Комментарий {number}',
+                     created=now - timedelta(seconds=comments - number))
+             for number in range(comments)),
+            batch_size=BATCH_SIZE,
+        )
+    pairs = set()
+    while len(pairs) < min(follows, len(user_ids) * (len(user_ids) - 1)):
+        user_id = rng.choice(user_ids)
+        author_id = rng.choices(user_ids, cum_weights=popularity)[0]
+        if user_id != author_id:
+            pairs.add((user_id, author_id))
+    Follow.objects.bulk_create(
+        (Follow(user_id=user_id, author_id=author_id)
+         for user_id, author_id in pairs),
+        batch_size=BATCH_SIZE,
+    )
+    counters.recount_posts()
+    counters.recount_users()
+    timeline.rebuild()
+    search.rebuild()
+
+
+def synthetic_graph(users=100000, edges=1000000, groups=500,
+                    group_posts=50000, alpha=1.2, random_seed=1):
+    """
+    Граф подписок в памяти без БД: `edges` различных подписок
+    на авторов, популярность которых распределена по степенному
+    закону, и `group_posts` пар (автор, группа).
+    """
+    rng = random.Random(random_seed)
+    popularity = power_law_weights(users, alpha)
+    graph = recommendations.Graph()
+    pairs = set()
+    limit = min(edges, users * (users - 1))
+    while len(pairs) < limit:
+        followers = rng.choices(range(1, users + 1), k=limit - len(pairs))
+        authors = rng.choices(range(1, users + 1), cum_weights=popularity,
+                              k=len(followers))
+        pairs.update((user_id, author_id)
+                     for user_id, author_id in zip(followers, authors)
+                     if user_id != author_id)
+    for user_id, author_id in islice(pairs, limit):
+        graph.add_follow(user_id, author_id)
+    group_popularity = power_law_weights(groups, alpha)
+    authors = rng.choices(range(1, users + 1), cum_weights=popularity,
+                          k=group_posts)
+    group_ids = rng.choices(range(1, groups + 1),
+                            cum_weights=group_popularity, k=group_posts)
+    for author_id, group_id in zip(authors, group_ids):
+        graph.add_group_post(author_id, group_id)
+    return graph
+
+
+def measure(queryset, repeat=20):
+    """
+    Возвращает медиану времени выполнения запроса в миллисекундах.
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        list(queryset.all())
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def percentile(values, fraction):
+    """
+    Перцентиль по методу ближайшего ранга.
+    """
+    ordered = sorted(values)
+    index = max(0, math.ceil(fraction * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(timings, queries, elapsed):
+    """
+    Сводка замеров сценария: задержки в миллисекундах,
+    среднее число запросов к БД и пропускная способность.
+    """
+    return {
+        'requests': len(timings),
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'queries_per_request': round(statistics.mean(queries), 2),
+        'requests_per_second': round(len(timings) / elapsed, 1),
+    }
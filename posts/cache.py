@@ -0,0 +1,262 @@
+import random
+import time
+from functools import wraps
+from hashlib import md5
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics, routers
+from .models import Group, Post
+from .tasks import task
+
+
+def make_key(feature, *parts):
+    """
+    Ключ кэша в пространстве имен функции сайта.
+    Общий префикс всех ключей задается в `CACHES['default']['KEY_PREFIX']`.
+    """
+    return ':'.join(str(part) for part in ('posts', feature) + parts)
+
+
+def card_ttl():
+    """
+    Время жизни закэшированной карточки поста.
+    """
+    return getattr(settings, 'POSTS_CARD_CACHE_TTL', 60 * 60 * 24)
+
+
+def _new_version():
+    # Время смены версии: копию, прочитанную с реплики раньше,
+    # чем та догнала запись, нельзя сохранять под новой версией.
+    return f'{time.time():.6f}-{uuid4().hex}'
+
+
+def _version(feature, obj_id):
+    key = make_key(feature, 'version', obj_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        cache.add(key, version, card_ttl())
+        version = cache.get(key, version)
+    return version
+
+
+def _bump(feature, *obj_ids):
+    cache.set_many(
+        {make_key(feature, 'version', obj_id): _new_version()
+         for obj_id in obj_ids},
+        card_ttl(),
+    )
+
+
+def version_ttl(version, ttl=None):
+    """
+    Время жизни фрагмента с версией `version`: 0 (не сохранять),
+    если запрос читает с реплики, а версия сменилась меньше
+    POSTS_REPLICA_MAX_LAG секунд назад.
+    """
+    ttl = card_ttl() if ttl is None else ttl
+    stamp, separator, _ = str(version).partition('-')
+    if not separator or not routers.reads_replica():
+        return ttl
+    try:
+        age = time.time() - float(stamp)
+    except ValueError:
+        return ttl
+    return 0 if age < routers.max_lag() else ttl
+
+
+def card_version(post_id):
+    """
+    Возвращает текущую версию карточки поста.
+    """
+    return _version('card', post_id)
+
+
+def card_versions(*post_ids):
+    """
+    Версии карточек нескольких постов одним чтением кэша.
+    """
+    keys = {make_key('card', 'version', pk): pk for pk in post_ids}
+    found = cache.get_many(list(keys))
+    return [found.get(key) or _version('card', pk)
+            for key, pk in keys.items()]
+
+
+def bump_card(*post_ids):
+    """
+    Делает устаревшими закэшированные карточки постов.
+    """
+    _bump('card', *post_ids)
+
+
+@task
+def bump_group_cards(group_id, chunk_size=1000):
+    """
+    Делает устаревшими карточки всех постов группы
+    после изменения ее названия или адреса.
+    """
+    post_ids = (Post.objects.filter(group_id=group_id)
+                .values_list('pk', flat=True).iterator(chunk_size))
+    chunk = []
+    for post_id in post_ids:
+        chunk.append(post_id)
+        if len(chunk) >= chunk_size:
+            bump_card(*chunk)
+            chunk = []
+    if chunk:
+        bump_card(*chunk)
+    bump_generation('index')
+
+
+def drop_card(post_id):
+    cache.delete_many([make_key('card', 'version', post_id),
+                       make_key('comments', 'version', post_id)])
+
+
+def comments_version(post_id):
+    """
+    Версия закэшированной первой страницы комментариев поста.
+    """
+    return _version('comments', post_id)
+
+
+def bump_comments(post_id):
+    _bump('comments', post_id)
+
+
+def generation(namespace):
+    """
+    Текущее поколение кэша пространства имен.
+    """
+    key = make_key(namespace, 'generation')
+    value = cache.get(key)
+    if value is None:
+        # Начальное значение берется из времени, чтобы после вытеснения
+        # ключа поколение не совпало с поколением старых страниц.
+        cache.add(key, time.time_ns(), None)
+        value = cache.get(key)
+    return value
+
+
+def bump_generation(*namespaces):
+    """
+    Делает устаревшими все страницы пространств имен.
+    """
+    for namespace in namespaces:
+        key = make_key(namespace, 'generation')
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def group_namespace(slug):
+    """
+    Пространство имен кэша страниц и метаданных одной группы.
+    Адрес группы, а не id: по нему страница ищет группу в кэше.
+    """
+    return f'group:{slug}'
+
+
+def group_meta(slug):
+    """
+    Название, описание и число постов группы. Хранятся в кэше
+    до смены поколения группы. Возвращает None, если группы нет.
+    """
+    key = make_key('group', 'meta', slug)
+    # Поколение читается до запросов к БД, чтобы пост, добавленный
+    # во время подсчета, сделал эту копию устаревшей.
+    current = generation(group_namespace(slug))
+    meta = cache.get(key)
+    if meta is not None and meta['generation'] == current:
+        return meta
+    # Копия хранится до следующей смены поколения, поэтому
+    # читается из основной БД, а не с отстающей реплики.
+    with routers.primary_reads():
+        group = (Group.objects.filter(slug=slug)
+                 .values('id', 'title', 'slug', 'description').first())
+        if group is None:
+            return None
+        post_count = Post.objects.filter(group_id=group['id']).count()
+    meta = {
+        **group,
+        'post_count': post_count,
+        'generation': current,
+    }
+    cache.set(key, meta, card_ttl())
+    return meta
+
+
+def bump_groups(*slugs):
+    """
+    Делает устаревшими метаданные и страницы групп.
+    """
+    bump_generation(*(group_namespace(slug) for slug in set(slugs)))
+
+
+def _page_key(namespace, request):
+    user = request.user
+    viewer = user.pk if user.is_authenticated else 'anon'
+    path = md5(request.get_full_path().encode()).hexdigest()
+    return make_key(namespace, 'page', viewer, path)
+
+
+def generation_cache_page(namespace, timeout=None):
+    """
+    Кэширует страницу до смены поколения пространства имен.
+    После смены поколения страницу перестраивает только один процесс,
+    остальные до этого отдают устаревшую копию. Страница для кэша
+    строится по основной БД: реплика может еще не догнать запись,
+    сменившую поколение.
+    `namespace` может быть функцией от аргументов представления;
+    если она возвращает None, страница не кэшируется.
+    `timeout` может быть функцией без аргументов.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            page_namespace = (namespace(request, *args, **kwargs)
+                              if callable(namespace) else namespace)
+            if page_namespace is None:
+                return view(request, *args, **kwargs)
+            page_timeout = timeout() if callable(timeout) else timeout
+            page_timeout = page_timeout or getattr(
+                settings, 'POSTS_PAGE_CACHE_TTL', 60 * 10)
+            lock_timeout = getattr(settings, 'POSTS_PAGE_LOCK_TTL', 30)
+            key = _page_key(page_namespace, request)
+            lock_key = f'{key}:lock'
+            current = generation(page_namespace)
+            entry = cache.get(key)
+            if entry is not None and entry['generation'] == current:
+                metrics.cache_event('hit')
+                return entry['response']
+            locked = cache.add(lock_key, True, lock_timeout)
+            if not locked and entry is not None:
+                metrics.cache_event('stale')
+                response = entry['response']
+                # Собственный ETag устаревшей копии, чтобы условный GET
+                # не пометил ее ETag текущего поколения.
+                response['ETag'] = f'W/"stale-{entry["generation"]}"'
+                return response
+            metrics.cache_event('miss')
+            try:
+                with routers.primary_reads():
+                    response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming:
+                    # Разброс времени жизни, чтобы копии страниц
+                    # не истекали одновременно.
+                    jitter = random.uniform(0.9, 1.1)
+                    cache.set(key,
+                              {'generation': current, 'response': response},
+                              int(page_timeout * jitter))
+            finally:
+                if locked:
+                    cache.delete(lock_key)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,56 @@
+import threading
+
+from django.core.cache.backends.filebased import (
+    FileBasedCache as BaseFileBasedCache,
+)
+from django.core.cache.backends.locmem import LocMemCache as BaseLocMemCache
+
+from . import metrics
+
+try:
+    from django_redis.cache import RedisCache as BaseRedisCache
+except ImportError:
+    BaseRedisCache = None
+
+_MISSING = object()
+_local = threading.local()
+
+
+class MetricsCacheMixin:
+    """
+    Учитывает каждое чтение кэша в метриках запроса: попадание
+    или промах по имени кэша из `metrics.cache_name`. Так считаются
+    фрагменты шаблонов, версии карточек и подписки, а не только
+    страницы целиком.
+    """
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        # get_many базового класса читает ключи через get.
+        if not getattr(_local, 'in_get_many', False):
+            metrics.cache_read(key, value is not _MISSING)
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        _local.in_get_many = True
+        try:
+            values = super().get_many(keys, version)
+        finally:
+            _local.in_get_many = False
+        for key in keys:
+            metrics.cache_read(key, key in values)
+        return values
+
+
+class LocMemCache(MetricsCacheMixin, BaseLocMemCache):
+    pass
+
+
+class FileBasedCache(MetricsCacheMixin, BaseFileBasedCache):
+    pass
+
+
+if BaseRedisCache is not None:
+    class RedisCache(MetricsCacheMixin, BaseRedisCache):
+        pass
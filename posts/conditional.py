@@ -0,0 +1,123 @@
+from functools import wraps
+from hashlib import md5
+
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from . import cache, feeds, follow_graph
+from .models import UserStats
+from .paginators import paginate
+
+
+def _etag(request, *parts):
+    """
+    ETag из версий данных страницы, зрителя и адреса:
+    страницы отличаются для разных пользователей.
+    """
+    user = request.user
+    viewer = user.pk if user.is_authenticated else 'anon'
+    raw = ':'.join(str(part) for part in
+                   parts + (viewer, request.get_full_path()))
+    return md5(raw.encode()).hexdigest()
+
+
+def author_stats(request, username):
+    """
+    Счетчики автора страницы. Запоминаются в запросе, чтобы
+    представление не читало их второй раз после проверки ETag.
+    """
+    stats = getattr(request, '_author_stats', None)
+    if stats is None or stats.user.username != username:
+        stats = (UserStats.objects.select_related('user')
+                 .filter(user__username=username).first())
+        request._author_stats = stats
+    return stats
+
+
+def author_page(request, stats):
+    """
+    Страница id постов автора. Запоминается в запросе: ETag профиля
+    строится по ней, а представление выбирает по ней сами посты.
+    """
+    cached = getattr(request, '_author_page', None)
+    if cached is None or cached[0] != stats.user_id:
+        post_ids = (feeds.profile_feed(stats.user_id)
+                    .values_list('pk', flat=True))
+        paginator, page = paginate(request, post_ids,
+                                   count=stats.posts_count)
+        cached = request._author_page = (stats.user_id, paginator, page)
+    return cached[1:]
+
+
+def _stats(request, username):
+    stats = author_stats(request, username)
+    if stats is None:
+        return None
+    return stats.posts_count, stats.followers_count, stats.following_count
+
+
+def feed_etag(request, *args, **kwargs):
+    """
+    Ленты меняются вместе с поколением кэша 'index': его сдвигают
+    любые изменения постов, комментариев и групп.
+    """
+    return _etag(request, 'feed', cache.generation('index'))
+
+
+def group_etag(request, slug):
+    """
+    Страница группы меняется только вместе с поколением группы.
+    """
+    meta = cache.group_meta(slug)
+    if meta is None:
+        return None
+    return _etag(request, 'group', meta['generation'])
+
+
+def profile_etag(request, username):
+    """
+    Профиль зависит только от данных автора: счетчиков, постов
+    открытой страницы и их карточек, а также от подписки зрителя
+    и, на своей странице, от рекомендаций. Общее поколение 'index'
+    сдвигает любой пост сайта, поэтому оно в ETag не входит.
+    """
+    stats = author_stats(request, username)
+    if stats is None:
+        return None
+    author_id = stats.user_id
+    _, page = author_page(request, stats)
+    post_ids = list(page)
+    user = request.user
+    following = (user.is_authenticated
+                 and follow_graph.is_following(user.pk, author_id))
+    recommendations = (cache.generation('recommendations')
+                       if user.pk == author_id else None)
+    return _etag(request, 'profile', *_stats(request, username),
+                 following, recommendations, *post_ids,
+                 *cache.card_versions(*post_ids))
+
+
+def post_etag(request, username, post_id):
+    stats = _stats(request, username)
+    if stats is None:
+        return None
+    return _etag(request, 'post', cache.card_version(post_id),
+                 cache.comments_version(post_id), *stats)
+
+
+def conditional(etag_func):
+    """
+    Условный GET: при совпадении If-None-Match представление
+    не вызывается и возвращается 304 Not Modified.
+    Браузер обязан перепроверять страницу при каждом показе.
+    """
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,66 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def bump_post_comments(post_id, delta):
+    """
+    Изменяет счетчик комментариев поста.
+    """
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(comment_count__gte=-delta)
+    posts.update(comment_count=F('comment_count') + delta)
+
+
+def bump_user(user_id, **deltas):
+    """
+    Изменяет счетчики пользователя.
+    Отсутствующая строка не создается: ее пересчитает
+    `UserStats.objects.for_user` при первом чтении.
+    """
+    stats = UserStats.objects.filter(user_id=user_id)
+    updates = {}
+    for field, delta in deltas.items():
+        if delta < 0:
+            stats = stats.filter(**{f'{field}__gte': -delta})
+        updates[field] = F(field) + delta
+    stats.update(**updates)
+
+
+def _count_subquery(queryset, field):
+    counts = (queryset.filter(**{field: OuterRef('pk')})
+              .order_by()
+              .values(field)
+              .annotate(total=Count('pk'))
+              .values('total'))
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def recount_posts():
+    """
+    Пересчитывает счетчики комментариев всех постов одним запросом.
+    """
+    return Post.objects.update(
+        comment_count=_count_subquery(Comment.objects.all(), 'post'),
+    )
+
+
+def recount_users():
+    """
+    Создает недостающие строки статистики и пересчитывает
+    счетчики всех пользователей.
+    """
+    existing = UserStats.objects.values('user_id')
+    missing = User.objects.exclude(pk__in=existing).values_list('pk',
+                                                                 flat=True)
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=pk) for pk in missing.iterator()),
+        batch_size=500,
+    )
+    return UserStats.objects.update(
+        posts_count=_count_subquery(Post.objects.all(), 'author'),
+        followers_count=_count_subquery(Follow.objects.all(), 'author'),
+        following_count=_count_subquery(Follow.objects.all(), 'user'),
+    )
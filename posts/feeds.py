@@ -0,0 +1,58 @@
+from django.db.models import F
+
+from . import timeline
+from .models import Post
+
+
+def post_feed():
+    """
+    Базовый запрос ленты: автор и группа подтягиваются одним JOIN,
+    количество комментариев хранится в `Post.comment_count`.
+    """
+    return Post.objects.select_related('author', 'group')
+
+
+def index_feed():
+    """
+    Лента главной страницы.
+    """
+    return post_feed()
+
+
+def group_feed(group):
+    """
+    Лента постов группы.
+    """
+    return post_feed().filter(group=group)
+
+
+def profile_feed(author):
+    """
+    Лента постов автора.
+    """
+    return post_feed().filter(author=author)
+
+
+def follow_feed(user):
+    """
+    Лента постов авторов, на которых подписан пользователь.
+    """
+    return timeline.follow_posts(post_feed(), user)
+
+
+def trending_feed():
+    """
+    Посты по убыванию популярности: обход индекса оценок
+    и соединение с постами по первичному ключу. Оценка выбирается
+    аннотацией, чтобы по ней же шел курсор `?after=`.
+    """
+    return (post_feed().filter(trend__isnull=False)
+            .annotate(trend_score=F('trend__score'))
+            .order_by('-trend_score', '-pk'))
+
+
+def comment_feed(post):
+    """
+    Комментарии поста вместе с авторами.
+    """
+    return post.comments.select_related('author')
@@ -0,0 +1,169 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseNotModified, StreamingHttpResponse)
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags
+from django.views.static import was_modified_since
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Имена, в которые ManifestStaticFilesStorage добавила хэш содержимого.
+HASHED_RE = re.compile(r'\.[0-9a-f]{12}\.')
+# Готовые сжатые копии в порядке предпочтения.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+CHUNK_SIZE = 64 * 1024
+
+
+def offload():
+    """
+    Способ отдачи файлов веб-сервером: None (отдает Django),
+    'x-accel-redirect' (nginx) или 'x-sendfile' (Apache, lighttpd).
+    """
+    return getattr(settings, 'POSTS_FILE_OFFLOAD', None)
+
+
+def max_age(location, path):
+    if location == 'static' and HASHED_RE.search(path):
+        return 60 * 60 * 24 * 365
+    if location == 'static':
+        return getattr(settings, 'POSTS_STATIC_MAX_AGE', 60 * 60)
+    return getattr(settings, 'POSTS_MEDIA_MAX_AGE', 60 * 60 * 24)
+
+
+def _cache_headers(response, location, path):
+    age = max_age(location, path)
+    value = f'public, max-age={age}'
+    if location == 'static' and HASHED_RE.search(path):
+        # Файл с хэшем в имени никогда не меняется.
+        value += ', immutable'
+    response['Cache-Control'] = value
+    return response
+
+
+def _offloaded(location, path, full_path, content_type):
+    response = HttpResponse(content_type=content_type)
+    if offload() == 'x-sendfile':
+        response['X-Sendfile'] = full_path
+    else:
+        locations = getattr(settings, 'POSTS_ACCEL_REDIRECT_LOCATIONS', {})
+        prefix = locations.get(location, f'/_protected/{location}/')
+        response['X-Accel-Redirect'] = prefix + quote(path)
+    return response
+
+
+def _parse_range(header, size):
+    """
+    Разбирает заголовок Range с одним диапазоном байтов.
+    Возвращает (начало, конец) включительно, None для заголовка,
+    который нужно проигнорировать, или False для недостижимого
+    диапазона.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Последние `last` байтов файла.
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as source:
+        source.seek(start)
+        while length > 0:
+            chunk = source.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _precompressed(request, full_path):
+    accepted = {
+        part.split(';')[0].strip()
+        for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(',')
+    }
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.isfile(full_path + suffix):
+            return encoding, full_path + suffix
+    return None, full_path
+
+
+def serve(request, path, document_root, location='media'):
+    """
+    Отдает статику или загруженный файл: передает отдачу веб-серверу
+    (X-Accel-Redirect, X-Sendfile), а без него отдает файл сам
+    с заголовками кэширования, условным GET, диапазонами байтов
+    и заранее сжатыми копиями статики.
+    """
+    try:
+        full_path = safe_join(document_root, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    content_type = (mimetypes.guess_type(full_path)[0]
+                    or 'application/octet-stream')
+    if offload():
+        response = _offloaded(location, path, full_path, content_type)
+        return _cache_headers(response, location, path)
+
+    stat = os.stat(full_path)
+    last_modified = http_date(stat.st_mtime)
+    encoding, file_path = None, full_path
+    if location == 'static' and 'HTTP_RANGE' not in request.META:
+        encoding, file_path = _precompressed(request, full_path)
+    # Сжатая копия - другое представление файла со своим ETag.
+    etag = (f'"{stat.st_mtime_ns:x}-{stat.st_size:x}'
+            f'{"-" + encoding if encoding else ""}"')
+    if 'HTTP_IF_NONE_MATCH' in request.META:
+        not_modified = etag in parse_etags(request.META['HTTP_IF_NONE_MATCH'])
+    else:
+        not_modified = not was_modified_since(
+            request.META.get('HTTP_IF_MODIFIED_SINCE'),
+            stat.st_mtime, stat.st_size)
+    if not_modified:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return _cache_headers(response, location, path)
+
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and request.META.get(
+            'HTTP_IF_RANGE', etag) in (etag, last_modified):
+        byte_range = _parse_range(request.META['HTTP_RANGE'], stat.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+    elif byte_range is not None:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _read_range(full_path, start, length), status=206,
+            content_type=content_type)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    else:
+        response = FileResponse(open(file_path, 'rb'),
+                                content_type=content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if location == 'static':
+            patch_vary_headers(response, ('Accept-Encoding',))
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = last_modified
+    response['ETag'] = etag
+    return _cache_headers(response, location, path)
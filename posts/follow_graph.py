@@ -0,0 +1,144 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import cache as posts_cache
+from .models import Follow
+
+FOLLOWEES = 'followees'
+FOLLOWERS = 'followers'
+# Поле Follow с id пользователя, чье множество хранится,
+# и поле со значениями множества.
+FIELDS = {
+    FOLLOWEES: ('user_id', 'author_id'),
+    FOLLOWERS: ('author_id', 'user_id'),
+}
+
+
+def cache_ttl():
+    return getattr(settings, 'POSTS_FOLLOW_CACHE_TTL', 60 * 60 * 24)
+
+
+def max_cached():
+    """
+    Множества больше этого размера не кэшируются: подписчиков
+    популярного автора дешевле проверить запросом по индексу.
+    """
+    return getattr(settings, 'POSTS_FOLLOW_CACHE_MAX', 10000)
+
+
+def _version_key(kind, user_id):
+    return posts_cache.make_key('follow', 'version', kind, user_id)
+
+
+def _key(kind, user_id):
+    """
+    Ключ множества с версией пользователя: подписка меняет версию,
+    и множество, прочитанное из БД до нее, сохраняется под старым
+    ключом, который уже никто не читает.
+    """
+    version_key = _version_key(kind, user_id)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, uuid4().hex, cache_ttl())
+        version = cache.get(version_key)
+    return posts_cache.make_key('follow', posts_cache.generation('follow'),
+                                kind, user_id, version)
+
+
+def _load(kind, user_id):
+    """
+    Множество id из кэша или БД. None, если множество
+    слишком велико для кэша.
+    """
+    # Ключ вычисляется до запроса к БД.
+    key = _key(kind, user_id)
+    ids = cache.get(key)
+    if ids is not None:
+        return ids
+    owner, value = FIELDS[kind]
+    rows = (Follow.objects.filter(**{owner: user_id})
+            .values_list(value, flat=True)[:max_cached() + 1])
+    ids = frozenset(rows)
+    if len(ids) > max_cached():
+        return None
+    cache.set(key, ids, cache_ttl())
+    return ids
+
+
+def _members(kind, user_id):
+    ids = _load(kind, user_id)
+    if ids is None:
+        owner, value = FIELDS[kind]
+        ids = frozenset(Follow.objects.filter(**{owner: user_id})
+                        .values_list(value, flat=True))
+    return ids
+
+
+def followees(user_id):
+    """
+    id авторов, на которых подписан пользователь.
+    """
+    return _members(FOLLOWEES, user_id)
+
+
+def followers(user_id):
+    """
+    id подписчиков автора.
+    """
+    return _members(FOLLOWERS, user_id)
+
+
+def is_following(user_id, author_id):
+    """
+    Подписан ли пользователь на автора.
+    """
+    ids = _load(FOLLOWEES, user_id)
+    if ids is not None:
+        return author_id in ids
+    return Follow.objects.filter(user_id=user_id,
+                                 author_id=author_id).exists()
+
+
+def following_many(user_id, author_ids):
+    """
+    Из списка авторов выбирает тех, на кого подписан пользователь:
+    для кнопок подписки в списках пользователей.
+    """
+    author_ids = set(author_ids)
+    ids = _load(FOLLOWEES, user_id)
+    if ids is not None:
+        return author_ids & ids
+    return set(Follow.objects.filter(user_id=user_id,
+                                     author_id__in=author_ids)
+               .values_list('author_id', flat=True))
+
+
+def _invalidate(user_id, author_id):
+    # Множества не дописываются на месте: два одновременных
+    # изменения потеряли бы одно из них. Новая версия заставляет
+    # следующее чтение собрать множество из БД.
+    cache.set_many({
+        _version_key(FOLLOWEES, user_id): uuid4().hex,
+        _version_key(FOLLOWERS, author_id): uuid4().hex,
+    }, cache_ttl())
+
+
+def followed(user_id, author_id):
+    """
+    Делает устаревшими закэшированные множества после подписки.
+    """
+    _invalidate(user_id, author_id)
+
+
+def unfollowed(user_id, author_id):
+    _invalidate(user_id, author_id)
+
+
+def reset():
+    """
+    Делает устаревшими все множества, например после массовой
+    загрузки подписок без сигналов.
+    """
+    posts_cache.bump_generation('follow')
@@ -1,5 +1,6 @@
 from django import forms
 
+from . import uploads
 from .models import Comment, Post
 
 
@@ -16,6 +17,19 @@ class PostForm(forms.ModelForm):
             'text': 'Введите текст записи',
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if not image or 'image' not in self.changed_data:
+            return image
+        width, height = image.image.size
+        if width * height > uploads.max_pixels():
+            raise forms.ValidationError(
+                'Слишком большое разрешение изображения: '
+                '%(width)sx%(height)s.',
+                params={'width': width, 'height': height},
+            )
+        return uploads.normalize_image(image)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,88 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import benchmark, recommendations
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = ('Замер расчета рекомендаций на синтетическом графе '
+            'подписок: построение графа, время на пользователя '
+            'и полный пересчет.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--edges', type=int, default=1000000)
+        parser.add_argument('--groups', type=int, default=500)
+        parser.add_argument('--group-posts', type=int, default=50000)
+        parser.add_argument('--alpha', type=float, default=1.2,
+                            help='Показатель степенного закона '
+                                 'популярности авторов и групп.')
+        parser.add_argument('--sample', type=int, default=0,
+                            help='Считать только для случайных N '
+                                 'пользователей (0 - для всех).')
+        parser.add_argument('--database', action='store_true',
+                            help='Также записать результат во временную '
+                                 'БД командой compute().')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', dest='json_path',
+                            help='Сохранить результаты в JSON-файл.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        graph = benchmark.synthetic_graph(
+            options['users'], options['edges'], options['groups'],
+            options['group_posts'], options['alpha'], options['seed'])
+        built = time.perf_counter() - started
+        users = graph.users()
+        if options['sample']:
+            users = random.Random(options['seed']).sample(
+                users, min(options['sample'], len(users)))
+
+        timings = []
+        suggestions = 0
+        started = time.perf_counter()
+        for user_id in users:
+            user_started = time.perf_counter()
+            suggestions += len(recommendations.suggest(graph, user_id))
+            timings.append((time.perf_counter() - user_started) * 1000)
+        elapsed = time.perf_counter() - started
+        edges = sum(len(followees) for followees in graph.followees.values())
+        report = {
+            'users': options['users'],
+            'edges': edges,
+            'group_posts': options['group_posts'],
+            'graph_build_s': round(built, 3),
+            'scored_users': len(users),
+            'suggestions': suggestions,
+            'compute_s': round(elapsed, 3),
+            'p50_ms': round(benchmark.percentile(timings, 0.50), 3),
+            'p95_ms': round(benchmark.percentile(timings, 0.95), 3),
+            'p99_ms': round(benchmark.percentile(timings, 0.99), 3),
+            'users_per_second': round(len(users) / elapsed, 1),
+        }
+        if options['database']:
+            report['database_s'] = self.store(graph)
+
+        for name, value in report.items():
+            self.stdout.write(f'{name:>16}: {value}')
+        if options['json_path']:
+            with open(options['json_path'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+    def store(self, graph):
+        """
+        Полный пересчет с записью во временную БД.
+        """
+        with benchmark.scratch_database():
+            User.objects.bulk_create(
+                (User(pk=user_id, username=f'bench_{user_id}')
+                 for user_id in graph.users()),
+                batch_size=benchmark.BATCH_SIZE,
+            )
+            started = time.perf_counter()
+            recommendations.compute(graph)
+            return round(time.perf_counter() - started, 3)
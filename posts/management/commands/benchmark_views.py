@@ -0,0 +1,237 @@
+import json
+import platform
+import subprocess
+import time
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext,
+                               setup_test_environment,
+                               teardown_test_environment)
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import benchmark
+from posts.models import Group, Post, User
+
+HARNESSES = ('client', 'wsgi')
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный замер представлений posts на синтетических данных: '
+            'задержки p50/p95/p99, запросы к БД и запросы в секунду.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=40000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--alpha', type=float, default=1.2,
+                            help='Показатель степенного закона '
+                                 'популярности авторов.')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Запросов на каждый сценарий.')
+        parser.add_argument('--harness', choices=HARNESSES + ('both',),
+                            default='both')
+        parser.add_argument('--scenario', action='append',
+                            help='Запустить только указанные сценарии.')
+        parser.add_argument('--json', dest='json_path',
+                            help='Сохранить результаты в JSON-файл.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--database-file',
+                            help='Файл временной БД SQLite вместо БД в '
+                                 'памяти: нужен для сравнения настроек '
+                                 'соединений.')
+        parser.add_argument('--baseline',
+                            help='JSON предыдущего замера для сравнения.')
+
+    def fixtures(self):
+        reader = (User.objects.annotate(total=Count('follower'))
+                  .order_by('-total').first())
+        author = (User.objects.annotate(total=Count('posts'))
+                  .order_by('-total').first())
+        group = (Group.objects.annotate(total=Count('posts'))
+                 .order_by('-total').first())
+        post = Post.objects.order_by('-comment_count').first()
+        return reader, author, group, post
+
+    def scenarios(self, reader, author, group, post):
+        """
+        Сценарии: имя, метод, функция адреса, функция данных, читатель.
+        """
+        post_url = reverse('post', args=[post.author.username, post.pk])
+        comment_url = reverse('add_comment',
+                              args=[post.author.username, post.pk])
+        return (
+            ('index', 'GET',
+             lambda i: reverse('index') + f'?page={i % 20 + 1}', None, None),
+            ('group_posts', 'GET',
+             lambda i: reverse('group', args=[group.slug]), None, None),
+            ('profile', 'GET',
+             lambda i: reverse('profile', args=[author.username]),
+             None, None),
+            ('post_view', 'GET', lambda i: post_url, None, None),
+            ('follow_index', 'GET',
+             lambda i: reverse('follow_index'), None, reader),
+            ('new_post', 'POST', lambda i: reverse('new_post'),
+             lambda i: {'text': f'Пост для замера {i}'}, reader),
+            ('add_comment', 'POST', lambda i: comment_url,
+             lambda i: {'text': f'Комментарий для замера {i}'}, reader),
+        )
+
+    def run_client(self, method, path, data, user, count):
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        timings, queries = [], []
+        started = time.perf_counter()
+        for number in range(count):
+            with CaptureQueriesContext(connection) as captured:
+                request_started = time.perf_counter()
+                if method == 'GET':
+                    client.get(path(number))
+                else:
+                    client.post(path(number), data(number))
+                timings.append((time.perf_counter() - request_started)
+                               * 1000)
+            queries.append(len(captured))
+        return timings, queries, time.perf_counter() - started
+
+    def run_wsgi(self, method, path, data, user, count):
+        application = get_wsgi_application()
+        cookie = ''
+        if user is not None:
+            client = Client()
+            client.force_login(user)
+            session = client.cookies[settings.SESSION_COOKIE_NAME].value
+            cookie = f'{settings.SESSION_COOKIE_NAME}={session}'
+        timings, queries = [], []
+        started = time.perf_counter()
+        for number in range(count):
+            url, _, query = path(number).partition('?')
+            environ = {
+                'PATH_INFO': url,
+                'QUERY_STRING': query,
+                'HTTP_HOST': 'testserver',
+                'HTTP_COOKIE': cookie,
+                'wsgi.input': BytesIO(),
+            }
+            setup_testing_defaults(environ)
+            with CaptureQueriesContext(connection) as captured:
+                request_started = time.perf_counter()
+                response = application(environ, lambda *args: None)
+                try:
+                    for _ in response:
+                        pass
+                finally:
+                    response.close()
+                timings.append((time.perf_counter() - request_started)
+                               * 1000)
+            queries.append(len(captured))
+        return timings, queries, time.perf_counter() - started
+
+    def git_revision(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL, check=True,
+            ).stdout.decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def compare(self, results, path):
+        """
+        Печатает изменение задержки и пропускной способности
+        относительно предыдущего замера.
+        """
+        with open(path) as source:
+            baseline = json.load(source)
+        self.stdout.write(f'Сравнение с {path} '
+                          f'({baseline.get("settings")}):')
+        for harness, scenarios in results.items():
+            for name, summary in scenarios.items():
+                before = baseline['results'].get(harness, {}).get(name)
+                if not before:
+                    continue
+                latency = summary['p50_ms'] / before['p50_ms']
+                throughput = (summary['requests_per_second']
+                              / before['requests_per_second'])
+                self.stdout.write(f'{harness:6} {name:13} '
+                                  f'p50 {latency:6.2f}x  '
+                                  f'rps {throughput:6.2f}x')
+
+    def handle(self, *args, **options):
+        harnesses = (HARNESSES if options['harness'] == 'both'
+                     else (options['harness'],))
+        results = {harness: {} for harness in harnesses}
+        # Как при запуске тестов: DEBUG выключен, debug toolbar не
+        # подключается и не искажает замеры.
+        setup_test_environment(debug=False)
+        try:
+            with benchmark.scratch_database(name=options['database_file']):
+                self.stderr.write('Заполнение БД...')
+                benchmark.seed(
+                    users=options['users'],
+                    groups=options['groups'],
+                    posts=options['posts'],
+                    comments=options['comments'],
+                    follows=options['follows'],
+                    alpha=options['alpha'],
+                    random_seed=options['seed'],
+                )
+                scenarios = self.scenarios(*self.fixtures())
+                for harness in harnesses:
+                    runner = getattr(self, f'run_{harness}')
+                    for name, method, path, data, user in scenarios:
+                        if (options['scenario']
+                                and name not in options['scenario']):
+                            continue
+                        # Через WSGI замеряются только GET-запросы:
+                        # для POST нужен CSRF-токен формы.
+                        if harness == 'wsgi' and method != 'GET':
+                            continue
+                        cache.clear()
+                        timings, queries, elapsed = runner(
+                            method, path, data, user, options['requests'])
+                        summary = benchmark.summarize(timings, queries,
+                                                      elapsed)
+                        results[harness][name] = summary
+                        self.stdout.write(
+                            f'{harness:6} {name:13} '
+                            f'p50 {summary["p50_ms"]:8.2f} мс  '
+                            f'p95 {summary["p95_ms"]:8.2f} мс  '
+                            f'p99 {summary["p99_ms"]:8.2f} мс  '
+                            f'SQL {summary["queries_per_request"]:6.1f}  '
+                            f'{summary["requests_per_second"]:8.1f} rps'
+                        )
+        finally:
+            teardown_test_environment()
+        if options['baseline']:
+            self.compare(results, options['baseline'])
+        if options['json_path']:
+            report = {
+                'revision': self.git_revision(),
+                'created': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'settings': settings.SETTINGS_MODULE,
+                'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+                'database_file': options['database_file'],
+                'dataset': {key: options[key] for key in (
+                    'users', 'groups', 'posts', 'comments', 'follows',
+                    'alpha', 'seed')},
+                'requests': options['requests'],
+                'results': results,
+            }
+            with open(options['json_path'], 'w') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
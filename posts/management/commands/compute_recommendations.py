@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import recommendations
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает предложения "кого почитать" по графу '
+            'подписок и общим группам.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        graph = recommendations.Graph.load()
+        self.stderr.write(
+            f'Граф загружен за {time.monotonic() - started:.1f} с')
+
+        def on_batch(done, total):
+            self.stderr.write(f'Пользователей: {done} из {total}')
+
+        total = recommendations.compute(graph, options['batch_size'],
+                                        on_batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Рекомендаций: {total} за '
+            f'{time.monotonic() - started:.1f} с.'
+        ))
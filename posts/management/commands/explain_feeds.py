@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+
+from posts import benchmark, feeds
+from posts.models import Comment, Follow, Group, Post, TimelineEntry, User
+from posts.paginators import POSTS_PER_PAGE
+
+FEED_INDEXES = (
+    (Post, 'post_pub_date'),
+    (Post, 'post_author_pub_date'),
+    (Post, 'post_group_pub_date_id'),
+    (Comment, 'comment_post_created'),
+    (TimelineEntry, 'timeline_user_pub_date_post'),
+)
+
+
+class Command(BaseCommand):
+    help = ('Заполняет временную БД синтетическими данными и выводит '
+            'планы EXPLAIN и время запросов лент с индексами и без них.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=50000)
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def feed_queries(self):
+        reader = (User.objects.annotate(total=Count('follower'))
+                  .order_by('-total').first())
+        author = (User.objects.annotate(total=Count('posts'))
+                  .order_by('-total').first())
+        group = Group.objects.first()
+        post = Post.objects.order_by('-comment_count').first()
+        follow = Follow.objects.first()
+        page = slice(0, POSTS_PER_PAGE)
+        return (
+            ('index', feeds.index_feed()[page]),
+            ('group_posts', feeds.group_feed(group)[page]),
+            ('profile', feeds.profile_feed(author)[page]),
+            ('follow_index', feeds.follow_feed(reader)[page]),
+            ('trending', feeds.trending_feed()[page]),
+            ('post_view comments',
+             post.comments.select_related('author')[page]),
+            ('profile_follow',
+             Follow.objects.filter(user_id=follow.user_id,
+                                   author_id=follow.author_id)),
+        )
+
+    def report(self, title, queries, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for name, queryset in queries:
+            timing = benchmark.measure(queryset, repeat)
+            self.stdout.write(f'{name}: {timing:.3f} мс')
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f'    {line}')
+
+    def drop_indexes(self):
+        with connection.schema_editor() as editor:
+            for model, name in FEED_INDEXES:
+                index = next(index for index in model._meta.indexes
+                             if index.name == name)
+                editor.remove_index(model, index)
+
+    def handle(self, *args, **options):
+        with benchmark.scratch_database():
+            self.stdout.write('Заполнение БД...')
+            benchmark.seed(
+                users=options['users'],
+                groups=options['groups'],
+                posts=options['posts'],
+                comments=options['comments'],
+                follows=options['follows'],
+            )
+            queries = self.feed_queries()
+            self.report('С индексами', queries, options['repeat'])
+            self.drop_indexes()
+            self.report('Без индексов', queries, options['repeat'])
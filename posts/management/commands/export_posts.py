@@ -0,0 +1,47 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ('Выгружает группы, пользователей, посты, комментарии '
+            'и подписки в NDJSON или CSV. Пользователи выгружаются '
+            'с хэшами паролей и правами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('output',
+                            help='Файл NDJSON ("-" - стандартный вывод) '
+                                 'или каталог для CSV.')
+        parser.add_argument('--format', choices=('ndjson', 'csv'),
+                            default='ndjson')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--anonymize-users', action='store_true',
+                            help='Не выгружать хэши паролей и права '
+                                 'персонала: после загрузки вход по '
+                                 'паролю закрыт.')
+
+    def progress(self, kind, count):
+        self.stderr.write(f'{kind}: выгружено {count}')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        output = options['output']
+        anonymize = options['anonymize_users']
+        # Одна транзакция - согласованный снимок данных.
+        with transaction.atomic():
+            if options['format'] == 'csv':
+                transfer.write_csv(output, chunk_size, self.progress,
+                                   anonymize)
+            elif output == '-':
+                transfer.write_ndjson(sys.stdout, chunk_size, self.progress,
+                                      anonymize)
+            else:
+                with open(output, 'w', encoding='utf-8') as stream:
+                    transfer.write_ndjson(stream, chunk_size, self.progress,
+                                          anonymize)
+        if output != '-':
+            self.stderr.write(self.style.SUCCESS(
+                f'Данные выгружены в {output}.'))
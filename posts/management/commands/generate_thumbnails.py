@@ -0,0 +1,54 @@
+import multiprocessing
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+def _init_worker():
+    django.setup()
+
+
+def _generate(args):
+    post_id, force = args
+    try:
+        return thumbnails.generate(post_id, force=force)
+    except Exception:
+        thumbnails.logger.exception(
+            'Не удалось создать миниатюры поста %s', post_id)
+        return 0
+
+
+class Command(BaseCommand):
+    help = 'Создает миниатюры всех размеров для изображений постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            default=multiprocessing.cpu_count())
+        parser.add_argument('--chunk-size', type=int, default=50)
+        parser.add_argument('--force', action='store_true',
+                            help='Пересоздать уже существующие миниатюры.')
+
+    def handle(self, *args, **options):
+        post_ids = list(
+            Post.objects.exclude(image='').exclude(image__isnull=True)
+            .values_list('pk', flat=True)
+        )
+        # Дочерние процессы открывают собственные соединения с БД.
+        connections.close_all()
+        jobs = ((post_id, options['force']) for post_id in post_ids)
+        created = 0
+        with multiprocessing.Pool(options['processes'],
+                                  initializer=_init_worker) as pool:
+            for number, count in enumerate(
+                    pool.imap_unordered(_generate, jobs,
+                                        options['chunk_size']), 1):
+                created += count
+                if number % 1000 == 0:
+                    self.stdout.write(f'Обработано постов: {number}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Постов: {len(post_ids)}, миниатюр: {created}.'
+        ))
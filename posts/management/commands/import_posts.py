@@ -0,0 +1,62 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ('Загружает выгрузку export_posts пачками. После сбоя '
+            'загрузка продолжается с последней сохраненной пачки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('source',
+                            help='Файл NDJSON или каталог с CSV.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--checkpoint',
+                            help='Файл контрольной точки '
+                                 '(по умолчанию <source>.checkpoint).')
+        parser.add_argument('--restart', action='store_true',
+                            help='Начать заново, игнорируя контрольную '
+                                 'точку.')
+        parser.add_argument('--skip-rebuild', action='store_true',
+                            help='Не пересчитывать счетчики, ленты и '
+                                 'поисковый индекс после загрузки.')
+
+    def handle(self, *args, **options):
+        source = options['source']
+        checkpoint = (options['checkpoint']
+                      or source.rstrip(os.sep) + '.checkpoint')
+        position = None
+        if os.path.exists(checkpoint) and not options['restart']:
+            with open(checkpoint) as stream:
+                position = json.load(stream)
+            self.stderr.write(f'Продолжение с {position}')
+        if os.path.isdir(source):
+            records = transfer.read_csv(source, position)
+        else:
+            records = transfer.read_ndjson(source, position)
+        started = time.monotonic()
+
+        def on_batch(kind, count, next_position):
+            # Контрольная точка пишется атомарно после фиксации пачки.
+            with open(f'{checkpoint}.tmp', 'w') as stream:
+                json.dump(next_position, stream)
+            os.replace(f'{checkpoint}.tmp', checkpoint)
+            rate = count / max(time.monotonic() - started, 1e-6)
+            self.stderr.write(f'{kind}: загружено {count} '
+                              f'({rate:.0f} записей/с)')
+
+        try:
+            total = transfer.import_records(
+                records, options['batch_size'], on_batch)
+        except transfer.TransferError as error:
+            raise CommandError(error)
+        if not options['skip_rebuild']:
+            self.stderr.write('Пересчет счетчиков, лент и индекса...')
+            transfer.finish_import()
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(f'Загружено записей: {total}.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = 'Удаляет угасшие оценки популярности постов и групп.'
+
+    def handle(self, *args, **options):
+        deleted = trending.prune()
+        self.stdout.write(self.style.SUCCESS(f'Удалено записей: {deleted}.'))
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает оценки популярных постов и групп '
+            'по событиям последних дней.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7)
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        posts, groups = trending.rebuild(since)
+        self.stdout.write(self.style.SUCCESS(
+            f'Постов: {posts}, групп: {groups}.'
+        ))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from posts import tasks
+
+
+class Command(BaseCommand):
+    help = ('Выполняет фоновые задачи из очереди БД '
+            '(POSTS_TASKS_BACKEND = "db").')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Выполнить готовые задачи и завершиться.')
+        parser.add_argument('--batch', type=int, default=100,
+                            help='Сколько задач брать за один проход.')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Пауза в секундах при пустой очереди.')
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                close_old_connections()
+                processed = tasks.run_pending(options['batch'])
+                total += processed
+                if options['once'] and processed < options['batch']:
+                    break
+                if not processed:
+                    time.sleep(options['poll'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(
+            f'Выполнено задач: {total}.'
+        ))
@@ -0,0 +1,310 @@
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+
+# Границы корзин гистограмм: время в секундах и число SQL-запросов.
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+# Сколько запросов SQL хранится для образца медленного запроса.
+MAX_SAMPLED_QUERIES = 100
+MAX_SQL_LENGTH = 1000
+# Части ключей make_key, которые входят в имя кэша в метриках;
+# остальные части (id, slug, хэши) не попадают в метки.
+CACHE_KEY_KINDS = ('version', 'generation', 'page', 'meta')
+FRAGMENT_PREFIX = 'template.cache.'
+
+_local = threading.local()
+
+
+def slow_threshold():
+    """
+    Порог в миллисекундах, после которого запрос считается медленным.
+    """
+    return getattr(settings, 'POSTS_METRICS_SLOW_MS', 500)
+
+
+def slow_samples():
+    return getattr(settings, 'POSTS_METRICS_SLOW_SAMPLES', 50)
+
+
+class RequestMetrics:
+    """
+    Замеры одного запроса, накапливаются в потоке его обработки.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.cache = defaultdict(int)
+        self.statements = []
+
+    def add_query(self, sql, elapsed):
+        self.queries += 1
+        self.sql_time += elapsed
+        if len(self.statements) < MAX_SAMPLED_QUERIES:
+            self.statements.append(
+                (sql[:MAX_SQL_LENGTH], round(elapsed * 1000, 3)))
+
+
+def current():
+    """
+    Замеры текущего запроса или None вне запроса.
+    """
+    return getattr(_local, 'metrics', None)
+
+
+def start():
+    _local.metrics = RequestMetrics()
+    return _local.metrics
+
+
+def finish():
+    _local.metrics = None
+
+
+def cache_event(result, name='page'):
+    """
+    Отмечает обращение к кэшу `name`: hit, stale или miss.
+    Без имени - к кэшу страниц целиком.
+    """
+    metrics = current()
+    if metrics is not None:
+        metrics.cache[name, result] += 1
+
+
+def cache_name(key):
+    """
+    Имя кэша для метрик по ключу: фрагмент шаблона, функция сайта
+    из make_key (с видом ключа, например card:version) или other.
+    """
+    if key.startswith(FRAGMENT_PREFIX):
+        return 'fragment:' + key[len(FRAGMENT_PREFIX):].partition('.')[0]
+    parts = key.split(':')
+    if parts[0] != 'posts' or len(parts) < 2:
+        return 'other'
+    if len(parts) > 2 and parts[2] in CACHE_KEY_KINDS:
+        return f'{parts[1]}:{parts[2]}'
+    return parts[1]
+
+
+def cache_read(key, found):
+    """
+    Отмечает чтение ключа кэша; вызывается бэкендами posts.cache_backends.
+    """
+    if current() is not None:
+        cache_event('hit' if found else 'miss', cache_name(key))
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    """
+    Обертка `connection.execute_wrapper`: время и текст запросов.
+    """
+    metrics = current()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - started)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = current()
+        if metrics is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - started
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    """
+    Шаблонизатор Django, замеряющий время отрисовки шаблонов.
+    """
+
+    def from_string(self, template_code):
+        template = super().from_string(template_code)
+        return TimedTemplate(template.template, self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+    def cumulative(self):
+        result, running = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+
+class ViewStats:
+    def __init__(self):
+        self.duration = Histogram(TIME_BUCKETS)
+        self.sql_time = Histogram(TIME_BUCKETS)
+        self.template_time = Histogram(TIME_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.statuses = defaultdict(int)
+        self.cache = defaultdict(int)
+
+
+class Registry:
+    """
+    Сводные гистограммы по представлениям в пределах процесса.
+    Каждый процесс сервера приложений отдает свои значения,
+    их суммирует сборщик метрик (Prometheus).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.views = defaultdict(ViewStats)
+        self.slow = deque(maxlen=slow_samples())
+        self.tasks = defaultdict(int)
+        self.task_time = defaultdict(lambda: Histogram(TIME_BUCKETS))
+
+    def record_task(self, task, outcome, duration=None):
+        """
+        Учитывает фоновую задачу: enqueued, succeeded, failed,
+        retried или dead (попытки исчерпаны).
+        """
+        with self.lock:
+            self.tasks[task, outcome] += 1
+            if duration is not None:
+                self.task_time[task].observe(duration)
+
+    def record(self, view, path, status, duration, metrics):
+        with self.lock:
+            stats = self.views[view]
+            stats.duration.observe(duration)
+            stats.sql_time.observe(metrics.sql_time)
+            stats.template_time.observe(metrics.template_time)
+            stats.queries.observe(metrics.queries)
+            stats.statuses[status] += 1
+            for name, count in metrics.cache.items():
+                stats.cache[name] += count
+            if duration * 1000 >= slow_threshold():
+                self.slow.append({
+                    'view': view,
+                    'path': path,
+                    'status': status,
+                    'duration_ms': round(duration * 1000, 3),
+                    'sql_ms': round(metrics.sql_time * 1000, 3),
+                    'template_ms': round(metrics.template_time * 1000, 3),
+                    'queries': metrics.statements,
+                })
+
+    def snapshot(self):
+        """
+        Сводка в виде словаря для JSON.
+        """
+        with self.lock:
+            views = {}
+            for view, stats in self.views.items():
+                cache = defaultdict(dict)
+                for (name, result), count in stats.cache.items():
+                    cache[name][result] = count
+                views[view] = {
+                    'requests': stats.duration.total,
+                    'statuses': dict(stats.statuses),
+                    'cache': dict(cache),
+                    'duration_ms': _mean_ms(stats.duration),
+                    'sql_ms': _mean_ms(stats.sql_time),
+                    'template_ms': _mean_ms(stats.template_time),
+                    'queries': (round(stats.queries.sum
+                                      / stats.queries.total, 2)
+                                if stats.queries.total else 0),
+                }
+            tasks = defaultdict(dict)
+            for (task, outcome), count in self.tasks.items():
+                tasks[task][outcome] = count
+            return {'views': views, 'slow': list(self.slow),
+                    'tasks': dict(tasks)}
+
+    def prometheus(self):
+        """
+        Сводка в текстовом формате Prometheus.
+        """
+        lines = []
+        with self.lock:
+            views = sorted(self.views.items())
+            for name, attribute, kind in (
+                ('yatube_request_duration_seconds', 'duration', 'time'),
+                ('yatube_sql_duration_seconds', 'sql_time', 'time'),
+                ('yatube_template_render_seconds', 'template_time', 'time'),
+                ('yatube_sql_queries', 'queries', 'count'),
+            ):
+                lines.append(f'# TYPE {name} histogram')
+                for view, stats in views:
+                    histogram = getattr(stats, attribute)
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{view="{view}",'
+                                     f'le="{bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{view="{view}",'
+                                 f'le="+Inf"}} {histogram.total}')
+                    lines.append(f'{name}_sum{{view="{view}"}} '
+                                 f'{histogram.sum}')
+                    lines.append(f'{name}_count{{view="{view}"}} '
+                                 f'{histogram.total}')
+            lines.append('# TYPE yatube_requests_total counter')
+            for view, stats in views:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'yatube_requests_total{{view="{view}",'
+                                 f'status="{status}"}} {count}')
+            lines.append('# TYPE yatube_page_cache_total counter')
+            for view, stats in views:
+                for (name, result), count in sorted(stats.cache.items()):
+                    lines.append(f'yatube_page_cache_total{{view="{view}",'
+                                 f'cache="{name}",result="{result}"}} '
+                                 f'{count}')
+            lines.append('# TYPE yatube_tasks_total counter')
+            for (task, outcome), count in sorted(self.tasks.items()):
+                lines.append(f'yatube_tasks_total{{task="{task}",'
+                             f'outcome="{outcome}"}} {count}')
+            name = 'yatube_task_duration_seconds'
+            lines.append(f'# TYPE {name} histogram')
+            for task, histogram in sorted(self.task_time.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{name}_bucket{{task="{task}",'
+                                 f'le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{task="{task}",'
+                             f'le="+Inf"}} {histogram.total}')
+                lines.append(f'{name}_sum{{task="{task}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{task="{task}"}} '
+                             f'{histogram.total}')
+        return '\n'.join(lines) + '\n'
+
+
+def _mean_ms(histogram):
+    if not histogram.total:
+        return 0
+    return round(histogram.sum / histogram.total * 1000, 3)
+
+
+registry = Registry()
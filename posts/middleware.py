@@ -0,0 +1,65 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics, routers
+
+
+class MetricsMiddleware:
+    """
+    Замеряет каждый запрос: длительность, число и время SQL-запросов,
+    время отрисовки шаблонов и обращения к кэшу страниц.
+    Ставится первым в MIDDLEWARE, чтобы учитывать работу остальных.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'POSTS_METRICS_ENABLED', True):
+            return self.get_response(request)
+        request_metrics = metrics.start()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.sql_wrapper))
+                response = self.get_response(request)
+            duration = time.perf_counter() - started
+            match = getattr(request, 'resolver_match', None)
+            view = (match.view_name if match is not None
+                    else 'unresolved')
+            metrics.registry.record(view, request.path,
+                                    response.status_code, duration,
+                                    request_metrics)
+            return response
+        finally:
+            metrics.finish()
+
+
+class ReplicaPinMiddleware:
+    """
+    Закрепляет пользователя за основной БД на несколько секунд
+    после записи, чтобы он сразу видел свои изменения,
+    даже если реплики еще отстают.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.reset()
+        if request.COOKIES.get(routers.PIN_COOKIE):
+            routers.pin()
+        try:
+            response = self.get_response(request)
+            if routers.wrote():
+                response.set_cookie(routers.PIN_COOKIE, '1',
+                                    max_age=routers.pin_seconds(),
+                                    httponly=True, samesite='Lax')
+            return response
+        finally:
+            routers.reset()
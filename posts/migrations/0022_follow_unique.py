@@ -0,0 +1,44 @@
+# Generated by Django 2.2.18 on 2026-10-18 19:57
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    duplicates = list(Follow.objects.values('user', 'author')
+                      .annotate(first=Min('pk'), total=Count('pk'))
+                      .filter(total__gt=1)
+                      .order_by())
+    users = set()
+    for row in duplicates:
+        (Follow.objects.filter(user=row['user'], author=row['author'])
+         .exclude(pk=row['first']).delete())
+        users.update((row['user'], row['author']))
+    # Счетчики учитывали удаленные дубли.
+    for user_id in users:
+        UserStats.objects.filter(user_id=user_id).update(
+            followers_count=Follow.objects.filter(author=user_id).count(),
+            following_count=Follow.objects.filter(user=user_id).count(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_group_feed_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_follows,
+                             migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='follow',
+            name='follow_user_author',
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='following_unique'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 2.2.18 on 2026-10-18 20:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0023_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupTrend',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trend', serialize=False, to='posts.Group', verbose_name='Группа')),
+                ('score', models.FloatField(verbose_name='Оценка')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Популярность группы',
+                'verbose_name_plural': 'Популярность групп',
+            },
+        ),
+        migrations.CreateModel(
+            name='PostTrend',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trend', serialize=False, to='posts.Post', verbose_name='Запись')),
+                ('score', models.FloatField(verbose_name='Оценка')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Популярность записи',
+                'verbose_name_plural': 'Популярность записей',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='posttrend',
+            index=models.Index(fields=['-score'], name='post_trend_score'),
+        ),
+        migrations.AddIndex(
+            model_name='grouptrend',
+            index=models.Index(fields=['-score'], name='group_trend_score'),
+        ),
+    ]
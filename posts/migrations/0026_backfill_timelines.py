@@ -0,0 +1,56 @@
+# Generated by Django 2.2.18 on 2026-10-18 20:20
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+
+BATCH_SIZE = 500
+
+
+def backfill_timelines(apps, schema_editor):
+    """
+    Заполняет ленты подписок по существующим подпискам, как это
+    делает `rebuild_timelines`: иначе после выката ленты пусты.
+    """
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    fanout_limit = getattr(settings, 'POSTS_TIMELINE_FANOUT_LIMIT', 1000)
+    backfill_limit = getattr(settings, 'POSTS_TIMELINE_BACKFILL_LIMIT', 500)
+    # Посты популярных авторов читаются напрямую и в ленты не пишутся.
+    celebrities = (Follow.objects.values('author')
+                   .annotate(total=Count('pk'))
+                   .filter(total__gte=fanout_limit)
+                   .values_list('author', flat=True))
+    follows = (Follow.objects.exclude(author__in=list(celebrities))
+               .order_by('author_id')
+               .values_list('user_id', 'author_id')
+               .iterator(chunk_size=BATCH_SIZE))
+    author_id, posts, entries = None, [], []
+    for user_id, follow_author_id in follows:
+        if follow_author_id != author_id:
+            author_id = follow_author_id
+            posts = list(Post.objects.filter(author_id=author_id)
+                         .order_by('-pub_date')
+                         .values_list('pk', 'pub_date')[:backfill_limit])
+        entries.extend(
+            TimelineEntry(user_id=user_id, post_id=post_id,
+                          pub_date=pub_date)
+            for post_id, pub_date in posts)
+        if len(entries) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE,
+                                              ignore_conflicts=True)
+            entries = []
+    TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE,
+                                      ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0025_timeline_index_post'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
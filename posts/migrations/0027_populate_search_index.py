@@ -0,0 +1,112 @@
+# Generated by Django 2.2.18 on 2026-10-18 20:30
+
+import re
+from collections import Counter
+from itertools import chain
+
+from django.db import migrations
+
+CHUNK_SIZE = 2000
+
+# Копия токенизатора и схемы rowid из posts.search на момент миграции:
+# результат миграции не должен меняться вместе с модулем поиска.
+FTS_TABLE = 'posts_search_fts'
+WORD_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile('[а-я]')
+RUSSIAN_ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'иях', 'ием', 'ией', 'ого', 'его', 'ому', 'ему',
+    'ыми', 'ими', 'ться', 'тся', 'ешь', 'ишь', 'ете', 'ите', 'ала', 'ила',
+    'али', 'или', 'ать', 'ять', 'ить', 'еть', 'ует', 'уют', 'ют', 'ут',
+    'ет', 'ит', 'ем', 'им', 'ым', 'ом', 'ой', 'ей', 'ий', 'ый', 'ая', 'яя',
+    'ое', 'ее', 'ие', 'ые', 'ую', 'юю', 'их', 'ых', 'ах', 'ях', 'ов', 'ев',
+    'ам', 'ям', 'ия', 'ья', 'ью', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю',
+    'ь', 'й',
+), key=len, reverse=True)
+MIN_STEM = 3
+
+
+def stem(word):
+    if not CYRILLIC_RE.search(word):
+        return word
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    text = text.lower().replace('ё', 'е')
+    return [stem(word) for word in WORD_RE.findall(text)]
+
+
+def document_rowid(post_id, comment_id):
+    if comment_id:
+        return comment_id * 2 + 1
+    return post_id * 2
+
+
+def _chunks(documents):
+    chunk = []
+    for document in documents:
+        chunk.append(document)
+        if len(chunk) >= CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def populate_search_index(apps, schema_editor):
+    """
+    Строит поисковый индекс по существующим постам и комментариям,
+    как `rebuild_search_index`: иначе поиск по сайту и в админке
+    после выката ничего не находит. Заодно документы FTS5 получают
+    rowid, по которым они потом заменяются и удаляются.
+    """
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    SearchEntry = apps.get_model('posts', 'SearchEntry')
+    connection = schema_editor.connection
+    fts = (connection.vendor == 'sqlite'
+           and FTS_TABLE in connection.introspection.table_names())
+    documents = chain(
+        ((pk, None, text) for pk, text in
+         Post.objects.values_list('pk', 'text').iterator(CHUNK_SIZE)),
+        Comment.objects.values_list('post_id', 'pk', 'text')
+        .iterator(CHUNK_SIZE),
+    )
+    if fts:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            for chunk in _chunks(documents):
+                cursor.executemany(
+                    f'INSERT INTO {FTS_TABLE} '
+                    f'(rowid, body, post_id, comment_id) '
+                    f'VALUES (%s, %s, %s, %s)',
+                    [(document_rowid(post_id, comment_id),
+                      ' '.join(tokenize(text)), post_id, comment_id or 0)
+                     for post_id, comment_id, text in chunk],
+                )
+        return
+    SearchEntry.objects.all().delete()
+    for chunk in _chunks(documents):
+        SearchEntry.objects.bulk_create(
+            [SearchEntry(term=term, post_id=post_id, comment_id=comment_id,
+                         weight=weight)
+             for post_id, comment_id, text in chunk
+             for term, weight in
+             Counter(term[:64] for term in tokenize(text)).items()],
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0026_backfill_timelines'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_search_index,
+                             migrations.RunPython.noop),
+    ]
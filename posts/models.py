@@ -1,5 +1,6 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, models
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -57,15 +58,38 @@ class Post(models.Model):
         verbose_name='Изображение для поста',
         help_text='Только файлы изображений',
     )
+    comment_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество комментариев',
+    )
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = (
+            models.Index(fields=('-pub_date', '-id'),
+                         name='post_pub_date'),
+            models.Index(fields=('author', '-pub_date'),
+                         name='post_author_pub_date'),
+            models.Index(fields=('group', '-pub_date', '-id'),
+                         name='post_group_pub_date_id'),
+        )
 
     def __str__(self):
         return f'Автор: {self.author} от {self.pub_date:%d.%m.%Y}.'
 
+    def save(self, *args, **kwargs):
+        # Счетчик комментариев меняется только через F-выражения,
+        # поэтому при редактировании поста его значение не перезаписываем.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'comment_count'
+            ]
+        super().save(*args, **kwargs)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(Post,
@@ -90,6 +114,10 @@ class Comment(models.Model):
         ordering = ('-created', )
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = (
+            models.Index(fields=('post', '-created'),
+                         name='comment_post_created'),
+        )
 
 
 class Follow(models.Model):
@@ -105,5 +133,279 @@ class Follow(models.Model):
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
-        models.UniqueConstraint(fields=['user', 'author'],
-                                name='following_unique',)
+        # Уникальность (user, author) обеспечивает и индекс для поиска
+        # подписки, поэтому отдельный индекс не нужен.
+        constraints = (
+            models.UniqueConstraint(fields=('user', 'author'),
+                                    name='following_unique'),
+        )
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='timeline',
+                             verbose_name='Читатель',
+                             )
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='timeline_entries',
+                             verbose_name='Пост',
+                             )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи ленты подписок'
+        constraints = (
+            models.UniqueConstraint(fields=('user', 'post'),
+                                    name='timeline_entry_unique'),
+        )
+        indexes = (
+            models.Index(fields=('user', '-pub_date', '-post'),
+                         name='timeline_user_pub_date_post'),
+        )
+
+
+class SearchEntry(models.Model):
+    """
+    Запись инвертированного индекса поиска: основа слова и документ
+    (пост или комментарий к нему), в котором она встречается.
+    Используется, если БД не поддерживает SQLite FTS5.
+    """
+    term = models.CharField(
+        max_length=64,
+        verbose_name='Основа слова',
+    )
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='+',
+                             verbose_name='Пост',
+                             )
+    comment = models.ForeignKey(Comment,
+                                on_delete=models.CASCADE,
+                                null=True,
+                                related_name='+',
+                                verbose_name='Комментарий',
+                                )
+    weight = models.PositiveIntegerField(
+        default=1,
+        verbose_name='Число вхождений',
+    )
+
+    class Meta:
+        verbose_name = 'Запись поискового индекса'
+        verbose_name_plural = 'Записи поискового индекса'
+        indexes = (
+            models.Index(fields=('term', 'post'),
+                         name='search_term_post'),
+        )
+
+
+class UserStatsManager(models.Manager):
+    def recount(self, user):
+        """
+        Пересчитывает счетчики пользователя по данным в БД.
+        Считает всегда по основной БД: результат сохраняется,
+        а реплика может отставать.
+        """
+        posts = Post.objects.using(DEFAULT_DB_ALIAS)
+        follows = Follow.objects.using(DEFAULT_DB_ALIAS)
+        counts = {
+            'posts_count': posts.filter(author=user).count(),
+            'followers_count': follows.filter(author=user).count(),
+            'following_count': follows.filter(user=user).count(),
+        }
+        stats, _ = self.update_or_create(user=user, defaults=counts)
+        return stats
+
+    def for_user(self, user):
+        """
+        Возвращает счетчики пользователя, создавая их при отсутствии.
+        """
+        try:
+            return self.get(user=user)
+        except self.model.DoesNotExist:
+            return self.recount(user)
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(User,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='stats',
+                                verbose_name='Пользователь',
+                                )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Записей',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Подписчиков',
+    )
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Подписок',
+    )
+
+    objects = UserStatsManager()
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+
+    def __str__(self):
+        return f'Статистика {self.user}'
+
+
+class Recommendation(models.Model):
+    """
+    Предложение подписаться, заранее рассчитанное командой
+    compute_recommendations.
+    """
+    FRIENDS = 'friends'
+    GROUPS = 'groups'
+    BOTH = 'both'
+    REASONS = (
+        (FRIENDS, 'Читают ваши подписки'),
+        (GROUPS, 'Пишет в ваших группах'),
+        (BOTH, 'Читают ваши подписки и пишет в ваших группах'),
+    )
+
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='recommendations',
+                             verbose_name='Пользователь',
+                             )
+    candidate = models.ForeignKey(User,
+                                  on_delete=models.CASCADE,
+                                  related_name='+',
+                                  verbose_name='Кого почитать',
+                                  )
+    rank = models.PositiveSmallIntegerField(verbose_name='Место')
+    score = models.FloatField(verbose_name='Оценка')
+    reason = models.CharField(max_length=10,
+                              choices=REASONS,
+                              verbose_name='Причина',
+                              )
+    computed = models.DateTimeField(verbose_name='Рассчитано')
+
+    class Meta:
+        verbose_name = 'Рекомендация'
+        verbose_name_plural = 'Рекомендации'
+        indexes = (
+            models.Index(fields=('user', 'rank'),
+                         name='recommendation_user_rank'),
+            models.Index(fields=('computed',),
+                         name='recommendation_computed'),
+        )
+
+    def __str__(self):
+        return f'{self.user} -> {self.candidate}'
+
+
+class PostTrend(models.Model):
+    """
+    Популярность поста для ленты /trending/. Оценка хранится
+    в логарифмической шкале: log(sum(вес * exp(rate * t))) по событиям,
+    поэтому новое событие только прибавляется, а затухание одинаково
+    для всех записей и не меняет порядок.
+    """
+    post = models.OneToOneField(Post,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='trend',
+                                verbose_name='Запись',
+                                )
+    score = models.FloatField(verbose_name='Оценка')
+    updated = models.DateTimeField(auto_now=True,
+                                   verbose_name='Обновлено',
+                                   )
+
+    class Meta:
+        verbose_name = 'Популярность записи'
+        verbose_name_plural = 'Популярность записей'
+        indexes = (
+            models.Index(fields=('-score',), name='post_trend_score'),
+        )
+
+    def __str__(self):
+        return f'{self.post_id}: {self.score:.2f}'
+
+
+class GroupTrend(models.Model):
+    """
+    Популярность группы: сумма событий ее постов.
+    """
+    group = models.OneToOneField(Group,
+                                 on_delete=models.CASCADE,
+                                 primary_key=True,
+                                 related_name='trend',
+                                 verbose_name='Группа',
+                                 )
+    score = models.FloatField(verbose_name='Оценка')
+    updated = models.DateTimeField(auto_now=True,
+                                   verbose_name='Обновлено',
+                                   )
+
+    class Meta:
+        verbose_name = 'Популярность группы'
+        verbose_name_plural = 'Популярность групп'
+        indexes = (
+            models.Index(fields=('-score',), name='group_trend_score'),
+        )
+
+    def __str__(self):
+        return f'{self.group}: {self.score:.2f}'
+
+
+class QueuedTask(models.Model):
+    """
+    Фоновая задача в очереди БД. Запись создается в той же
+    транзакции, что и изменение, и выполняется `run_worker`.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(max_length=200, verbose_name='Задача')
+    payload = models.TextField(verbose_name='Аргументы')
+    status = models.CharField(max_length=10,
+                              choices=STATUSES,
+                              default=QUEUED,
+                              verbose_name='Состояние',
+                              )
+    attempts = models.PositiveIntegerField(default=0,
+                                           verbose_name='Попыток',
+                                           )
+    run_at = models.DateTimeField(default=timezone.now,
+                                  verbose_name='Выполнить после',
+                                  )
+    locked_at = models.DateTimeField(null=True, blank=True,
+                                     verbose_name='Взята в работу',
+                                     )
+    last_error = models.TextField(blank=True,
+                                  verbose_name='Последняя ошибка',
+                                  )
+    created = models.DateTimeField(auto_now_add=True,
+                                   verbose_name='Создана',
+                                   )
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            models.Index(fields=('status', 'run_at'),
+                         name='queued_task_status_run_at'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
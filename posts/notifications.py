@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.mail import get_connection, send_mass_mail
+from django.urls import reverse
+
+from .models import Follow, Post
+from .tasks import task
+
+# Сколько писем отправляется через одно SMTP-соединение.
+CHUNK_SIZE = 100
+
+
+def enabled():
+    return getattr(settings, 'POSTS_EMAIL_NOTIFICATIONS', False)
+
+
+@task
+def notify_followers(post_id):
+    """
+    Отправляет подписчикам автора письмо о новом посте.
+    Возвращает число отправленных писем.
+    """
+    post = Post.objects.select_related('author').filter(pk=post_id).first()
+    if post is None:
+        return 0
+    username = post.author.username
+    url = reverse('post', args=(username, post.pk))
+    subject = f'Новый пост автора {username}'
+    body = (f'{post.text[:500]}\n\n'
+            f'https://{Site.objects.get_current().domain}{url}')
+    emails = (Follow.objects.filter(author_id=post.author_id)
+              .exclude(user__email='')
+              .values_list('user__email', flat=True))
+    sent, chunk = 0, []
+    with get_connection() as mail:
+        for email in emails.iterator():
+            chunk.append((subject, body, None, [email]))
+            if len(chunk) >= CHUNK_SIZE:
+                sent += send_mass_mail(chunk, connection=mail)
+                chunk = []
+        if chunk:
+            sent += send_mass_mail(chunk, connection=mail)
+    return sent
+
+
+def schedule(post):
+    """
+    Ставит рассылку о новом посте в очередь фоновых задач.
+    """
+    if enabled():
+        notify_followers.delay(post.pk)
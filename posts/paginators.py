@@ -0,0 +1,354 @@
+import base64
+import binascii
+import math
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import make_key
+
+POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
+FEED_ORDERING = ('-pub_date', '-id')
+# Границы знакового 64-битного целого: большее значение из курсора
+# падает с OverflowError уже при выполнении запроса.
+INT_MIN, INT_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def max_pages():
+    """
+    Сколько страниц ленты доступно по номеру.
+    Дальше лента листается только курсором `?after=`.
+    """
+    return getattr(settings, 'POSTS_MAX_PAGES', 100)
+
+
+def count_ttl():
+    return getattr(settings, 'POSTS_COUNT_CACHE_TTL', 60)
+
+
+def estimate_threshold():
+    """
+    Начиная с какой оценки числа строк вместо COUNT(*)
+    используется оценка планировщика PostgreSQL.
+    """
+    return getattr(settings, 'POSTS_COUNT_ESTIMATE_THRESHOLD', 100000)
+
+
+def encode_cursor(values):
+    """
+    Кодирует значения ключа сортировки в строку для URL.
+    """
+    raw = '|'.join(
+        value.isoformat() if hasattr(value, 'isoformat') else str(value)
+        for value in values
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, count):
+    """
+    Раскодирует курсор. Возвращает None, если курсор поврежден.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    parts = raw.split('|')
+    if len(parts) != count:
+        return None
+    return parts
+
+
+def _valid_value(value):
+    """
+    Значение из курсора, которое можно безопасно подставить в запрос.
+    """
+    if value is None:
+        return False
+    if isinstance(value, int):
+        return INT_MIN <= value <= INT_MAX
+    if isinstance(value, float):
+        return math.isfinite(value)
+    return True
+
+
+def estimated_count(queryset):
+    """
+    Число строк таблицы по статистике PostgreSQL, без прохода
+    по таблице. Для других БД возвращает None.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    return row[0] if row and row[0] > 0 else None
+
+
+def _count_key(name):
+    return make_key('count', name)
+
+
+def cached_count(name, queryset, estimate=False):
+    """
+    Число записей ленты из кэша, пересчитывается не чаще раза
+    в POSTS_COUNT_CACHE_TTL секунд. С `estimate` для большой
+    таблицы PostgreSQL берется оценка вместо COUNT(*).
+    """
+    key = _count_key(name)
+    count = cache.get(key)
+    if count is None:
+        count = estimated_count(queryset) if estimate else None
+        if count is None or count < estimate_threshold():
+            count = queryset.count()
+        cache.set(key, count, count_ttl())
+    return count
+
+
+def adjust_count(name, delta):
+    """
+    Поправляет закэшированное число записей после записи в ленту.
+    """
+    try:
+        cache.incr(_count_key(name), delta)
+    except ValueError:
+        pass
+
+
+def forget_count(name):
+    cache.delete(_count_key(name))
+
+
+def page_window(page, on_each_side=2, on_ends=1):
+    """
+    Номера страниц вокруг текущей и по краям списка
+    вместо всех номеров; None отмечает пропуск.
+    """
+    number = page.number
+    num_pages = page.paginator.num_pages
+    if num_pages <= (on_each_side + on_ends) * 2 + 1:
+        return list(range(1, num_pages + 1))
+    window = []
+    if number > on_each_side + on_ends + 2:
+        window.extend(range(1, on_ends + 1))
+        window.append(None)
+        window.extend(range(number - on_each_side, number + 1))
+    else:
+        window.extend(range(1, number + 1))
+    if number < num_pages - on_each_side - on_ends - 1:
+        window.extend(range(number + 1, number + on_each_side + 1))
+        window.append(None)
+        window.extend(range(num_pages - on_ends + 1, num_pages + 1))
+    else:
+        window.extend(range(number + 1, num_pages + 1))
+    return window
+
+
+def feed_cursor(post):
+    """
+    Курсор ленты, указывающий на пост.
+    """
+    return encode_cursor(getattr(post, name.lstrip('-'))
+                         for name in FEED_ORDERING)
+
+
+class CursorPage(Sequence):
+    """
+    Страница курсорного паджинатора.
+    Повторяет интерфейс `django.core.paginator.Page`,
+    необходимый шаблону `paginator.html`.
+    """
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.number = None
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_cursor(self):
+        if not self.object_list:
+            return None
+        return self.paginator.cursor_for(self.object_list[-1])
+
+    def previous_cursor(self):
+        if not self.object_list:
+            return None
+        return self.paginator.cursor_for(self.object_list[0])
+
+
+class CursorPaginator:
+    """
+    Паджинатор по ключу сортировки (keyset pagination).
+    Не выполняет COUNT(*) и OFFSET: каждая страница выбирается
+    одним запросом по индексу независимо от глубины.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, ordering=FEED_ORDERING):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = tuple(name.lstrip('-') for name in self.ordering)
+        self.descending = self.ordering[0].startswith('-')
+
+    def cursor_for(self, obj):
+        return encode_cursor(getattr(obj, name) for name in self.fields)
+
+    def _field(self, name):
+        """
+        Поле модели или аннотации QuerySet, по которому идет сортировка.
+        """
+        annotation = self.object_list.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        meta = self.object_list.model._meta
+        return meta.pk if name == 'pk' else meta.get_field(name)
+
+    def _parse(self, cursor):
+        parts = decode_cursor(cursor, len(self.fields))
+        if parts is None:
+            return None
+        values = []
+        for name, raw in zip(self.fields, parts):
+            field = self._field(name)
+            if field.get_internal_type() == 'DateTimeField':
+                try:
+                    value = parse_datetime(raw)
+                except ValueError:
+                    value = None
+                # Курсоры кодируют даты с часовым поясом.
+                if (value is not None and settings.USE_TZ
+                        and timezone.is_naive(value)):
+                    value = None
+            else:
+                try:
+                    value = field.to_python(raw)
+                except Exception:
+                    value = None
+            if not _valid_value(value):
+                return None
+            values.append(value)
+        return values
+
+    def _seek(self, values, forward):
+        """
+        Условие "строго после" (или "строго до") для составного ключа.
+        """
+        lookup = 'lt' if forward == self.descending else 'gt'
+        condition = Q()
+        for index, name in enumerate(self.fields):
+            step = Q(**{f'{name}__{lookup}': values[index]})
+            for prev_name, prev_value in zip(self.fields[:index],
+                                             values[:index]):
+                step &= Q(**{prev_name: prev_value})
+            condition |= step
+        return condition
+
+    def page(self, after=None, before=None):
+        """
+        Возвращает страницу после курсора `after` или перед курсором
+        `before`. Без курсора возвращает первую страницу.
+        """
+        after_values = self._parse(after) if after else None
+        before_values = self._parse(before) if before else None
+        if before_values is not None:
+            queryset = self.object_list.order_by(*self.ordering)
+            reverse = tuple(
+                name[1:] if name.startswith('-') else f'-{name}'
+                for name in self.ordering
+            )
+            queryset = queryset.filter(
+                self._seek(before_values, forward=False)
+            ).order_by(*reverse)
+            rows = list(queryset[:self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return CursorPage(rows, self, True, has_previous)
+        return self.page_from(self.window(after), after_values is not None)
+
+    def window(self, after=None):
+        """
+        Ленивый QuerySet страницы после курсора `after` с одной
+        лишней записью, по которой видно, есть ли следующая страница.
+        """
+        values = self._parse(after) if after else None
+        queryset = self.object_list.order_by(*self.ordering)
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, forward=True))
+        return queryset[:self.per_page + 1]
+
+    def page_from(self, window, has_previous=False):
+        """
+        Страница из результата `window`.
+        """
+        rows = list(window)
+        has_next = len(rows) > self.per_page
+        return CursorPage(rows[:self.per_page], self, has_next, has_previous)
+
+
+def paginate(request, object_list, per_page=POSTS_PER_PAGE, count=None):
+    """
+    Возвращает паджинатор и страницу для ленты.
+    Параметры `?after=` и `?before=` включают курсорную паджинацию
+    по явной сортировке QuerySet (по умолчанию FEED_ORDERING),
+    иначе используется обычный `Paginator` с `?page=`.
+    Известное заранее число записей `count` избавляет от COUNT(*).
+    Номера страниц ограничены POSTS_MAX_PAGES: на последней из них
+    `paginator.truncated` включает переход дальше по курсору,
+    который строит `paginator.cursor_for` по той же сортировке.
+    """
+    ordering = object_list.query.order_by or FEED_ORDERING
+    cursor_paginator = CursorPaginator(object_list, per_page, ordering)
+    if 'after' in request.GET or 'before' in request.GET:
+        page = cursor_paginator.page(after=request.GET.get('after'),
+                                     before=request.GET.get('before'))
+        return cursor_paginator, page
+    paginator = Paginator(object_list, per_page)
+    paginator.cursor_for = cursor_paginator.cursor_for
+    if count is not None:
+        paginator.count = count
+    limit = max_pages() * paginator.per_page
+    paginator.truncated = paginator.count > limit
+    if paginator.truncated:
+        paginator.count = limit
+    page = paginator.get_page(request.GET.get('page'))
+    return paginator, page
+
+
+def comment_paginator(object_list, per_page=COMMENTS_PER_PAGE):
+    """
+    Курсорный паджинатор комментариев от новых к старым.
+    """
+    return CursorPaginator(object_list, per_page,
+                           ordering=('-created', '-id'))
@@ -0,0 +1,164 @@
+import heapq
+import math
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache, follow_graph
+from .models import Follow, Post, Recommendation
+
+BATCH_SIZE = 500
+
+
+def per_user():
+    """
+    Сколько предложений хранится для каждого пользователя.
+    """
+    return getattr(settings, 'POSTS_RECOMMENDATIONS_PER_USER', 10)
+
+
+def group_weight():
+    """
+    Вес общей группы относительно общего знакомого.
+    """
+    return getattr(settings, 'POSTS_RECOMMENDATION_GROUP_WEIGHT', 0.5)
+
+
+def max_fanout():
+    """
+    Сколько соседей одной вершины просматривается при расчете:
+    ограничивает работу на пользователях с огромным числом подписок
+    и на больших группах.
+    """
+    return getattr(settings, 'POSTS_RECOMMENDATION_MAX_FANOUT', 1000)
+
+
+class Graph:
+    """
+    Граф подписок и групп в памяти: множества id пользователей.
+    """
+
+    def __init__(self):
+        self.followees = defaultdict(set)
+        self.groups = defaultdict(set)
+        self.members = defaultdict(set)
+
+    def add_follow(self, user_id, author_id):
+        self.followees[user_id].add(author_id)
+
+    def add_group_post(self, author_id, group_id):
+        self.groups[author_id].add(group_id)
+        self.members[group_id].add(author_id)
+
+    @classmethod
+    def load(cls, chunk_size=10000):
+        """
+        Читает подписки и авторов групп из БД потоково.
+        """
+        graph = cls()
+        follows = (Follow.objects.values_list('user_id', 'author_id')
+                   .iterator(chunk_size))
+        for user_id, author_id in follows:
+            graph.add_follow(user_id, author_id)
+        posts = (Post.objects.filter(group__isnull=False).order_by()
+                 .values_list('author_id', 'group_id').distinct()
+                 .iterator(chunk_size))
+        for author_id, group_id in posts:
+            graph.add_group_post(author_id, group_id)
+        return graph
+
+    def users(self):
+        return sorted(self.followees.keys() | self.groups.keys())
+
+
+def _spread(scores, reasons, neighbours, weight, reason, fanout):
+    # Вклад соседа падает с числом его связей (индекс Адамик-Адара):
+    # подписка на популярного автора говорит о вкусах меньше.
+    share = weight / math.log(2 + len(neighbours))
+    for candidate in islice(neighbours, fanout):
+        scores[candidate] += share
+        reasons[candidate].add(reason)
+
+
+def suggest(graph, user_id, limit=None, weight=None, fanout=None):
+    """
+    Лучшие кандидаты для подписки: авторы, которых читают подписки
+    пользователя, и авторы групп, в которых он пишет.
+    Возвращает список (id кандидата, оценка, причина).
+    """
+    limit = limit or per_user()
+    weight = group_weight() if weight is None else weight
+    fanout = fanout or max_fanout()
+    scores = defaultdict(float)
+    reasons = defaultdict(set)
+    followed = graph.followees.get(user_id, set())
+    for friend in islice(followed, fanout):
+        neighbours = graph.followees.get(friend)
+        if neighbours:
+            _spread(scores, reasons, neighbours, 1.0,
+                    Recommendation.FRIENDS, fanout)
+    if weight:
+        for group in graph.groups.get(user_id, ()):
+            _spread(scores, reasons, graph.members[group], weight,
+                    Recommendation.GROUPS, fanout)
+    scores.pop(user_id, None)
+    for author_id in followed:
+        scores.pop(author_id, None)
+    best = heapq.nlargest(limit, scores.items(),
+                          key=lambda item: (item[1], -item[0]))
+    return [
+        (candidate, score,
+         Recommendation.BOTH if len(reasons[candidate]) > 1
+         else reasons[candidate].pop())
+        for candidate, score in best
+    ]
+
+
+def compute(graph=None, batch_size=BATCH_SIZE, on_batch=None):
+    """
+    Пересчитывает рекомендации всех пользователей пачками,
+    каждая пачка заменяется в своей транзакции. Строки пользователей,
+    выпавших из графа, удаляются в конце. Возвращает число строк.
+    """
+    graph = graph or Graph.load()
+    computed = timezone.now()
+    users = graph.users()
+    total = 0
+    for start in range(0, len(users), batch_size):
+        batch = users[start:start + batch_size]
+        rows = [
+            Recommendation(user_id=user_id, candidate_id=candidate,
+                           rank=rank, score=score, reason=reason,
+                           computed=computed)
+            for user_id in batch
+            for rank, (candidate, score, reason)
+            in enumerate(suggest(graph, user_id), 1)
+        ]
+        with transaction.atomic():
+            Recommendation.objects.filter(user_id__in=batch).delete()
+            Recommendation.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+        total += len(rows)
+        if on_batch:
+            on_batch(start + len(batch), len(users))
+    Recommendation.objects.filter(computed__lt=computed).delete()
+    cache.bump_generation('recommendations')
+    return total
+
+
+def for_user(user, limit=5):
+    """
+    Готовые предложения для пользователя одним запросом по индексу.
+    Авторы, на которых он подписался после расчета, пропускаются.
+    """
+    if not user.is_authenticated:
+        return []
+    rows = list(Recommendation.objects.filter(user=user)
+                .select_related('candidate')
+                .order_by('rank')[:limit * 2])
+    if not rows:
+        return []
+    followed = follow_graph.followees(user.pk)
+    return [row for row in rows if row.candidate_id not in followed][:limit]
@@ -0,0 +1,169 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+PIN_COOKIE = 'primary_pin'
+
+_state = threading.local()
+_round_robin = itertools.count()
+_lag = {}
+_lag_lock = threading.Lock()
+
+
+def replicas():
+    """
+    Псевдонимы реплик из DATABASES, доступных только для чтения.
+    """
+    return list(getattr(settings, 'POSTS_REPLICAS', ()))
+
+
+def pin_seconds():
+    """
+    Сколько секунд после записи пользователь читает с основной БД.
+    """
+    return getattr(settings, 'POSTS_REPLICA_PIN_SECONDS', 5)
+
+
+def max_lag():
+    return getattr(settings, 'POSTS_REPLICA_MAX_LAG', 5)
+
+
+def reset():
+    _state.replica = False
+    _state.pinned = False
+    _state.wrote = False
+
+
+def pin():
+    """
+    Направляет все чтения текущего запроса в основную БД.
+    """
+    _state.pinned = True
+
+
+def wrote():
+    return getattr(_state, 'wrote', False)
+
+
+def reads_replica():
+    """
+    Может ли чтение в текущем запросе уйти на реплику.
+    """
+    return bool(replicas() and getattr(_state, 'replica', False)
+                and not getattr(_state, 'pinned', False))
+
+
+@contextmanager
+def primary_reads():
+    """
+    Направляет чтения внутри блока в основную БД: для данных,
+    которые сохраняются в кэш под новой версией.
+    """
+    previous = getattr(_state, 'pinned', False)
+    _state.pinned = True
+    try:
+        yield
+    finally:
+        _state.pinned = previous
+
+
+@contextmanager
+def replica_reads():
+    """
+    Разрешает чтение с реплик внутри блока.
+    """
+    previous = getattr(_state, 'replica', False)
+    _state.replica = True
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def use_replica(view):
+    """
+    Декоратор представления, которое только читает данные.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with replica_reads():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def replica_lag(alias):
+    """
+    Отставание реплики в секундах, измеряется не чаще раза в секунду.
+    Для SQLite отставания нет: реплика - копия файла БД.
+    """
+    now = time.monotonic()
+    with _lag_lock:
+        measured = _lag.get(alias)
+        if measured is not None and now - measured[0] < 1:
+            return measured[1]
+    connection = connections[alias]
+    lag = 0.0
+    if connection.vendor == 'postgresql':
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT COALESCE(EXTRACT(EPOCH FROM '
+                    'now() - pg_last_xact_replay_timestamp()), 0)'
+                )
+                lag = float(cursor.fetchone()[0])
+        except DatabaseError:
+            lag = float('inf')
+    with _lag_lock:
+        _lag[alias] = (now, lag)
+    return lag
+
+
+def choose_replica():
+    """
+    Реплика для чтения: по кругу или с наименьшим отставанием
+    (POSTS_REPLICA_SELECTION = 'least_lag'). Реплики, отставшие
+    больше POSTS_REPLICA_MAX_LAG секунд, пропускаются.
+    """
+    aliases = replicas()
+    if not aliases:
+        return DEFAULT_DB_ALIAS
+    selection = getattr(settings, 'POSTS_REPLICA_SELECTION', 'round_robin')
+    if selection == 'least_lag':
+        lags = {alias: replica_lag(alias) for alias in aliases}
+        alias = min(aliases, key=lags.get)
+        return alias if lags[alias] <= max_lag() else DEFAULT_DB_ALIAS
+    start = next(_round_robin)
+    for shift in range(len(aliases)):
+        alias = aliases[(start + shift) % len(aliases)]
+        if replica_lag(alias) <= max_lag():
+            return alias
+    return DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter:
+    """
+    Запись всегда идет в основную БД. Чтение уходит на реплику
+    только в представлениях с `use_replica`, вне транзакции
+    и если пользователь недавно ничего не записывал.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (not getattr(_state, 'replica', False)
+                or getattr(_state, 'pinned', False)
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return choose_replica()
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        _state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная БД.
+        return True
@@ -0,0 +1,273 @@
+import re
+from collections import Counter
+
+from django.db import connection
+from django.db.models import Count, Sum
+
+from .models import Comment, Post, SearchEntry
+from .tasks import task
+
+FTS_TABLE = 'posts_search_fts'
+BATCH_SIZE = 500
+MAX_RESULTS = 1000
+
+WORD_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile('[а-я]')
+# Окончания русских слов, от длинных к коротким.
+RUSSIAN_ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'иях', 'ием', 'ией', 'ого', 'его', 'ому', 'ему',
+    'ыми', 'ими', 'ться', 'тся', 'ешь', 'ишь', 'ете', 'ите', 'ала', 'ила',
+    'али', 'или', 'ать', 'ять', 'ить', 'еть', 'ует', 'уют', 'ют', 'ут',
+    'ет', 'ит', 'ем', 'им', 'ым', 'ом', 'ой', 'ей', 'ий', 'ый', 'ая', 'яя',
+    'ое', 'ее', 'ие', 'ые', 'ую', 'юю', 'их', 'ых', 'ах', 'ях', 'ов', 'ев',
+    'ам', 'ям', 'ия', 'ья', 'ью', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю',
+    'ь', 'й',
+), key=len, reverse=True)
+MIN_STEM = 3
+
+
+def stem(word):
+    """
+    Упрощенный стеммер: отсекает окончание русского слова,
+    оставляя основу не короче MIN_STEM букв.
+    """
+    if not CYRILLIC_RE.search(word):
+        return word
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    """
+    Разбивает текст на основы слов без учета регистра и буквы ё.
+    """
+    text = text.lower().replace('ё', 'е')
+    return [stem(word) for word in WORD_RE.findall(text)]
+
+
+class InvertedIndexBackend:
+    """
+    Инвертированный индекс в таблице `SearchEntry`.
+    Работает на любой БД.
+    """
+
+    def index(self, post_id, comment_id, text):
+        self.delete_document(post_id, comment_id)
+        SearchEntry.objects.bulk_create(
+            self._entries(post_id, comment_id, text),
+            batch_size=BATCH_SIZE,
+        )
+
+    def index_many(self, documents):
+        entries = []
+        for post_id, comment_id, text in documents:
+            entries.extend(self._entries(post_id, comment_id, text))
+        SearchEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+
+    def _entries(self, post_id, comment_id, text):
+        terms = Counter(term[:64] for term in tokenize(text))
+        return [SearchEntry(term=term, post_id=post_id,
+                            comment_id=comment_id, weight=weight)
+                for term, weight in terms.items()]
+
+    def delete_document(self, post_id, comment_id):
+        SearchEntry.objects.filter(post_id=post_id,
+                                   comment_id=comment_id).delete()
+
+    def delete_post(self, post_id):
+        SearchEntry.objects.filter(post_id=post_id).delete()
+
+    def clear(self):
+        SearchEntry.objects.all().delete()
+
+    def _search(self, query, field, limit):
+        terms = set(term[:64] for term in tokenize(query))
+        if not terms:
+            return []
+        entries = SearchEntry.objects.filter(term__in=terms)
+        if field == 'comment_id':
+            entries = entries.exclude(comment_id=None)
+        ranked = (entries.values(field)
+                  .annotate(matched=Count('term', distinct=True),
+                            score=Sum('weight'))
+                  .filter(matched=len(terms))
+                  .order_by('-score', f'-{field}'))
+        return [row[field] for row in ranked[:limit]]
+
+    def search_posts(self, query, limit=MAX_RESULTS):
+        return self._search(query, 'post_id', limit)
+
+    def search_comments(self, query, limit=MAX_RESULTS):
+        return self._search(query, 'comment_id', limit)
+
+
+def document_rowid(post_id, comment_id):
+    """
+    rowid документа в таблице FTS5: четные у постов, нечетные
+    у комментариев. Столбцы post_id и comment_id в FTS5 не индексируются,
+    поэтому документ удаляется и заменяется только по rowid.
+    """
+    if comment_id:
+        return comment_id * 2 + 1
+    return post_id * 2
+
+
+class FTS5Backend:
+    """
+    Полнотекстовый индекс SQLite FTS5.
+    Встроенный столбец `rank` ранжирует документы по bm25.
+    """
+
+    def _body(self, text):
+        return ' '.join(tokenize(text))
+
+    def _match(self, query):
+        return ' '.join(f'"{term}"' for term in tokenize(query))
+
+    def index(self, post_id, comment_id, text):
+        self.delete_document(post_id, comment_id)
+        # Одиночная вставка через execute: панель SQL debug toolbar
+        # не умеет протоколировать executemany на SQLite.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, body, post_id, comment_id) '
+                f'VALUES (%s, %s, %s, %s)',
+                [document_rowid(post_id, comment_id), self._body(text),
+                 post_id, comment_id or 0],
+            )
+
+    def index_many(self, documents):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, body, post_id, comment_id) '
+                f'VALUES (%s, %s, %s, %s)',
+                [(document_rowid(post_id, comment_id), self._body(text),
+                  post_id, comment_id or 0)
+                 for post_id, comment_id, text in documents],
+            )
+
+    def delete_document(self, post_id, comment_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                           [document_rowid(post_id, comment_id)])
+
+    def delete_post(self, post_id):
+        # Комментарии удаленного поста удаляются каскадом,
+        # и их документы снимает сигнал удаления каждого комментария.
+        self.delete_document(post_id, None)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def _search(self, sql, query, limit):
+        match = self._match(query)
+        if not match:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+    def search_posts(self, query, limit=MAX_RESULTS):
+        return self._search(
+            f'SELECT post_id, MIN(score) AS best FROM ('
+            f'SELECT post_id, rank AS score '
+            f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+            f') GROUP BY post_id ORDER BY best, post_id DESC LIMIT %s',
+            query, limit,
+        )
+
+    def search_comments(self, query, limit=MAX_RESULTS):
+        return self._search(
+            f'SELECT comment_id FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND comment_id != 0 '
+            f'ORDER BY rank, comment_id DESC LIMIT %s',
+            query, limit,
+        )
+
+
+_fts5_tables = {}
+
+
+def fts5_available():
+    """
+    Проверяет наличие таблицы FTS5 (один раз для каждой БД).
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _fts5_tables:
+        _fts5_tables[name] = (
+            FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts5_tables[name]
+
+
+def get_backend():
+    """
+    FTS5 на SQLite, если таблица индекса создана, иначе
+    инвертированный индекс в обычной таблице.
+    """
+    if fts5_available():
+        return FTS5Backend()
+    return InvertedIndexBackend()
+
+
+def index_post(post):
+    get_backend().index(post.pk, None, post.text)
+
+
+def index_comment(comment):
+    get_backend().index(comment.post_id, comment.pk, comment.text)
+
+
+@task
+def reindex_post(post_id):
+    post = Post.objects.filter(pk=post_id).only('text').first()
+    if post is not None:
+        index_post(post)
+
+
+@task
+def reindex_comment(comment_id):
+    comment = (Comment.objects.filter(pk=comment_id)
+               .only('post_id', 'text').first())
+    if comment is not None:
+        index_comment(comment)
+
+
+@task
+def remove_post(post_id):
+    get_backend().delete_post(post_id)
+
+
+@task
+def remove_comment(post_id, comment_id):
+    get_backend().delete_document(post_id, comment_id)
+
+
+def rebuild(chunk_size=2000):
+    """
+    Полностью перестраивает индекс по постам и комментариям.
+    """
+    backend = get_backend()
+    backend.clear()
+    posts = Post.objects.values_list('pk', 'text').iterator(chunk_size)
+    _index_chunks(backend, ((pk, None, text) for pk, text in posts),
+                  chunk_size)
+    comments = (Comment.objects.values_list('post_id', 'pk', 'text')
+                .iterator(chunk_size))
+    _index_chunks(backend, comments, chunk_size)
+
+
+def _index_chunks(backend, documents, chunk_size):
+    chunk = []
+    for document in documents:
+        chunk.append(document)
+        if len(chunk) >= chunk_size:
+            backend.index_many(chunk)
+            chunk = []
+    if chunk:
+        backend.index_many(chunk)
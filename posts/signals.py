@@ -0,0 +1,127 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import (cache, counters, follow_graph, notifications, paginators,
+               search, thumbnails, timeline, trending)
+from .models import Comment, Follow, Group, Post
+
+
+def _group_slugs(*group_ids):
+    group_ids = {group_id for group_id in group_ids if group_id is not None}
+    if not group_ids:
+        return []
+    return list(Group.objects.filter(pk__in=group_ids)
+                .values_list('slug', flat=True))
+
+
+def _post_group_slugs(post_id):
+    return list(Post.objects.filter(pk=post_id, group__isnull=False)
+                .values_list('group__slug', flat=True))
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, **kwargs):
+    # Пост могли перенести в другую группу: ее страницы тоже устаревают.
+    if instance.pk is not None:
+        instance._previous_group_id = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    cache.bump_card(instance.pk)
+    cache.bump_generation('index')
+    cache.bump_groups(*_group_slugs(
+        instance.group_id, getattr(instance, '_previous_group_id', None)))
+    thumbnails.schedule(instance)
+    search.reindex_post.delay(instance.pk)
+    if created:
+        counters.bump_user(instance.author_id, posts_count=1)
+        paginators.adjust_count('index', 1)
+        timeline.fan_out_post.delay(instance.pk)
+        trending.record_post.delay(instance.pk)
+        notifications.schedule(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    cache.drop_card(instance.pk)
+    cache.bump_generation('index')
+    cache.bump_groups(*_group_slugs(instance.group_id))
+    search.remove_post.delay(instance.pk)
+    counters.bump_user(instance.author_id, posts_count=-1)
+    paginators.adjust_count('index', -1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_post_comments(instance.post_id, 1)
+        trending.record_comment.delay(instance.post_id)
+    cache.bump_card(instance.post_id)
+    cache.bump_comments(instance.post_id)
+    cache.bump_generation('index')
+    cache.bump_groups(*_post_group_slugs(instance.post_id))
+    search.reindex_comment.delay(instance.pk)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_post_comments(instance.post_id, -1)
+    cache.bump_card(instance.post_id)
+    cache.bump_comments(instance.post_id)
+    cache.bump_generation('index')
+    cache.bump_groups(*_post_group_slugs(instance.post_id))
+    search.remove_comment.delay(instance.post_id, instance.pk)
+
+
+@receiver(pre_save, sender=Group)
+def group_saving(sender, instance, **kwargs):
+    if instance.pk is not None:
+        instance._previous_slug = (
+            Group.objects.filter(pk=instance.pk)
+            .values_list('slug', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    cache.bump_groups(instance.slug)
+    if not created:
+        previous = getattr(instance, '_previous_slug', None)
+        if previous:
+            cache.bump_groups(previous)
+        cache.bump_group_cards.delay(instance.pk)
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    # После удаления у постов уже не будет ссылки на группу,
+    # поэтому их карточки сбрасываются сразу, а не задачей.
+    cache.bump_group_cards(instance.pk)
+    cache.bump_groups(instance.slug)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.author_id, followers_count=1)
+        counters.bump_user(instance.user_id, following_count=1)
+        paginators.forget_count(f'follow:{instance.user_id}')
+        follow_graph.followed(instance.user_id, instance.author_id)
+        timeline.backfill.delay(instance.user_id, instance.author_id)
+        trending.record_follow.delay(instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, followers_count=-1)
+    counters.bump_user(instance.user_id, following_count=-1)
+    paginators.forget_count(f'follow:{instance.user_id}')
+    follow_graph.unfollowed(instance.user_id, instance.author_id)
+    timeline.prune.delay(instance.user_id, instance.author_id)
+    if timeline.left_celebrities(instance.author_id):
+        timeline.backfill_followers.delay(instance.author_id)
@@ -0,0 +1,51 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.txt', '.html', '.json', '.xml',
+                '.map', '.ico', '.eot', '.ttf', '.otf')
+MIN_COMPRESS_SIZE = 256
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Статика с хэшем содержимого в имени и готовыми сжатыми копиями
+    рядом с файлом: `.gz` и `.br` (если установлен пакет brotli).
+    Сжатие выполняется один раз в collectstatic, а не на каждый запрос.
+    """
+
+    def post_process(self, *args, **kwargs):
+        hashed_names = set()
+        for name, hashed_name, processed in super().post_process(
+                *args, **kwargs):
+            if isinstance(hashed_name, str):
+                hashed_names.add(hashed_name)
+            yield name, hashed_name, processed
+        if kwargs.get('dry_run'):
+            return
+        for hashed_name in sorted(hashed_names):
+            self.compress(hashed_name)
+
+    def compress(self, name):
+        if os.path.splitext(name)[1].lower() not in COMPRESSIBLE:
+            return
+        with self.open(name) as source:
+            content = source.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+        variants = [('.gz', gzip.compress(content, compresslevel=9))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(content)))
+        for suffix, compressed in variants:
+            # Сжатая копия нужна, только если она заметно меньше.
+            if len(compressed) < len(content) * 0.95:
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                self._save(name + suffix, ContentFile(compressed))
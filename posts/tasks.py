@@ -0,0 +1,222 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from . import metrics
+from .models import QueuedTask
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def backend():
+    """
+    Способ выполнения задач: 'eager' (сразу, в том же потоке),
+    'thread' (пул потоков после фиксации транзакции)
+    или 'db' (очередь в БД, выполняет `manage.py run_worker`).
+    """
+    return getattr(settings, 'POSTS_TASKS_BACKEND', 'eager')
+
+
+def max_retries():
+    return getattr(settings, 'POSTS_TASKS_MAX_RETRIES', 3)
+
+
+def retry_delay(attempt):
+    """
+    Пауза перед повтором в секундах, растет вдвое с каждой попыткой.
+    """
+    return getattr(settings, 'POSTS_TASKS_RETRY_DELAY', 2) * 2 ** (attempt - 1)
+
+
+def lock_timeout():
+    """
+    Через сколько секунд задача, взятая упавшим обработчиком,
+    возвращается в очередь.
+    """
+    return getattr(settings, 'POSTS_TASKS_LOCK_TIMEOUT', 600)
+
+
+def task(func):
+    """
+    Регистрирует функцию как фоновую задачу. Функция остается
+    обычной функцией, а `func.delay(*args)` ставит ее в очередь.
+    Аргументы должны сериализоваться в JSON, поэтому в задачи
+    передаются id объектов, а не сами объекты.
+    """
+    name = f'{func.__module__}.{func.__name__}'
+    _registry[name] = func
+    func.task_name = name
+    func.delay = lambda *args, **kwargs: enqueue(name, args, kwargs)
+    return func
+
+
+def executor():
+    """
+    Общий для процесса пул потоков фоновых задач.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'POSTS_TASKS_WORKERS', 2),
+                thread_name_prefix='tasks',
+            )
+    return _executor
+
+
+def enqueue(name, args=(), kwargs=None):
+    kwargs = kwargs or {}
+    selected = backend()
+    metrics.registry.record_task(name, 'enqueued')
+    if selected == 'eager':
+        _run_eager(name, args, kwargs)
+    elif selected == 'thread':
+        transaction.on_commit(
+            lambda: executor().submit(_run_in_thread, name, args, kwargs, 1)
+        )
+    elif selected == 'db':
+        QueuedTask.objects.create(
+            name=name,
+            payload=json.dumps({'args': list(args), 'kwargs': kwargs}),
+        )
+    else:
+        raise ImproperlyConfigured(
+            f'Неизвестный POSTS_TASKS_BACKEND: {selected!r}.'
+        )
+
+
+def run(name, args, kwargs):
+    """
+    Выполняет зарегистрированную задачу и учитывает ее в метриках.
+    """
+    started = time.perf_counter()
+    try:
+        result = _registry[name](*args, **kwargs)
+    except Exception:
+        metrics.registry.record_task(name, 'failed',
+                                     time.perf_counter() - started)
+        raise
+    metrics.registry.record_task(name, 'succeeded',
+                                 time.perf_counter() - started)
+    return result
+
+
+def _run_eager(name, args, kwargs):
+    # Ошибка задачи откатывает только ее точку сохранения
+    # и не ломает запрос, в котором она запущена.
+    try:
+        with transaction.atomic():
+            run(name, args, kwargs)
+    except Exception:
+        logger.exception('Задача %s завершилась ошибкой', name)
+
+
+def _run_in_thread(name, args, kwargs, attempt):
+    close_old_connections()
+    try:
+        run(name, args, kwargs)
+    except Exception:
+        if attempt > max_retries():
+            metrics.registry.record_task(name, 'dead')
+            logger.exception('Задача %s не выполнена за %s попыток',
+                             name, attempt)
+            return
+        metrics.registry.record_task(name, 'retried')
+        timer = threading.Timer(
+            retry_delay(attempt),
+            lambda: executor().submit(_run_in_thread, name, args, kwargs,
+                                      attempt + 1),
+        )
+        timer.daemon = True
+        timer.start()
+    finally:
+        connection.close()
+
+
+def claim(limit):
+    """
+    Берет в работу до `limit` готовых задач из очереди БД.
+    Задача достается одному обработчику: ее состояние меняется
+    условным UPDATE, который проходит только у первого.
+    """
+    now = timezone.now()
+    QueuedTask.objects.filter(
+        status=QueuedTask.RUNNING,
+        locked_at__lt=now - timedelta(seconds=lock_timeout()),
+    ).update(status=QueuedTask.QUEUED, locked_at=None)
+    candidates = (QueuedTask.objects
+                  .filter(status=QueuedTask.QUEUED, run_at__lte=now)
+                  .order_by('run_at', 'pk')
+                  .values_list('pk', flat=True)[:limit])
+    claimed = [
+        pk for pk in candidates
+        if QueuedTask.objects.filter(pk=pk, status=QueuedTask.QUEUED)
+        .update(status=QueuedTask.RUNNING, locked_at=now,
+                attempts=F('attempts') + 1)
+    ]
+    return QueuedTask.objects.filter(pk__in=claimed).order_by('run_at', 'pk')
+
+
+def run_pending(limit=100):
+    """
+    Выполняет готовые задачи из очереди БД. Успешные задачи
+    удаляются, неудачные повторяются с растущей паузой,
+    а после POSTS_TASKS_MAX_RETRIES повторов помечаются failed.
+    Возвращает число обработанных задач.
+    """
+    processed = 0
+    for record in claim(limit):
+        processed += 1
+        try:
+            payload = json.loads(record.payload)
+            with transaction.atomic():
+                run(record.name, payload['args'], payload['kwargs'])
+        except Exception as error:
+            retry = record.attempts <= max_retries()
+            update = {'last_error': repr(error), 'locked_at': None}
+            if retry:
+                metrics.registry.record_task(record.name, 'retried')
+                update.update(
+                    status=QueuedTask.QUEUED,
+                    run_at=timezone.now() + timedelta(
+                        seconds=retry_delay(record.attempts)),
+                )
+            else:
+                metrics.registry.record_task(record.name, 'dead')
+                logger.exception('Задача %s не выполнена за %s попыток',
+                                 record.name, record.attempts)
+                update['status'] = QueuedTask.FAILED
+            QueuedTask.objects.filter(pk=record.pk).update(**update)
+        else:
+            record.delete()
+    return processed
+
+
+def queue_depth():
+    """
+    Число задач в очереди БД по состояниям.
+    """
+    return dict(QueuedTask.objects.values_list('status')
+                .annotate(count=Count('pk')).order_by())
+
+
+def prometheus_queue_depth():
+    if backend() != 'db':
+        return ''
+    lines = ['# TYPE yatube_task_queue_depth gauge']
+    for status, count in sorted(queue_depth().items()):
+        lines.append(f'yatube_task_queue_depth{{status="{status}"}} {count}')
+    return '\n'.join(lines) + '\n'
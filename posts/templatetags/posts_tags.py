@@ -0,0 +1,49 @@
+from django import template
+
+from posts import cache, paginators, thumbnails
+
+register = template.Library()
+
+
+@register.filter
+def card_version(post):
+    return cache.card_version(post.pk)
+
+
+@register.filter
+def comments_version(post):
+    return cache.comments_version(post.pk)
+
+
+@register.simple_tag
+def card_ttl(version=None):
+    """
+    Время жизни фрагмента; с версией - 0 для копии, которая может
+    быть прочитана с отстающей реплики.
+    """
+    if version is None:
+        return cache.card_ttl()
+    return cache.version_ttl(version)
+
+
+@register.simple_tag
+def cached_thumbnail(image, geometry, **options):
+    """
+    Миниатюра, если она уже создана; иначе None, и шаблон
+    показывает оригинал.
+    """
+    return thumbnails.cached(image, geometry, **options)
+
+
+@register.filter
+def page_window(page):
+    return paginators.page_window(page)
+
+
+@register.filter
+def last_cursor(page):
+    """
+    Курсор после последней записи страницы
+    в сортировке ее паджинатора.
+    """
+    return page.paginator.cursor_for(page[len(page) - 1])
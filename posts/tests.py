@@ -1,9 +1,40 @@
+import base64
+import gzip
+import importlib
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
 from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import Http404, HttpResponse
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
 from django.urls import reverse
+from django.utils import timezone
+
+from posts import cache as posts_cache
+from posts import (benchmark, feeds, files, follow_graph, metrics,
+                   notifications, paginators, recommendations, routers,
+                   search, tasks, timeline, transfer, trending)
+from posts.models import (Comment, Follow, Group, GroupTrend, Post,
+                          PostTrend, QueuedTask, Recommendation,
+                          TimelineEntry, User, UserStats)
 
-from posts.models import Follow, Group, Post, User
+SMALL_GIF = (
+    b"\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04"
+    b"\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02"
+    b"\x02\x4c\x01\x00\x3b"
+)
 
 
 class UrlsAndViewsTests(TestCase):
@@ -124,11 +155,7 @@ class UrlsAndViewsTests(TestCase):
         Теста на создание поста с .img-файлом.
         """
         cache.clear()
-        small_gif = (
-            b"\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04"
-            b"\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02"
-            b"\x02\x4c\x01\x00\x3b"
-        )
+        small_gif = SMALL_GIF
         img = SimpleUploadedFile(
             "small.gif",
             small_gif,
@@ -195,15 +222,31 @@ class UrlsAndViewsTests(TestCase):
 
     def test_cash(self):
         """
-        Тест кэширования главной страницы(index).
+        Тест кэширования главной страницы(index): страница отдается
+        из кэша, пока не появится новый пост.
         """
         first = self.anonym.get(reverse('index'))
-        Post.objects.create(text='Cache check', author=self.user)
         second = self.anonym.get(reverse('index'))
-        cache.clear()
-        third = self.anonym.get(reverse('index'))
+        self.assertIsNone(second.context)
         self.assertEqual(first.content, second.content)
+        Post.objects.create(text='Cache check', author=self.user)
+        third = self.anonym.get(reverse('index'))
         self.assertNotEqual(second.content, third.content)
+        self.assertContains(third, 'Cache check')
+
+    def test_cash_stale_while_revalidate(self):
+        """
+        Тест на отдачу устаревшей страницы, пока другой процесс
+        перестраивает ее после инвалидации.
+        """
+        cache.clear()
+        first = self.anonym.get(reverse('index'))
+        Post.objects.create(text='Cache check', author=self.user)
+        with mock.patch.object(cache, 'add', return_value=False):
+            stale = self.anonym.get(reverse('index'))
+        self.assertEqual(first.content, stale.content)
+        fresh = self.anonym.get(reverse('index'))
+        self.assertContains(fresh, 'Cache check')
 
     def test_auth_comment(self):
         """
@@ -266,3 +309,1662 @@ class UrlsAndViewsTests(TestCase):
         self.assertFalse(
             Follow.objects.filter(author=self.second_user,
                                   user=self.user).exists())
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='cursor_user')
+        self.client = Client()
+        self.posts = [
+            Post.objects.create(text=f'Пост {number}', author=self.user)
+            for number in range(25)
+        ]
+
+    def test_cursor_pages_cover_feed(self):
+        """
+        Тест на обход всей ленты курсорными страницами без пропусков.
+        """
+        seen = []
+        response = self.client.get(reverse('index'), {'after': ''})
+        while True:
+            page = response.context['page']
+            seen.extend(post.pk for post in page)
+            if not page.has_next():
+                break
+            response = self.client.get(reverse('index'),
+                                       {'after': page.next_cursor()})
+        expected = list(Post.objects.order_by('-pub_date', '-id')
+                        .values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_cursor_with_equal_pub_date(self):
+        """
+        Тест на корректный порядок постов с одинаковой датой публикации.
+        """
+        Post.objects.update(pub_date=self.posts[0].pub_date)
+        response = self.client.get(
+            reverse('profile', kwargs={'username': self.user.username}),
+            {'after': ''},
+        )
+        page = response.context['page']
+        second = self.client.get(
+            reverse('profile', kwargs={'username': self.user.username}),
+            {'after': page.next_cursor()},
+        ).context['page']
+        self.assertEqual(len(second), 10)
+        self.assertTrue(second.has_previous())
+        previous = self.client.get(
+            reverse('profile', kwargs={'username': self.user.username}),
+            {'before': second.previous_cursor()},
+        ).context['page']
+        self.assertEqual([post.pk for post in previous],
+                         [post.pk for post in page])
+
+    def test_broken_cursor_returns_first_page(self):
+        """
+        Тест на отображение первой страницы при поврежденном курсоре.
+        """
+        response = self.client.get(reverse('index'), {'after': '%%%'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page'][0], self.posts[-1])
+
+    def test_impossible_cursor_values_return_first_page(self):
+        """
+        Тест на первую страницу для курсора с невозможной датой,
+        датой без часового пояса или слишком большим id.
+        """
+        cursors = (
+            '2020-13-45T00:00:00+00:00|1',
+            '2020-02-30T00:00:00+00:00|1',
+            '2020-01-01T00:00:00|1',
+            '2020-01-01T00:00:00+00:00|99999999999999999999999',
+        )
+        for raw in cursors:
+            cursor = base64.urlsafe_b64encode(raw.encode()).decode()
+            for param in ('after', 'before'):
+                with self.subTest(raw=raw, param=param):
+                    response = self.client.get(reverse('index'),
+                                               {param: cursor})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.context['page'][0],
+                                     self.posts[-1])
+        post = self.posts[0]
+        cursor = base64.urlsafe_b64encode(
+            cursors[-1].encode()).decode()
+        response = self.client.get(
+            reverse('post', args=[post.author.username, post.pk]),
+            {'comments_after': cursor})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            reverse('post_comments', args=[post.author.username, post.pk]),
+            {'after': cursor})
+        self.assertEqual(response.status_code, 200)
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='budget_user')
+        self.reader = User.objects.create_user(username='budget_reader')
+        self.group = Group.objects.create(title='Budget', slug='budget',
+                                          description='Тест')
+        Follow.objects.create(user=self.reader, author=self.user)
+        for number in range(15):
+            post = Post.objects.create(text=f'Пост {number}',
+                                       author=self.user, group=self.group)
+            Comment.objects.create(post=post, author=self.reader,
+                                   text='Комментарий')
+        self.post = post
+        UserStats.objects.for_user(self.user)
+        self.anonym = Client()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_feed_query_budget(self):
+        """
+        Тест на число запросов к БД при отображении лент.
+        """
+        budgets = (
+            (self.anonym, reverse('index'), 2),
+            (self.anonym, reverse('group', args=[self.group.slug]), 3),
+            (self.anonym, reverse('profile', args=[self.user.username]), 3),
+            (self.anonym, reverse('post', args=[self.user.username,
+                                                self.post.pk]), 3),
+            (self.client, reverse('follow_index'), 6),
+        )
+        for client, url, budget in budgets:
+            with self.subTest(url=url):
+                with self.assertNumQueries(budget):
+                    response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+
+class CountersTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='counter_author')
+        self.reader = User.objects.create_user(username='counter_reader')
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_counters_follow_writes(self):
+        """
+        Тест на обновление счетчиков при создании поста, комментария
+        и подписке.
+        """
+        UserStats.objects.for_user(self.author)
+        UserStats.objects.for_user(self.reader)
+        post = Post.objects.create(text='Пост', author=self.author)
+        self.client.post(reverse('add_comment',
+                                 args=[self.author.username, post.pk]),
+                         {'text': 'Комментарий'})
+        self.client.get(reverse('profile_follow',
+                                args=[self.author.username]))
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        author_stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 1)
+        self.client.get(reverse('profile_unfollow',
+                                args=[self.author.username]))
+        post.comments.all().delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).followers_count, 0)
+
+    def test_recount_command_repairs_counters(self):
+        """
+        Тест на восстановление счетчиков командой recount_counters.
+        """
+        post = Post.objects.create(text='Пост', author=self.author)
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.update(comment_count=42)
+        UserStats.objects.update(posts_count=42, followers_count=42)
+        call_command('recount_counters', stdout=open(os.devnull, 'w'))
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual((stats.posts_count, stats.followers_count,
+                          stats.following_count), (1, 1, 0))
+
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='timeline_author')
+        self.reader = User.objects.create_user(username='timeline_reader')
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_fan_out_backfill_and_prune(self):
+        """
+        Тест на заполнение ленты при подписке и новом посте
+        и на очистку при отписке.
+        """
+        old_post = Post.objects.create(text='Старый пост', author=self.author)
+        self.client.get(reverse('profile_follow',
+                                args=[self.author.username]))
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        entries = TimelineEntry.objects.filter(user=self.reader)
+        self.assertEqual(
+            set(entries.values_list('post_id', flat=True)),
+            {old_post.pk, new_post.pk},
+        )
+        response = self.client.get(reverse('follow_index'))
+        self.assertEqual(list(response.context['page']), [new_post, old_post])
+        self.client.get(reverse('profile_unfollow',
+                                args=[self.author.username]))
+        self.assertFalse(entries.exists())
+
+    def test_follow_feed_reads_timeline_index(self):
+        """
+        Тест на чтение ленты подписок диапазоном индекса записей
+        ленты без сортировки во временном B-дереве и на курсор
+        по столбцам TimelineEntry.
+        """
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [Post.objects.create(text=f'Пост {number}', author=self.author)
+                 for number in range(3)][::-1]
+        feed = feeds.follow_feed(self.reader)
+        sql, params = feed[:10].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('timeline_user_pub_date_post', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        response = self.client.get(
+            reverse('follow_index'),
+            {'after': paginators.feed_cursor(posts[0])})
+        self.assertEqual(list(response.context['page']), posts[1:])
+
+    def test_tasks_recheck_follow(self):
+        """
+        Тест на задачи ленты, выполненные не по порядку: заполнение
+        после отписки и очистка после повторной подписки.
+        """
+        post = Post.objects.create(text='Пост', author=self.author)
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        timeline.prune(self.reader.pk, self.author.pk)
+        entries = TimelineEntry.objects.filter(user=self.reader)
+        self.assertEqual(list(entries.values_list('post_id', flat=True)),
+                         [post.pk])
+        follow.delete()
+        timeline.backfill(self.reader.pk, self.author.pk)
+        self.assertFalse(entries.exists())
+
+    @override_settings(POSTS_TIMELINE_FANOUT_LIMIT=2)
+    def test_backfill_when_author_leaves_celebrities(self):
+        """
+        Тест на заполнение лент постами, опубликованными без рассылки,
+        когда автор опускается ниже порога популярности.
+        """
+        other = User.objects.create_user(username='timeline_other')
+        UserStats.objects.for_user(self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        follow = Follow.objects.create(user=other, author=self.author)
+        post = Post.objects.create(text='Пост', author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists())
+        follow.delete()
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list('user_id', 'post_id')),
+            [(self.reader.pk, post.pk)])
+
+    @override_settings(POSTS_TIMELINE_FANOUT_LIMIT=1)
+    def test_celebrity_posts_read_on_demand(self):
+        """
+        Тест на чтение постов популярного автора без записи в ленты.
+        """
+        UserStats.objects.for_user(self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text='Пост', author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists())
+        response = self.client.get(reverse('follow_index'))
+        self.assertEqual(list(response.context['page']), [post])
+
+
+class PostCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='card_author')
+        self.reader = User.objects.create_user(username='card_reader')
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.post = Post.objects.create(text='Первый текст',
+                                        author=self.author)
+        self.url = reverse('profile', args=[self.author.username])
+        self.edit_url = reverse('post_edit',
+                                args=[self.author.username, self.post.pk])
+
+    def test_card_invalidated_on_edit_and_comment(self):
+        """
+        Тест на обновление карточки поста после редактирования
+        и добавления комментария.
+        """
+        self.assertContains(self.reader_client.get(self.url), 'Первый текст')
+        self.author_client.post(self.edit_url, {'text': 'Второй текст'})
+        response = self.reader_client.get(self.url)
+        self.assertContains(response, 'Второй текст')
+        self.assertNotContains(response, 'Первый текст')
+        self.reader_client.post(
+            reverse('add_comment', args=[self.author.username, self.post.pk]),
+            {'text': 'Комментарий'})
+        self.assertContains(self.reader_client.get(self.url),
+                            'Комментариев: 1')
+
+    def test_edit_button_not_cached(self):
+        """
+        Тест на то, что кнопка редактирования не попадает в общий кэш.
+        """
+        self.assertContains(self.author_client.get(self.url), self.edit_url)
+        self.assertNotContains(self.reader_client.get(self.url),
+                               self.edit_url)
+
+
+class SharedCacheTests(SimpleTestCase):
+    script = (
+        'import django, sys; django.setup(); '
+        'from posts import cache; '
+        'action = sys.argv[1]; '
+        'action == "bump" and cache.bump_generation("index"); '
+        'action == "bump" and cache.bump_card(1); '
+        'print(cache.generation("index"), cache.card_version(1))'
+    )
+
+    def run_worker(self, location, action):
+        env = dict(os.environ,
+                   DJANGO_SETTINGS_MODULE='yatube.settings',
+                   YATUBE_CACHE='file',
+                   YATUBE_CACHE_LOCATION=location)
+        result = subprocess.run(
+            [sys.executable, '-c', self.script, action],
+            env=env, stdout=subprocess.PIPE, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        return result.stdout.decode().split()
+
+    def test_cross_process_invalidation(self):
+        """
+        Тест на то, что инвалидация в одном процессе видна в другом
+        при общем файловом кэше.
+        """
+        with tempfile.TemporaryDirectory() as location:
+            first = self.run_worker(location, 'read')
+            self.assertEqual(self.run_worker(location, 'read'), first)
+            bumped = self.run_worker(location, 'bump')
+            after = self.run_worker(location, 'read')
+            self.assertEqual(after, bumped)
+            self.assertGreater(int(after[0]), int(first[0]))
+            self.assertNotEqual(after[1], first[1])
+
+
+class ThumbnailTests(TestCase):
+    def test_generate_creates_all_sizes(self):
+        """
+        Тест на создание миниатюр всех размеров для изображения поста.
+        """
+        from sorl.thumbnail import default
+        from sorl.thumbnail.images import ImageFile
+
+        from posts import thumbnails
+
+        user = User.objects.create_user(username='thumb_user')
+        image = SimpleUploadedFile('thumb.gif', SMALL_GIF,
+                                   content_type='image/gif')
+        post = Post.objects.create(text='Пост', author=user, image=image)
+        self.assertEqual(thumbnails.generate(post.pk),
+                         len(thumbnails.THUMBNAIL_SIZES))
+        source = ImageFile(post.image)
+        self.assertIsNotNone(default.kvstore.get(source))
+
+    @override_settings(POSTS_TASKS_BACKEND='db')
+    def test_page_shows_original_until_generated(self):
+        """
+        Тест на то, что страница не создает миниатюру, а показывает
+        оригинал, пока миниатюру не создаст фоновая задача.
+        """
+        from sorl.thumbnail.base import ThumbnailBackend
+
+        from posts import thumbnails
+
+        cache.clear()
+        user = User.objects.create_user(username='thumb_page_user')
+        image = SimpleUploadedFile('page.gif', SMALL_GIF,
+                                   content_type='image/gif')
+        post = Post.objects.create(text='Пост', author=user, image=image)
+        url = reverse('post', args=[user.username, post.pk])
+        with mock.patch.object(ThumbnailBackend,
+                               'get_thumbnail') as generate:
+            response = self.client.get(url)
+        generate.assert_not_called()
+        self.assertContains(response, f'src="{post.image.url}"')
+        thumbnails.generate(post.pk)
+        thumbnail = thumbnails.cached(post.image, '960x339',
+                                      crop='center', upscale=True)
+        self.assertIsNotNone(thumbnail)
+        response = self.client.get(url)
+        self.assertContains(response, f'src="{thumbnail.url}"')
+
+
+class ImageUploadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='upload_user')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def jpeg_with_exif(self, size):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x010f] = 'Camera'
+        Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(),
+                                  content_type='image/jpeg')
+
+    @override_settings(POSTS_IMAGE_MAX_UPLOAD_SIZE=100)
+    def test_oversized_upload_rejected(self):
+        """
+        Тест на отклонение файла больше допустимого размера.
+        """
+        response = self.client.post(reverse('new_post'), {
+            'text': 'Большой файл',
+            'image': self.jpeg_with_exif((200, 200)),
+        })
+        self.assertFalse(Post.objects.filter(text='Большой файл').exists())
+        self.assertFormError(response, 'form', 'image',
+                             'Размер файла не должен превышать 100\xa0байт.')
+
+    @override_settings(POSTS_IMAGE_MAX_UPLOAD_SIZE=100)
+    def test_oversized_upload_rejected_in_admin(self):
+        """
+        Тест на отклонение файла больше допустимого размера в админке.
+        """
+        admin = User.objects.create_superuser(
+            username='upload_admin', email='admin@example.com',
+            password='password')
+        self.client.force_login(admin)
+        response = self.client.post(reverse('admin:posts_post_add'), {
+            'text': 'Большой файл',
+            'author': admin.pk,
+            'image': self.jpeg_with_exif((200, 200)),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Post.objects.filter(text='Большой файл').exists())
+        self.assertFormError(response, 'adminform', 'image',
+                             'Размер файла не должен превышать 100\xa0байт.')
+
+    @override_settings(POSTS_IMAGE_MAX_PIXELS=100)
+    def test_huge_dimensions_rejected(self):
+        """
+        Тест на отклонение изображения со слишком большим разрешением.
+        """
+        response = self.client.post(reverse('new_post'), {
+            'text': 'Огромное изображение',
+            'image': self.jpeg_with_exif((200, 200)),
+        })
+        self.assertFalse(
+            Post.objects.filter(text='Огромное изображение').exists())
+        self.assertTrue(response.context['form'].errors['image'])
+
+    @override_settings(POSTS_IMAGE_MAX_DIMENSION=50)
+    def test_image_downscaled_and_exif_stripped(self):
+        """
+        Тест на уменьшение изображения и удаление EXIF при загрузке.
+        """
+        from PIL import Image
+
+        self.client.post(reverse('new_post'), {
+            'text': 'Фото',
+            'image': self.jpeg_with_exif((200, 100)),
+        })
+        post = Post.objects.get(text='Фото')
+        with Image.open(post.image) as image:
+            self.assertEqual(image.size, (50, 25))
+            self.assertFalse(image.getexif())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='search_user')
+        self.client = Client()
+        self.first = Post.objects.create(
+            text='Кошки любят спать на тёплых подоконниках',
+            author=self.user)
+        self.second = Post.objects.create(
+            text='Про собак и кошку', author=self.user)
+        Comment.objects.create(post=self.second, author=self.user,
+                               text='Подоконник тоже подойдет')
+
+    def search(self, query):
+        response = self.client.get(reverse('search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['page'])
+
+    def check_backend(self):
+        self.assertCountEqual(self.search('кошка'),
+                              [self.first, self.second])
+        self.assertEqual(self.search('теплый подоконник'), [self.first])
+        self.assertCountEqual(self.search('подоконнике'),
+                              [self.first, self.second])
+        self.assertEqual(self.search('слон'), [])
+        self.second.delete()
+        self.assertEqual(self.search('подоконник'), [self.first])
+
+    def test_search_fts5(self):
+        """
+        Тест поиска по индексу FTS5.
+        """
+        self.assertIsInstance(search.get_backend(), search.FTS5Backend)
+        self.check_backend()
+
+    def test_fts5_documents_by_rowid(self):
+        """
+        Тест на замену и удаление документа FTS5 по rowid
+        без полного просмотра таблицы индекса.
+        """
+        self.first.text = 'Про слонов'
+        self.first.save()
+        self.assertEqual(self.search('слон'), [self.first])
+        self.assertEqual(self.search('подоконник'), [self.second])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'EXPLAIN QUERY PLAN DELETE FROM {search.FTS_TABLE} '
+                f'WHERE rowid = %s',
+                [search.document_rowid(self.first.pk, None)])
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        # "INDEX 0:=" - поиск по rowid, "INDEX 0:" - полный просмотр.
+        self.assertTrue(plan.endswith(':='), plan)
+
+    def test_search_inverted_index(self):
+        """
+        Тест поиска по инвертированному индексу на случай БД без FTS5.
+        """
+        with mock.patch.object(search, 'fts5_available',
+                               return_value=False):
+            search.rebuild()
+            self.check_backend()
+
+    def test_rebuild_command(self):
+        """
+        Тест на восстановление индекса командой rebuild_search_index.
+        """
+        search.get_backend().clear()
+        self.assertEqual(self.search('кошка'), [])
+        call_command('rebuild_search_index', stdout=open(os.devnull, 'w'))
+        self.assertEqual(len(self.search('кошка')), 2)
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_summarize(self):
+        """
+        Тест сводки замеров нагрузочного теста.
+        """
+        summary = benchmark.summarize(
+            [float(value) for value in range(1, 101)], [2, 4], 2.0)
+        self.assertEqual(summary['requests'], 100)
+        self.assertEqual(summary['p50_ms'], 50)
+        self.assertEqual(summary['p95_ms'], 95)
+        self.assertEqual(summary['p99_ms'], 99)
+        self.assertEqual(summary['queries_per_request'], 3)
+        self.assertEqual(summary['requests_per_second'], 50)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.client = Client()
+        self.user = User.objects.create_user(username='metrics_user')
+        self.post = Post.objects.create(text='Текст', author=self.user)
+
+    def test_view_metrics(self):
+        """
+        Тест на замеры запросов, SQL, шаблонов и кэша страниц.
+        """
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        self.client.get(reverse('post', args=[self.user.username,
+                                              self.post.pk]))
+        views = metrics.registry.snapshot()['views']
+        self.assertEqual(views['index']['requests'], 2)
+        self.assertEqual(views['index']['cache']['page'],
+                         {'miss': 1, 'hit': 1})
+        self.assertEqual(views['post']['statuses'], {200: 1})
+        self.assertGreater(views['post']['queries'], 0)
+        self.assertGreater(views['post']['template_ms'], 0)
+
+    def test_fragment_and_version_cache_metrics(self):
+        """
+        Тест на учет попаданий в кэш фрагментов и версий карточек,
+        а не только страниц целиком.
+        """
+        url = reverse('post', args=[self.user.username, self.post.pk])
+        self.client.get(url)
+        self.client.get(url)
+        cache_stats = metrics.registry.snapshot()['views']['post']['cache']
+        self.assertEqual(cache_stats['fragment:post_card'],
+                         {'miss': 1, 'hit': 1})
+        self.assertIn('hit', cache_stats['card:version'])
+        self.assertIn('hit', cache_stats['fragment:post_comments'])
+        self.assertEqual(metrics.cache_name('posts:group:slug:page:1:abc'),
+                         'group')
+        self.assertEqual(metrics.cache_name('sorl-thumbnail||image'),
+                         'other')
+
+    @override_settings(POSTS_METRICS_SLOW_MS=0)
+    def test_slow_samples(self):
+        """
+        Тест на сохранение запросов SQL медленных страниц.
+        """
+        self.client.get(reverse('profile', args=[self.user.username]))
+        sample = metrics.registry.snapshot()['slow'][-1]
+        self.assertEqual(sample['view'], 'profile')
+        self.assertTrue(any('posts_post' in sql
+                            for sql, _ in sample['queries']))
+
+    @override_settings(INTERNAL_IPS=[], POSTS_METRICS_TOKEN='secret')
+    def test_metrics_endpoint(self):
+        """
+        Тест на доступ к метрикам и формат Prometheus.
+        """
+        self.client.get(reverse('index'))
+        self.assertEqual(
+            self.client.get(reverse('metrics')).status_code, 404)
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(
+            response,
+            'yatube_request_duration_seconds_count{view="index"} 1')
+        self.assertContains(
+            response,
+            'yatube_page_cache_total{view="index",cache="page",'
+            'result="miss"} 1')
+
+
+class ProductionSettingsTests(SimpleTestCase):
+    def test_sqlite_pragmas(self):
+        """
+        Тест на настройку соединения SQLite в production.
+        """
+        from django.db import connection
+
+        from yatube.backends.sqlite3.base import DatabaseWrapper
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = DatabaseWrapper({
+                **connection.settings_dict,
+                'NAME': os.path.join(directory, 'db.sqlite3'),
+                'PRAGMAS': {'busy_timeout': 1234},
+            })
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('PRAGMA busy_timeout')
+                    self.assertEqual(cursor.fetchone()[0], 1234)
+            finally:
+                wrapper.close()
+
+    def load_production(self, **environ):
+        sys.modules.pop('yatube.settings_production', None)
+        with mock.patch.dict(os.environ, environ):
+            return importlib.import_module('yatube.settings_production')
+
+    def test_production_profile(self):
+        """
+        Тест на профиль настроек production.
+        """
+        settings_production = self.load_production(
+            YATUBE_SECRET_KEY='production-key')
+        self.assertEqual(settings_production.SECRET_KEY, 'production-key')
+        self.assertFalse(settings_production.DEBUG)
+        self.assertEqual(settings_production.INTERNAL_IPS, [])
+        self.assertNotIn('debug_toolbar', settings_production.INSTALLED_APPS)
+        self.assertFalse(any('debug_toolbar' in middleware
+                             for middleware in settings_production.MIDDLEWARE))
+        database = settings_production.DATABASES['default']
+        self.assertGreater(database['CONN_MAX_AGE'], 0)
+        loaders = settings_production.TEMPLATES[0]['OPTIONS']['loaders']
+        self.assertEqual(loaders[0][0],
+                         'django.template.loaders.cached.Loader')
+
+    def test_production_requires_secret_key(self):
+        """
+        Тест на отказ запускаться в production без YATUBE_SECRET_KEY.
+        """
+        with self.assertRaises(ImproperlyConfigured):
+            self.load_production(YATUBE_SECRET_KEY='')
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.author = User.objects.create_user(username='transfer_author')
+        self.reader = User.objects.create_user(username='transfer_reader')
+        self.group = Group.objects.create(title='Группа', slug='transfer')
+        self.post = Post.objects.create(
+            text='Первая строка,\n"вторая" строка', author=self.author,
+            group=self.group)
+        Post.objects.create(text='Без группы', author=self.reader)
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Комментарий')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.pub_date = self.post.pub_date
+
+    def command(self, *args):
+        call_command(*args, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def check_roundtrip(self, source):
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        self.command('import_posts', source)
+        self.assertEqual(Post.objects.count(), 2)
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.text, self.post.text)
+        self.assertEqual(post.pub_date, self.pub_date)
+        self.assertEqual(post.group.slug, 'transfer')
+        self.assertEqual(post.comment_count, 1)
+        self.assertFalse(post.author.has_usable_password())
+        self.assertEqual(self.author.stats.followers_count, 1)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        self.assertEqual(search.get_backend().search_posts('вторая'),
+                         [post.pk])
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(
+            source)])
+
+    def test_ndjson_roundtrip(self):
+        """
+        Тест на выгрузку и загрузку в формате NDJSON.
+        """
+        path = os.path.join(self.directory, 'posts.ndjson')
+        self.command('export_posts', path)
+        self.check_roundtrip(path)
+
+    def test_csv_roundtrip(self):
+        """
+        Тест на выгрузку и загрузку в формате CSV.
+        """
+        path = os.path.join(self.directory, 'csv')
+        self.command('export_posts', path, '--format', 'csv')
+        self.check_roundtrip(path)
+
+    def test_users_keep_credentials(self):
+        """
+        Тест на перенос хэшей паролей и прав пользователей, а с
+        --anonymize-users - на выгрузку без них.
+        """
+        admin = User.objects.create_superuser(
+            username='transfer_admin', email='admin@example.com',
+            password='secret')
+        User.objects.filter(pk=self.reader.pk).update(is_active=False)
+        for options in ((), ('--format', 'csv')):
+            with self.subTest(options=options):
+                path = os.path.join(self.directory, f'out{len(options)}')
+                self.command('export_posts', path, *options)
+                User.objects.all().delete()
+                self.command('import_posts', path)
+                restored = User.objects.get(pk=admin.pk)
+                self.assertTrue(restored.check_password('secret'))
+                self.assertTrue(restored.is_staff)
+                self.assertTrue(restored.is_superuser)
+                self.assertTrue(restored.is_active)
+                self.assertFalse(
+                    User.objects.get(pk=self.reader.pk).is_active)
+                self.assertFalse(
+                    User.objects.get(pk=self.author.pk).is_staff)
+
+        path = os.path.join(self.directory, 'anonymous.ndjson')
+        self.command('export_posts', path, '--anonymize-users')
+        User.objects.all().delete()
+        self.command('import_posts', path)
+        restored = User.objects.get(pk=admin.pk)
+        self.assertFalse(restored.has_usable_password())
+        self.assertFalse(restored.is_staff)
+        self.assertFalse(restored.is_superuser)
+
+    def test_resume(self):
+        """
+        Тест на продолжение загрузки с контрольной точки после сбоя.
+        """
+        path = os.path.join(self.directory, 'posts.ndjson')
+        self.command('export_posts', path)
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        save_batch = transfer.save_batch
+        saved = []
+
+        def failing_save(kind, records):
+            if kind == 'post':
+                raise RuntimeError('Сбой')
+            saved.append(kind)
+            save_batch(kind, records)
+
+        with mock.patch.object(transfer, 'save_batch', failing_save):
+            with self.assertRaises(RuntimeError):
+                self.command('import_posts', path, '--batch-size', '1')
+        self.assertEqual(saved, ['group', 'user', 'user'])
+        self.assertTrue(os.path.exists(f'{path}.checkpoint'))
+        with mock.patch.object(transfer, 'save_batch',
+                               wraps=save_batch) as resumed:
+            self.command('import_posts', path, '--batch-size', '1')
+        self.assertEqual(resumed.call_args_list[0][0][0], 'post')
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    def test_conflicting_user(self):
+        """
+        Тест на отказ загрузки, если id пользователя занят другим.
+        """
+        path = os.path.join(self.directory, 'posts.ndjson')
+        self.command('export_posts', path)
+        User.objects.filter(pk=self.author.pk).update(username='other')
+        with self.assertRaises(CommandError):
+            self.command('import_posts', path)
+
+    def test_natural_key_taken_by_other_id(self):
+        """
+        Тест на отказ загрузки, если адрес группы или имя пользователя
+        в БД принадлежит записи с другим id.
+        """
+        path = os.path.join(self.directory, 'posts.ndjson')
+        self.command('export_posts', path)
+        Post.objects.all().delete()
+        Group.objects.all().delete()
+        Group.objects.create(title='Чужая', slug='transfer')
+        with self.assertRaises(CommandError):
+            self.command('import_posts', path)
+        self.assertFalse(Post.objects.exists())
+
+        with self.assertRaises(transfer.TransferError):
+            transfer.save_batch('user', [
+                {'id': pk, 'username': 'twin',
+                 'date_joined': '2020-01-01T00:00:00+00:00'}
+                for pk in (1000, 1001)
+            ])
+
+
+class CommentPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='comment_author')
+        self.post = Post.objects.create(text='Популярный пост',
+                                        author=self.author)
+        for number in range(25):
+            Comment.objects.create(post=self.post, author=self.author,
+                                   text=f'Комментарий {number}')
+        UserStats.objects.for_user(self.author)
+        self.url = reverse('post', args=[self.author.username, self.post.pk])
+        self.client = Client()
+
+    def test_first_page(self):
+        """
+        Тест на первую страницу комментариев и ссылку "Показать еще".
+        """
+        response = self.client.get(self.url)
+        comments = list(response.context['comments_page'])
+        self.assertEqual(len(comments), 20)
+        self.assertEqual(list(response.context['comments']), comments)
+        self.assertEqual(comments[0].text, 'Комментарий 24')
+        self.assertContains(response, 'Показать еще')
+        older = self.client.get(
+            self.url,
+            {'comments_after':
+             response.context['comments_page'].next_cursor()})
+        self.assertEqual([comment.text for comment in older.context[
+            'comments_page']][-1], 'Комментарий 0')
+        self.assertNotContains(older, 'Показать еще')
+
+    def test_load_more(self):
+        """
+        Тест на подгрузку комментариев в JSON.
+        """
+        response = self.client.get(self.url)
+        cursor = response.context['comments_page'].next_cursor()
+        response = self.client.get(
+            reverse('post_comments', args=[self.author.username,
+                                           self.post.pk]),
+            {'after': cursor})
+        data = response.json()
+        self.assertIsNone(data['next'])
+        self.assertEqual(data['html'].count('media card'), 5)
+        self.assertIn('Комментарий 0', data['html'])
+
+    def test_cached_first_page(self):
+        """
+        Тест на кэш первой страницы и его сброс новым комментарием.
+        """
+        self.client.get(self.url)
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+        reader = User.objects.create_user(username='comment_reader')
+        self.client.force_login(reader)
+        self.client.post(
+            reverse('add_comment', args=[self.author.username,
+                                         self.post.pk]),
+            {'text': 'Свежий комментарий'})
+        self.assertContains(self.client.get(self.url), 'Свежий комментарий')
+
+
+@override_settings(POSTS_REPLICAS=['replica_a', 'replica_b'])
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        routers.reset()
+        self.router = routers.ReplicaRouter()
+        self.addCleanup(routers.reset)
+        lag = mock.patch.object(routers, 'replica_lag', return_value=0)
+        self.lag = lag.start()
+        self.addCleanup(lag.stop)
+
+    def read(self):
+        # TestCase выполняет тест внутри транзакции, а в транзакции
+        # чтение всегда идет в основную БД.
+        with mock.patch.object(connection, 'in_atomic_block', False):
+            return self.router.db_for_read(Post)
+
+    def test_round_robin(self):
+        """
+        Тест на чтение с реплик по кругу только в представлениях ленты.
+        """
+        self.assertEqual(self.read(), 'default')
+        with routers.replica_reads():
+            self.assertEqual({self.read(), self.read()},
+                             {'replica_a', 'replica_b'})
+
+    @override_settings(POSTS_REPLICA_SELECTION='least_lag')
+    def test_least_lag(self):
+        """
+        Тест на выбор реплики с наименьшим отставанием.
+        """
+        self.lag.side_effect = {'replica_a': 3, 'replica_b': 1}.get
+        with routers.replica_reads():
+            self.assertEqual(self.read(), 'replica_b')
+            self.lag.side_effect = {'replica_a': 30, 'replica_b': 10}.get
+            self.assertEqual(self.read(), 'default')
+
+    def test_read_your_writes(self):
+        """
+        Тест на чтение из основной БД после записи.
+        """
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_write(Post), 'default')
+            self.assertEqual(self.read(), 'default')
+
+    def test_cache_fills_read_primary(self):
+        """
+        Тест на заполнение кэша страниц и групп по основной БД
+        и на отказ хранить карточку, версия которой только что
+        сменилась, если данные прочитаны с реплики.
+        """
+        reads = []
+
+        def read_group(*args, **kwargs):
+            reads.append(self.read())
+            return Group.objects.none()
+
+        with routers.replica_reads():
+            with mock.patch.object(Group.objects, 'filter', read_group):
+                posts_cache.group_meta('replica_group')
+            self.assertEqual(reads, ['default'])
+
+            page = posts_cache.generation_cache_page('replica_test')(
+                lambda request: HttpResponse(self.read()))
+            request = RequestFactory().get('/replica-test/')
+            request.user = User(username='replica_reader', pk=0)
+            self.assertEqual(page(request).content, b'default')
+
+            posts_cache.bump_card(1)
+            version = posts_cache.card_version(1)
+            self.assertEqual(posts_cache.version_ttl(version), 0)
+            with routers.primary_reads():
+                self.assertEqual(posts_cache.version_ttl(version),
+                                 posts_cache.card_ttl())
+
+    def test_recount_reads_primary(self):
+        """
+        Тест на пересчет счетчиков пользователя по основной БД
+        в представлении, читающем с реплик.
+        """
+        user = User.objects.create_user(username='replica_counts')
+        Post.objects.create(text='Пост', author=user)
+        routers.reset()
+        # Реплик replica_a и replica_b нет в DATABASES: чтение
+        # с них завершилось бы ошибкой.
+        with routers.replica_reads(), \
+                mock.patch.object(connection, 'in_atomic_block', False), \
+                mock.patch.object(UserStats.objects, 'update_or_create',
+                                  return_value=(None, True)) as save:
+            UserStats.objects.recount(user)
+        self.assertEqual(save.call_args[1]['defaults']['posts_count'], 1)
+
+    def test_pin_cookie(self):
+        """
+        Тест на закрепление за основной БД после записи через сайт.
+        """
+        user = User.objects.create_user(username='replica_user')
+        client = Client()
+        client.force_login(user)
+        self.assertNotIn(routers.PIN_COOKIE, client.get('/').cookies)
+        response = client.post(reverse('new_post'), {'text': 'Пост'})
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        with mock.patch.object(routers, 'pin',
+                               wraps=routers.pin) as pin:
+            client.get(reverse('index'))
+        pin.assert_called_once_with()
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='etag_author')
+        self.reader = User.objects.create_user(username='etag_reader')
+        self.post = Post.objects.create(text='Пост', author=self.author)
+        UserStats.objects.for_user(self.author)
+        self.client = Client()
+
+    def revalidate(self, url):
+        etag = self.client.get(url)['ETag']
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_index_not_modified(self):
+        """
+        Тест на ответ 304 без запросов к БД и сброс ETag новым постом.
+        """
+        url = reverse('index')
+        response = self.client.get(url)
+        self.assertIn('private', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            repeat = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeat.status_code, 304)
+        Post.objects.create(text='Новый пост', author=self.author)
+        fresh = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertContains(fresh, 'Новый пост')
+
+    def test_profile_etag(self):
+        """
+        Тест на смену ETag профиля после подписки.
+        """
+        url = reverse('profile', args=[self.author.username])
+        self.assertEqual(self.revalidate(url).status_code, 304)
+        etag = self.client.get(url)['ETag']
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_profile_etag_ignores_other_authors(self):
+        """
+        Тест на 304 для профиля после поста другого автора и на смену
+        ETag после правки поста автора и подписки зрителя.
+        """
+        url = reverse('profile', args=[self.author.username])
+        self.client.force_login(self.reader)
+        etag = self.client.get(url)['ETag']
+        Post.objects.create(text='Чужой пост', author=self.reader)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.post.text = 'Исправленный пост'
+        self.post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Исправленный пост')
+        etag = response['ETag']
+        self.client.get(reverse('profile_follow',
+                                args=[self.author.username]))
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_post_etag(self):
+        """
+        Тест на смену ETag поста после комментария и для другого зрителя.
+        """
+        url = reverse('post', args=[self.author.username, self.post.pk])
+        self.assertEqual(self.revalidate(url).status_code, 304)
+        etag = self.client.get(url)['ETag']
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Комментарий')
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.reader)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class FileServingTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.content = b'body { color: black; }\n' * 100
+        self.name = 'site.0123456789ab.css'
+        with open(os.path.join(self.root, self.name), 'wb') as output:
+            output.write(self.content)
+        with open(os.path.join(self.root, self.name + '.gz'), 'wb') as output:
+            output.write(gzip.compress(self.content))
+        self.factory = RequestFactory()
+
+    def serve(self, location='static', name=None, **headers):
+        request = self.factory.get('/', **headers)
+        return files.serve(request, name or self.name, self.root, location)
+
+    def test_cache_headers_and_precompressed(self):
+        """
+        Тест на долгое кэширование статики с хэшем и сжатую копию.
+        """
+        response = self.serve(HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)),
+                         self.content)
+        plain = self.serve()
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertNotEqual(plain['ETag'], response['ETag'])
+        repeat = self.serve(HTTP_IF_NONE_MATCH=plain['ETag'])
+        self.assertEqual(repeat.status_code, 304)
+
+    def test_range(self):
+        """
+        Тест на отдачу диапазона байтов.
+        """
+        response = self.serve(location='media', HTTP_RANGE='bytes=5-14')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content),
+                         self.content[5:15])
+        self.assertEqual(response['Content-Range'],
+                         f'bytes 5-14/{len(self.content)}')
+        suffix = self.serve(location='media', HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(suffix.streaming_content),
+                         self.content[-4:])
+        outside = self.serve(location='media', HTTP_RANGE='bytes=99999-')
+        self.assertEqual(outside.status_code, 416)
+
+    def test_offload(self):
+        """
+        Тест на передачу отдачи файла веб-серверу.
+        """
+        with self.settings(POSTS_FILE_OFFLOAD='x-accel-redirect'):
+            response = self.serve(location='media')
+            self.assertEqual(response['X-Accel-Redirect'],
+                             f'/_protected/media/{self.name}')
+            self.assertEqual(response.content, b'')
+        with self.settings(POSTS_FILE_OFFLOAD='x-sendfile'):
+            response = self.serve(location='media')
+            self.assertEqual(response['X-Sendfile'],
+                             os.path.join(self.root, self.name))
+
+    def test_outside_root(self):
+        """
+        Тест на запрет выхода за пределы каталога.
+        """
+        with self.assertRaises(Http404):
+            self.serve(name='../secret.txt')
+
+    def test_compressed_manifest_storage(self):
+        """
+        Тест на сжатые копии статики после collectstatic.
+        """
+        source = os.path.join(self.root, 'source')
+        target = os.path.join(self.root, 'collected')
+        os.makedirs(source)
+        with open(os.path.join(source, 'app.js'), 'wb') as output:
+            output.write(b'console.log("yatube");\n' * 50)
+        with self.settings(
+                STATICFILES_DIRS=[source], STATIC_ROOT=target,
+                STATICFILES_STORAGE='posts.storage.'
+                                    'CompressedManifestStaticFilesStorage'):
+            call_command('collectstatic', interactive=False, verbosity=0)
+        collected = os.listdir(target)
+        hashed = [name for name in collected
+                  if name.startswith('app.') and name.endswith('.js')
+                  and name != 'app.js']
+        self.assertEqual(len(hashed), 1)
+        self.assertIn(hashed[0] + '.gz', collected)
+
+
+@tasks.task
+def failing_task(message):
+    raise ValueError(message)
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.author = User.objects.create_user(username='task_author',
+                                               email='author@example.com')
+        self.reader = User.objects.create_user(username='task_reader',
+                                               email='reader@example.com')
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def test_eager_errors_do_not_break_caller(self):
+        """
+        Тест на то, что ошибка задачи при немедленном выполнении
+        не прерывает запрос и попадает в метрики.
+        """
+        with self.assertLogs('posts.tasks', 'ERROR'):
+            failing_task.delay('сбой')
+        counts = metrics.registry.snapshot()['tasks'][failing_task.task_name]
+        self.assertEqual(counts, {'enqueued': 1, 'failed': 1})
+
+    @override_settings(POSTS_TASKS_BACKEND='db',
+                       POSTS_EMAIL_NOTIFICATIONS=True)
+    def test_db_queue_runs_side_effects(self):
+        """
+        Тест на выполнение побочных работ нового поста
+        из очереди БД командой run_worker.
+        """
+        post = Post.objects.create(text='Отложенный пост', author=self.author)
+        self.assertEqual(
+            set(QueuedTask.objects.values_list('name', flat=True)),
+            {search.reindex_post.task_name,
+             'posts.timeline.fan_out_post',
+             trending.record_post.task_name,
+             notifications.notify_followers.task_name},
+        )
+        self.assertEqual(search.get_backend().search_posts('отложенный'), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+        call_command('run_worker', '--once', stdout=open(os.devnull, 'w'))
+        self.assertFalse(QueuedTask.objects.exists())
+        self.assertEqual(search.get_backend().search_posts('отложенный'),
+                         [post.pk])
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        self.assertEqual([message.to for message in mail.outbox],
+                         [['reader@example.com']])
+
+    @override_settings(POSTS_TASKS_BACKEND='db', POSTS_TASKS_MAX_RETRIES=1,
+                       POSTS_TASKS_RETRY_DELAY=0)
+    def test_db_queue_retries_then_fails(self):
+        """
+        Тест на повтор неудачной задачи и пометку failed
+        после исчерпания попыток.
+        """
+        failing_task.delay('сбой')
+        self.assertEqual(tasks.run_pending(), 1)
+        record = QueuedTask.objects.get()
+        self.assertEqual(record.status, QueuedTask.QUEUED)
+        self.assertEqual(record.attempts, 1)
+        self.assertIn('сбой', record.last_error)
+
+        with self.assertLogs('posts.tasks', 'ERROR'):
+            self.assertEqual(tasks.run_pending(), 1)
+        record.refresh_from_db()
+        self.assertEqual(record.status, QueuedTask.FAILED)
+        self.assertEqual(tasks.run_pending(), 0)
+        self.assertEqual(tasks.queue_depth(), {QueuedTask.FAILED: 1})
+        text = metrics.registry.prometheus()
+        self.assertIn(f'yatube_tasks_total{{task="{failing_task.task_name}",'
+                      f'outcome="dead"}} 1', text)
+
+    @override_settings(POSTS_TASKS_BACKEND='db')
+    def test_stale_lock_is_requeued(self):
+        """
+        Тест на возврат в очередь задачи упавшего обработчика.
+        """
+        failing_task.delay('сбой')
+        QueuedTask.objects.update(
+            status=QueuedTask.RUNNING,
+            locked_at=timezone.now() - timedelta(hours=1),
+        )
+        self.assertEqual(list(tasks.claim(10)), [QueuedTask.objects.get()])
+
+
+class GroupFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='group_author')
+        self.client = Client()
+        self.client.force_login(self.author)
+        self.group = Group.objects.create(title='Кошки', slug='cats',
+                                          description='Про кошек')
+        self.other = Group.objects.create(title='Собаки', slug='dogs')
+        self.posts = [Post.objects.create(text=f'Пост {number}',
+                                          author=self.author,
+                                          group=self.group)
+                      for number in range(12)]
+        self.url = reverse('group', args=[self.group.slug])
+        self.anonym = Client()
+
+    def test_first_page_cached_and_invalidated(self):
+        """
+        Тест на кэширование первой страницы группы и ее сброс
+        после нового поста и переноса поста в другую группу.
+        """
+        response = self.anonym.get(self.url)
+        self.assertEqual(response.context['paginator'].count, 12)
+        with self.assertNumQueries(0):
+            self.anonym.get(self.url)
+
+        self.client.post(reverse('new_post'),
+                         {'text': 'Новый пост', 'group': self.group.pk})
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Новый пост')
+        self.assertEqual(response.context['paginator'].count, 13)
+
+        moved = self.posts[-1]
+        self.client.post(
+            reverse('post_edit', args=[self.author.username, moved.pk]),
+            {'text': 'Перенесенный пост', 'group': self.other.pk})
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['paginator'].count, 12)
+        self.assertNotIn(moved, response.context['page'])
+        self.assertContains(
+            self.client.get(reverse('group', args=[self.other.slug])),
+            'Перенесенный пост')
+
+    def test_other_pages_use_cached_metadata(self):
+        """
+        Тест на то, что страницы группы не считают посты заново.
+        """
+        self.anonym.get(self.url)
+        with self.assertNumQueries(1):
+            response = self.anonym.get(self.url, {'page': 2})
+        self.assertEqual(len(response.context['page']), 2)
+
+    def test_group_changes_reset_metadata(self):
+        """
+        Тест на обновление названия группы, 404 после ее удаления
+        и новую группу с тем же адресом.
+        """
+        self.client.get(self.url)
+        self.group.title = 'Коты'
+        self.group.save()
+        self.assertContains(self.client.get(self.url), 'Коты')
+        self.group.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        Group.objects.create(title='Снова кошки', slug='cats')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Снова кошки')
+        self.assertEqual(response.context['paginator'].count, 0)
+
+
+class FeedCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='count_user')
+        for number in range(25):
+            Post.objects.create(text=f'Пост {number}', author=self.user)
+        self.client = Client()
+
+    def test_cached_count_follows_writes(self):
+        """
+        Тест на кэширование числа постов ленты и его поправку
+        при добавлении и удалении постов.
+        """
+        feed = Post.objects.all()
+        self.assertEqual(paginators.cached_count('index', feed), 25)
+        with self.assertNumQueries(0):
+            self.assertEqual(paginators.cached_count('index', feed), 25)
+        post = Post.objects.create(text='Еще пост', author=self.user)
+        self.assertEqual(paginators.cached_count('index', feed), 26)
+        post.delete()
+        self.assertEqual(paginators.cached_count('index', feed), 25)
+
+    @override_settings(POSTS_MAX_PAGES=2)
+    def test_page_depth_capped(self):
+        """
+        Тест на ограничение глубины страниц и переход дальше курсором.
+        """
+        response = self.client.get(reverse('index'), {'page': 5})
+        paginator = response.context['paginator']
+        page = response.context['page']
+        self.assertTrue(paginator.truncated)
+        self.assertEqual(paginator.num_pages, 2)
+        self.assertEqual(page.number, 2)
+        cursor = paginators.feed_cursor(page.object_list[-1])
+        self.assertContains(response, f'?after={cursor}')
+        response = self.client.get(reverse('index'), {'after': cursor})
+        self.assertEqual(len(response.context['page']), 5)
+
+
+class PageWindowTests(SimpleTestCase):
+    def window(self, number, num_pages):
+        from django.core.paginator import Paginator
+        page = Paginator(range(num_pages), 1).page(number)
+        return paginators.page_window(page)
+
+    def test_page_window(self):
+        """
+        Тест на список номеров страниц с пропусками.
+        """
+        self.assertEqual(self.window(1, 5), [1, 2, 3, 4, 5])
+        self.assertEqual(self.window(1, 100), [1, 2, 3, None, 100])
+        self.assertEqual(self.window(50, 100),
+                         [1, None, 48, 49, 50, 51, 52, None, 100])
+        self.assertEqual(self.window(99, 100),
+                         [1, None, 97, 98, 99, 100])
+
+
+class FollowGraphTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='graph_author')
+        self.fan = User.objects.create_user(username='graph_fan')
+        self.reader = User.objects.create_user(username='graph_reader')
+        Follow.objects.create(user=self.fan, author=self.author)
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_follow_ignores_other_followers(self):
+        """
+        Тест на подписку на автора, у которого уже есть подписчики,
+        и флаг подписки на странице профиля.
+        """
+        url = reverse('profile', args=[self.author.username])
+        self.assertFalse(self.client.get(url).context['following'])
+        self.client.get(reverse('profile_follow',
+                                args=[self.author.username]))
+        self.assertTrue(Follow.objects.filter(user=self.reader,
+                                              author=self.author).exists())
+        self.assertTrue(self.client.get(url).context['following'])
+
+    def test_cached_sets_invalidated(self):
+        """
+        Тест на ответы из кэша и их сброс при подписке и отписке.
+        """
+        self.assertFalse(
+            follow_graph.is_following(self.reader.pk, self.author.pk))
+        follow_graph.followers(self.author.pk)
+        with self.assertNumQueries(0):
+            self.assertFalse(
+                follow_graph.is_following(self.reader.pk, self.author.pk))
+            self.assertEqual(follow_graph.followers(self.author.pk),
+                             {self.fan.pk})
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        with self.assertNumQueries(2):
+            self.assertTrue(
+                follow_graph.is_following(self.reader.pk, self.author.pk))
+            self.assertEqual(follow_graph.followers(self.author.pk),
+                             {self.fan.pk, self.reader.pk})
+        with self.assertNumQueries(0):
+            self.assertTrue(
+                follow_graph.is_following(self.reader.pk, self.author.pk))
+        follow.delete()
+        self.assertEqual(follow_graph.followers(self.author.pk),
+                         {self.fan.pk})
+        self.assertEqual(
+            follow_graph.following_many(
+                self.fan.pk, [self.author.pk, self.reader.pk]),
+            {self.author.pk})
+
+    def test_stale_load_not_served(self):
+        """
+        Тест на чтение, которое собрало множество до подписки
+        и сохранило его после: копия не попадает под новый ключ.
+        """
+        stale_key = follow_graph._key(follow_graph.FOLLOWEES, self.reader.pk)
+        Follow.objects.create(user=self.reader, author=self.author)
+        cache.set(stale_key, frozenset())
+        self.assertTrue(
+            follow_graph.is_following(self.reader.pk, self.author.pk))
+
+    @override_settings(POSTS_FOLLOW_CACHE_MAX=0)
+    def test_large_sets_read_from_db(self):
+        """
+        Тест на проверку подписки запросом для слишком больших множеств.
+        """
+        self.assertTrue(
+            follow_graph.is_following(self.fan.pk, self.author.pk))
+        with self.assertNumQueries(2):
+            self.assertTrue(
+                follow_graph.is_following(self.fan.pk, self.author.pk))
+
+    def test_unique_constraint(self):
+        """
+        Тест на запрет повторной подписки на уровне БД.
+        """
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=self.fan, author=self.author)
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader, self.friend, self.author, self.writer = (
+            User.objects.create_user(username=name)
+            for name in ('rec_reader', 'rec_friend', 'rec_author',
+                         'rec_writer'))
+        Follow.objects.create(user=self.reader, author=self.friend)
+        Follow.objects.create(user=self.friend, author=self.author)
+        Follow.objects.create(user=self.friend, author=self.reader)
+        group = Group.objects.create(title='Общая', slug='shared')
+        for user in (self.reader, self.writer, self.author):
+            Post.objects.create(text='Пост', author=user, group=group)
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_suggest(self):
+        """
+        Тест на выбор кандидатов: без себя и уже прочитанных авторов,
+        с причиной и порядком по оценке.
+        """
+        graph = recommendations.Graph.load()
+        suggestions = recommendations.suggest(graph, self.reader.pk)
+        self.assertEqual(
+            [(candidate, reason) for candidate, _, reason in suggestions],
+            [(self.author.pk, Recommendation.BOTH),
+             (self.writer.pk, Recommendation.GROUPS)],
+        )
+
+    def test_compute_and_show(self):
+        """
+        Тест на пересчет командой и показ предложений в ленте подписок
+        без авторов, на которых пользователь уже подписался.
+        """
+        Recommendation.objects.create(
+            user=self.writer, candidate=self.friend, rank=1, score=1,
+            reason=Recommendation.FRIENDS,
+            computed=timezone.now() - timedelta(days=1))
+        call_command('compute_recommendations',
+                     stdout=open(os.devnull, 'w'),
+                     stderr=open(os.devnull, 'w'))
+        self.assertFalse(Recommendation.objects.filter(
+            user=self.writer, candidate=self.friend).exists())
+        response = self.client.get(reverse('follow_index'))
+        self.assertEqual(
+            [item.candidate for item in response.context['recommendations']],
+            [self.author, self.writer])
+        self.assertContains(response, 'Кого почитать')
+
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.client.get(reverse('follow_index'))
+        self.assertEqual(
+            [item.candidate for item in response.context['recommendations']],
+            [self.writer])
+
+    def test_synthetic_graph(self):
+        """
+        Тест на генерацию синтетического графа для замеров.
+        """
+        graph = benchmark.synthetic_graph(users=50, edges=300, groups=3,
+                                          group_posts=40)
+        edges = sum(len(ids) for ids in graph.followees.values())
+        self.assertEqual(edges, 300)
+        self.assertTrue(all(user_id not in ids
+                            for user_id, ids in graph.followees.items()))
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='trend_author')
+        self.reader = User.objects.create_user(username='trend_reader')
+        self.group = Group.objects.create(title='Горячее', slug='hot')
+        self.old = Post.objects.create(text='Старый', author=self.author,
+                                       group=self.group)
+        self.new = Post.objects.create(text='Новый', author=self.author)
+
+    def test_decay(self):
+        """
+        Тест на затухание оценки: вдвое за период полураспада,
+        сумма событий без переполнения в далеком будущем.
+        """
+        start = timezone.now()
+        score = trending.log_score(4, start)
+        later = start + timedelta(seconds=2 * trending.half_life())
+        self.assertAlmostEqual(trending.current(score, later), 1)
+        far = start + timedelta(days=365 * 50)
+        total = trending.log_add(trending.log_score(1, far),
+                                 trending.log_score(3, far))
+        self.assertAlmostEqual(trending.current(total, far), 4)
+
+    def test_events(self):
+        """
+        Тест на обновление оценок новыми постами, комментариями
+        и подписками на автора.
+        """
+        self.assertEqual(PostTrend.objects.count(), 2)
+        self.assertTrue(GroupTrend.objects.filter(group=self.group).exists())
+        Comment.objects.create(post=self.old, author=self.reader, text='!')
+        ranked = list(PostTrend.objects.order_by('-score')
+                      .values_list('post', flat=True))
+        self.assertEqual(ranked, [self.old.pk, self.new.pk])
+        before = PostTrend.objects.get(post=self.new).score
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertGreater(PostTrend.objects.get(post=self.new).score,
+                           before)
+        self.assertEqual(
+            list(PostTrend.objects.order_by('-score')
+                 .values_list('post', flat=True)),
+            [self.new.pk, self.old.pk])
+
+    def test_page(self):
+        """
+        Тест на ленту популярного: порядок по оценке, группы
+        и кэширование страницы.
+        """
+        Comment.objects.create(post=self.old, author=self.reader, text='!')
+        response = self.client.get(reverse('trending'))
+        self.assertEqual(list(response.context['page']),
+                         [self.old, self.new])
+        self.assertEqual([item.group for item in response.context['groups']],
+                         [self.group])
+        self.assertContains(response, 'Горячее')
+        with self.assertNumQueries(0):
+            self.client.get(reverse('trending'))
+
+    def test_cursor_keeps_score_order(self):
+        """
+        Тест на курсорные страницы ленты популярного в порядке оценок.
+        """
+        newest = Post.objects.create(text='Новейший', author=self.author)
+        for post in (self.old, self.old, self.new):
+            Comment.objects.create(post=post, author=self.reader, text='!')
+        feed = list(feeds.trending_feed())
+        self.assertEqual(feed, [self.old, self.new, newest])
+        cursor = paginators.CursorPaginator(
+            feeds.trending_feed(), 1,
+            ('-trend_score', '-pk')).cursor_for(feed[0])
+        response = self.client.get(reverse('trending'), {'after': cursor})
+        self.assertEqual(list(response.context['page']), [self.new, newest])
+
+    @override_settings(POSTS_MAX_PAGES=1)
+    def test_next_link_past_page_limit_keeps_score_order(self):
+        """
+        Тест на ссылку дальше последней доступной по номеру страницы:
+        курсор строится в порядке оценок, а не дат.
+        """
+        posts = [Post.objects.create(text=f'Пост {number}',
+                                     author=self.author)
+                 for number in range(10)]
+        for post in (self.old, self.old, self.new):
+            Comment.objects.create(post=post, author=self.reader, text='!')
+        feed = list(feeds.trending_feed())
+        self.assertEqual(feed[:2], [self.old, self.new])
+        response = self.client.get(reverse('trending'))
+        self.assertTrue(response.context['paginator'].truncated)
+        page = response.context['page']
+        self.assertEqual(list(page), feed[:10])
+        cursor = response.context['paginator'].cursor_for(page[9])
+        self.assertContains(response, f'?after={cursor}')
+        response = self.client.get(reverse('trending'), {'after': cursor})
+        self.assertEqual(list(response.context['page']), feed[10:])
+        self.assertEqual(set(feed[10:]), set(posts[:2]))
+
+    def test_prune_and_rebuild(self):
+        """
+        Тест на удаление угасших оценок и пересчет по истории.
+        """
+        Comment.objects.create(post=self.old, author=self.reader, text='!')
+        scores = dict(PostTrend.objects.values_list('post', 'score'))
+        future = timezone.now() + timedelta(days=30)
+        self.assertEqual(trending.prune(future), 3)
+        self.assertEqual(trending.prune(), 0)
+        call_command('rebuild_trending', stdout=open(os.devnull, 'w'))
+        rebuilt = dict(PostTrend.objects.values_list('post', 'score'))
+        self.assertEqual(rebuilt.keys(), scores.keys())
+        for post_id, score in scores.items():
+            self.assertAlmostEqual(rebuilt[post_id], score, places=3)
+        self.assertEqual(GroupTrend.objects.count(), 1)
@@ -0,0 +1,67 @@
+import logging
+
+from sorl.thumbnail import default, delete, get_thumbnail
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.images import ImageFile
+
+from . import cache
+from .models import Post
+from .tasks import task
+
+logger = logging.getLogger(__name__)
+
+# Размеры должны совпадать с тегами {% thumbnail %} в шаблонах.
+THUMBNAIL_SIZES = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+
+
+@task
+def generate(post_id, force=False):
+    """
+    Создает все размеры миниатюр для изображения поста.
+    Возвращает число созданных миниатюр.
+    """
+    post = Post.objects.filter(pk=post_id).only('image').first()
+    if post is None or not post.image:
+        return 0
+    if force:
+        delete(post.image, delete_file=False)
+    for geometry, options in THUMBNAIL_SIZES:
+        get_thumbnail(post.image, geometry, **options)
+    # Закэшированные карточки показывают оригинал до появления миниатюры.
+    cache.bump_card(post_id)
+    return len(THUMBNAIL_SIZES)
+
+
+def cached(image, geometry, **options):
+    """
+    Готовая миниатюра из хранилища ключей sorl или None. В отличие
+    от `get_thumbnail` не читает исходный файл и не создает миниатюру:
+    ее создает фоновая задача `generate`.
+    """
+    if not image:
+        return None
+    backend = default.backend
+    source = ImageFile(image)
+    # Параметры дополняются так же, как в ThumbnailBackend.get_thumbnail,
+    # иначе имя миниатюры не совпадет с созданной задачей.
+    if settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(settings, attr)
+        if value != getattr(default_settings, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return default.kvstore.get(ImageFile(name, default.storage))
+
+
+def schedule(post):
+    """
+    Ставит генерацию миниатюр в очередь фоновых задач.
+    """
+    if post.image:
+        generate.delay(post.pk)
@@ -0,0 +1,168 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import Follow, Post, TimelineEntry, UserStats
+from .tasks import task
+
+BATCH_SIZE = 500
+
+
+def fanout_limit():
+    """
+    Авторы с таким числом подписчиков не размножают посты по лентам:
+    их посты подмешиваются в ленту при чтении.
+    """
+    return getattr(settings, 'POSTS_TIMELINE_FANOUT_LIMIT', 1000)
+
+
+def backfill_limit():
+    """
+    Сколько последних постов автора попадает в ленту при подписке.
+    """
+    return getattr(settings, 'POSTS_TIMELINE_BACKFILL_LIMIT', 500)
+
+
+def is_celebrity(author_id):
+    """
+    Проверяет, читается ли автор без записи в ленты подписчиков.
+    """
+    return UserStats.objects.filter(
+        user_id=author_id,
+        followers_count__gte=fanout_limit(),
+    ).exists()
+
+
+def fan_out(post):
+    """
+    Добавляет новый пост в ленты подписчиков автора.
+    """
+    if is_celebrity(post.author_id):
+        return
+    followers = (Follow.objects.filter(author_id=post.author_id)
+                 .values_list('user_id', flat=True))
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post.pk,
+                       pub_date=post.pub_date)
+         for user_id in followers.iterator()],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+@task
+def fan_out_post(post_id):
+    post = (Post.objects.filter(pk=post_id)
+            .only('author_id', 'pub_date').first())
+    if post is not None:
+        fan_out(post)
+
+
+def _recent_posts(author_id):
+    return list(Post.objects.filter(author_id=author_id)
+                .order_by('-pub_date')
+                .values_list('pk', 'pub_date')[:backfill_limit()])
+
+
+@task
+def backfill(user_id, author_id):
+    """
+    Добавляет последние посты автора в ленту нового подписчика.
+    Задачи выполняются не по порядку, поэтому подписка перечитывается
+    с блокировкой: после отписки задача ничего не добавляет,
+    а отписка ждет окончания уже начатой задачи.
+    """
+    with transaction.atomic():
+        follow = (Follow.objects.select_for_update()
+                  .filter(user_id=user_id, author_id=author_id).first())
+        if follow is None or is_celebrity(author_id):
+            return
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=user_id, post_id=post_id,
+                           pub_date=pub_date)
+             for post_id, pub_date in _recent_posts(author_id)],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+@task
+def prune(user_id, author_id):
+    """
+    Удаляет посты автора из ленты отписавшегося пользователя,
+    если тот не подписался снова раньше, чем выполнилась задача.
+    """
+    if Follow.objects.filter(user_id=user_id, author_id=author_id).exists():
+        return
+    TimelineEntry.objects.filter(user_id=user_id,
+                                 post__author_id=author_id).delete()
+
+
+def left_celebrities(author_id):
+    """
+    Проверяет, что после отписки у автора стало на одного подписчика
+    меньше порога рассылки.
+    """
+    return UserStats.objects.filter(
+        user_id=author_id,
+        followers_count=fanout_limit() - 1,
+    ).exists()
+
+
+@task
+def backfill_followers(author_id):
+    """
+    Автор перестал быть популярным, и его посты снова читаются только
+    из лент: посты, опубликованные без рассылки, добавляются в ленты
+    всех подписчиков.
+    """
+    if is_celebrity(author_id):
+        return
+    posts = _recent_posts(author_id)
+    followers = (Follow.objects.filter(author_id=author_id)
+                 .values_list('user_id', flat=True))
+    entries = []
+    for user_id in followers.iterator(chunk_size=BATCH_SIZE):
+        entries.extend(
+            TimelineEntry(user_id=user_id, post_id=post_id,
+                          pub_date=pub_date)
+            for post_id, pub_date in posts)
+        if len(entries) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(
+                entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+            entries = []
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def rebuild():
+    """
+    Перестраивает ленты всех пользователей по подпискам.
+    """
+    TimelineEntry.objects.all().delete()
+    follows = Follow.objects.values_list('user_id', 'author_id')
+    for user_id, author_id in follows.iterator(chunk_size=BATCH_SIZE):
+        backfill(user_id, author_id)
+
+
+def follow_posts(posts, user):
+    """
+    Посты ленты подписок из QuerySet `posts`: материализованная лента
+    пользователя плюс посты популярных авторов, читаемые напрямую.
+    Без популярных авторов запрос идет диапазоном индекса
+    (user, -pub_date, -post) записей ленты, поэтому сортировка
+    и ключ курсора берутся из столбцов TimelineEntry.
+    """
+    celebrities = list(
+        Follow.objects.filter(
+            user=user,
+            author__stats__followers_count__gte=fanout_limit(),
+        ).values_list('author_id', flat=True)
+    )
+    if celebrities:
+        entries = TimelineEntry.objects.filter(user=user).values('post_id')
+        return posts.filter(Q(pk__in=entries) | Q(author_id__in=celebrities))
+    return (posts.filter(timeline_entries__user=user)
+            .annotate(entry_date=F('timeline_entries__pub_date'),
+                      entry_post=F('timeline_entries__post'))
+            .order_by('-entry_date', '-entry_post'))
@@ -0,0 +1,265 @@
+import csv
+import json
+import os
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from . import cache, counters, follow_graph, search, timeline
+from .benchmark import explicit_dates
+from .models import Comment, Follow, Group, Post, User
+
+BATCH_SIZE = 500
+# Порядок выгрузки: записи ссылаются только на уже загруженные.
+KINDS = ('group', 'user', 'post', 'comment', 'follow')
+MODELS = {
+    'group': Group,
+    'user': User,
+    'post': Post,
+    'comment': Comment,
+    'follow': Follow,
+}
+FIELDS = {
+    'group': ('id', 'title', 'slug', 'description'),
+    'user': ('id', 'username', 'password', 'first_name', 'last_name',
+             'email', 'is_active', 'is_staff', 'is_superuser',
+             'last_login', 'date_joined'),
+    'post': ('id', 'text', 'pub_date', 'author_id', 'group_id', 'image'),
+    'comment': ('id', 'post_id', 'author_id', 'text', 'created'),
+    'follow': ('id', 'user_id', 'author_id'),
+}
+DATE_FIELDS = ('last_login', 'date_joined', 'pub_date', 'created')
+BOOLEAN_FIELDS = ('is_active', 'is_staff', 'is_superuser')
+# Что убирает из выгрузки --anonymize-users: пользователи загружаются
+# без пароля и без прав персонала.
+ANONYMIZED_USER_FIELDS = {
+    'password': '',
+    'is_staff': False,
+    'is_superuser': False,
+}
+# Поля, по которым проверяется, что запись с тем же id
+# в БД описывает тот же объект, а значение не занято другим id.
+NATURAL_KEYS = {'group': 'slug', 'user': 'username'}
+
+
+class TransferError(Exception):
+    pass
+
+
+def export_records(kind, chunk_size=2000, anonymize=False):
+    """
+    Потоково выгружает записи одного типа в порядке первичного ключа.
+    Пользователи выгружаются с хэшем пароля и правами, с `anonymize`
+    - без них.
+    """
+    fields = FIELDS[kind]
+    rows = (MODELS[kind].objects.order_by('pk').values_list(*fields)
+            .iterator(chunk_size=chunk_size))
+    for row in rows:
+        record = dict(zip(fields, row))
+        if anonymize and kind == 'user':
+            record.update(ANONYMIZED_USER_FIELDS)
+        for field in DATE_FIELDS:
+            if record.get(field) is not None:
+                record[field] = record[field].isoformat()
+        yield record
+
+
+def write_ndjson(output, chunk_size=2000, progress=None, anonymize=False):
+    """
+    Пишет все записи в один поток NDJSON: по объекту JSON на строку.
+    """
+    for kind in KINDS:
+        records = export_records(kind, chunk_size, anonymize)
+        for count, record in enumerate(records, 1):
+            output.write(json.dumps({'type': kind, **record},
+                                    ensure_ascii=False))
+            output.write('\n')
+            if progress and count % chunk_size == 0:
+                progress(kind, count)
+
+
+def write_csv(directory, chunk_size=2000, progress=None, anonymize=False):
+    """
+    Пишет записи в каталог: отдельный CSV-файл для каждого типа.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for kind in KINDS:
+        path = os.path.join(directory, f'{kind}.csv')
+        with open(path, 'w', newline='', encoding='utf-8') as output:
+            writer = csv.DictWriter(output, FIELDS[kind])
+            writer.writeheader()
+            records = export_records(kind, chunk_size, anonymize)
+            for count, record in enumerate(records, 1):
+                writer.writerow(record)
+                if progress and count % chunk_size == 0:
+                    progress(kind, count)
+
+
+def read_ndjson(path, position=None):
+    """
+    Читает записи NDJSON начиная с сохраненной позиции.
+    Вместе с записью возвращается позиция сразу после нее.
+    """
+    with open(path, 'rb') as source:
+        if position:
+            source.seek(position['offset'])
+        for line in iter(source.readline, b''):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            kind = record.pop('type')
+            yield kind, record, {'source': path, 'offset': source.tell()}
+
+
+def read_csv(directory, position=None):
+    """
+    Читает CSV-файлы каталога в порядке KINDS
+    начиная с сохраненной позиции.
+    """
+    kinds = KINDS
+    if position:
+        kinds = KINDS[KINDS.index(position['source']):]
+    for kind in kinds:
+        path = os.path.join(directory, f'{kind}.csv')
+        if not os.path.exists(path):
+            continue
+        with open(path, newline='', encoding='utf-8') as source:
+            # Строки читаются через readline, чтобы работал tell().
+            lines = iter(source.readline, '')
+            header = next(csv.reader(lines))
+            if position and position['source'] == kind:
+                source.seek(position['offset'])
+            for row in csv.reader(lines):
+                yield (kind, dict(zip(header, row)),
+                       {'source': kind, 'offset': source.tell()})
+
+
+def decode(kind, record):
+    """
+    Приводит значения записи NDJSON или CSV к полям модели.
+    """
+    values = {}
+    for field in FIELDS[kind]:
+        value = record.get(field)
+        if field == 'id' or field.endswith('_id'):
+            value = int(value) if value not in (None, '') else None
+        elif field in DATE_FIELDS:
+            value = parse_datetime(value) if value else None
+        elif field in BOOLEAN_FIELDS:
+            # Выгрузка без поля: остается значение модели по умолчанию.
+            if value in (None, ''):
+                continue
+            value = value in (True, 'True', 'true', '1')
+        elif value is None:
+            value = ''
+        values[field] = value
+    return values
+
+
+def _check_natural_keys(kind, objects):
+    """
+    bulk_create пропускает записи, конфликтующие по id или по
+    уникальному натуральному ключу. Пропущенный пользователь или группа
+    с занятым ключом привязали бы свои посты к чужой записи, поэтому
+    загрузка прерывается при любом расхождении id и ключа.
+    """
+    key = NATURAL_KEYS.get(kind)
+    if key is None:
+        return
+    loaded = {}
+    for obj in objects:
+        value = getattr(obj, key)
+        pk = loaded.setdefault(value, obj.pk)
+        if pk != obj.pk:
+            raise TransferError(
+                f'{kind} "{value}" загружается дважды: с id {pk} '
+                f'и {obj.pk}.'
+            )
+    pks = {obj.pk: getattr(obj, key) for obj in objects}
+    existing = (MODELS[kind].objects
+                .filter(Q(pk__in=list(pks))
+                        | Q(**{f'{key}__in': list(loaded)}))
+                .values_list('pk', key))
+    for pk, value in existing:
+        if pk in pks and pks[pk] != value:
+            raise TransferError(
+                f'{kind} {pk}: в БД уже есть "{value}", '
+                f'а загружается "{pks[pk]}".'
+            )
+        if value in loaded and loaded[value] != pk:
+            raise TransferError(
+                f'{kind} "{value}": в БД уже есть с id {pk}, '
+                f'а загружается с id {loaded[value]}.'
+            )
+
+
+def save_batch(kind, records):
+    """
+    Сохраняет пачку записей одного типа.
+    Записи с уже существующим id пропускаются, поэтому
+    повторная загрузка пачки после сбоя безопасна.
+    """
+    model = MODELS[kind]
+    objects = [model(**decode(kind, record)) for record in records]
+    if kind == 'user':
+        # Без хэша пароля (анонимизированная выгрузка) вход по паролю
+        # закрыт до его сброса.
+        for user in objects:
+            if not user.password:
+                user.password = make_password(None)
+    _check_natural_keys(kind, objects)
+    model.objects.bulk_create(objects, batch_size=BATCH_SIZE,
+                              ignore_conflicts=True)
+
+
+def import_records(records, batch_size=2000, on_batch=None):
+    """
+    Загружает записи пачками, каждая пачка в своей транзакции.
+    После фиксации пачки вызывается `on_batch(kind, count, position)`,
+    где position - место продолжения загрузки.
+    """
+    fields = (Post._meta.get_field('pub_date'),
+              Comment._meta.get_field('created'))
+    total = 0
+    batch_kind, batch, position = None, [], None
+
+    def flush():
+        with transaction.atomic():
+            save_batch(batch_kind, batch)
+        if on_batch:
+            on_batch(batch_kind, total, position)
+
+    with explicit_dates(*fields):
+        for kind, record, next_position in records:
+            if batch and (kind != batch_kind or len(batch) >= batch_size):
+                flush()
+                batch = []
+            batch_kind = kind
+            batch.append(record)
+            position = next_position
+            total += 1
+        if batch:
+            flush()
+    return total
+
+
+def finish_import():
+    """
+    Пересчитывает все, что при обычном сохранении обновляют сигналы:
+    последовательности id, счетчики, ленты и поисковый индекс.
+    """
+    models = list(MODELS.values())
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+    with transaction.atomic():
+        counters.recount_posts()
+        counters.recount_users()
+        timeline.rebuild()
+        search.rebuild()
+    cache.bump_generation('index')
+    follow_graph.reset()
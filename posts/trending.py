@@ -0,0 +1,201 @@
+import math
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache
+from .models import Comment, GroupTrend, Post, PostTrend
+from .tasks import task
+
+# Начало отсчета времени событий. Оценки хранятся как
+# log(вес) + rate * (t - EPOCH): затухание всех записей к текущему
+# моменту одинаково, поэтому его не нужно применять при каждом событии.
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+POST = 'post'
+COMMENT = 'comment'
+FOLLOW = 'follow'
+WEIGHTS = {
+    POST: 1.0,
+    COMMENT: 2.0,
+    FOLLOW: 3.0,
+}
+
+
+def half_life():
+    """
+    Через сколько секунд вклад события уменьшается вдвое.
+    """
+    return getattr(settings, 'POSTS_TRENDING_HALF_LIFE', 60 * 60 * 24)
+
+
+def weight(event):
+    return getattr(settings, 'POSTS_TRENDING_WEIGHTS', WEIGHTS)[event]
+
+
+def size():
+    """
+    Сколько самых популярных постов показывает лента.
+    """
+    return getattr(settings, 'POSTS_TRENDING_SIZE', 100)
+
+
+def cache_ttl():
+    """
+    Время жизни страниц ленты: оценки меняются с каждым
+    комментарием, поэтому страницы устаревают по времени.
+    """
+    return getattr(settings, 'POSTS_TRENDING_CACHE_TTL', 60)
+
+
+def min_value():
+    """
+    Записи, чья текущая оценка упала ниже этой, удаляет prune.
+    """
+    return getattr(settings, 'POSTS_TRENDING_MIN_VALUE', 0.01)
+
+
+def _rate():
+    return math.log(2) / half_life()
+
+
+def _elapsed(when):
+    return (when - EPOCH).total_seconds()
+
+
+def log_score(value, when):
+    """
+    Хранимая оценка события веса `value` в момент `when`.
+    """
+    return math.log(value) + _rate() * _elapsed(when)
+
+
+def current(score, now=None):
+    """
+    Затухшая к моменту `now` сумма весов событий.
+    """
+    now = now or timezone.now()
+    return math.exp(score - _rate() * _elapsed(now))
+
+
+def log_add(a, b):
+    """
+    log(exp(a) + exp(b)) без переполнения.
+    """
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def _add(model, pk, score):
+    with transaction.atomic():
+        row, created = (model.objects.select_for_update()
+                        .get_or_create(pk=pk, defaults={'score': score}))
+        if not created:
+            row.score = log_add(row.score, score)
+            row.save(update_fields=('score', 'updated'))
+
+
+def record(post_id, group_id, event, when=None):
+    """
+    Прибавляет событие к оценкам поста и его группы.
+    """
+    score = log_score(weight(event), when or timezone.now())
+    _add(PostTrend, post_id, score)
+    if group_id is not None:
+        _add(GroupTrend, group_id, score)
+
+
+def _post_group(post_id):
+    return (Post.objects.filter(pk=post_id)
+            .values_list('pk', 'group_id').first())
+
+
+@task
+def record_post(post_id):
+    post = _post_group(post_id)
+    if post is not None:
+        record(*post, POST)
+
+
+@task
+def record_comment(post_id):
+    post = _post_group(post_id)
+    if post is not None:
+        record(*post, COMMENT)
+
+
+@task
+def record_follow(author_id):
+    """
+    Новый подписчик поднимает последний пост автора, если тот
+    опубликован не раньше половины периода полураспада назад:
+    старые посты подпиской не воскрешаются.
+    """
+    since = timezone.now() - timedelta(seconds=half_life() / 2)
+    post = (Post.objects.filter(author_id=author_id, pub_date__gte=since)
+            .order_by('-pub_date').values_list('pk', 'group_id').first())
+    if post is not None:
+        record(*post, FOLLOW)
+
+
+def top_groups(limit=5):
+    """
+    Самые популярные группы одним запросом по индексу.
+    """
+    return list(GroupTrend.objects.select_related('group')
+                .order_by('-score')[:limit])
+
+
+def prune(now=None):
+    """
+    Удаляет записи, чья оценка затухла ниже POSTS_TRENDING_MIN_VALUE:
+    одно удаление по диапазону индекса. Возвращает число строк.
+    """
+    threshold = log_score(min_value(), now or timezone.now())
+    posts, _ = PostTrend.objects.filter(score__lt=threshold).delete()
+    groups, _ = GroupTrend.objects.filter(score__lt=threshold).delete()
+    return posts + groups
+
+
+def _accumulate(scores, pk, score):
+    previous = scores.get(pk)
+    scores[pk] = score if previous is None else log_add(previous, score)
+
+
+def rebuild(since):
+    """
+    Пересчитывает оценки по постам и комментариям начиная с `since`,
+    например при первом включении ленты. Обычная работа ленты
+    обходится без него: оценки обновляются по событиям.
+    """
+    post_scores = {}
+    group_scores = {}
+
+    def add(post_id, group_id, event, when):
+        score = log_score(weight(event), when)
+        _accumulate(post_scores, post_id, score)
+        if group_id is not None:
+            _accumulate(group_scores, group_id, score)
+
+    posts = (Post.objects.filter(pub_date__gte=since)
+             .values_list('pk', 'group_id', 'pub_date').iterator())
+    for post_id, group_id, pub_date in posts:
+        add(post_id, group_id, POST, pub_date)
+    comments = (Comment.objects.filter(created__gte=since)
+                .values_list('post_id', 'post__group_id', 'created')
+                .iterator())
+    for post_id, group_id, created in comments:
+        add(post_id, group_id, COMMENT, created)
+    with transaction.atomic():
+        PostTrend.objects.all().delete()
+        GroupTrend.objects.all().delete()
+        PostTrend.objects.bulk_create(
+            [PostTrend(post_id=pk, score=score)
+             for pk, score in post_scores.items()], batch_size=500)
+        GroupTrend.objects.bulk_create(
+            [GroupTrend(group_id=pk, score=score)
+             for pk, score in group_scores.items()], batch_size=500)
+    cache.bump_generation('trending')
+    return len(post_scores), len(group_scores)
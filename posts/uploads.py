@@ -0,0 +1,113 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+# Форматы, в которых изображение сохраняется после перекодирования;
+# остальные перекодируются в PNG.
+FORMATS = {
+    'JPEG': ('image/jpeg', '.jpg'),
+    'PNG': ('image/png', '.png'),
+    'GIF': ('image/gif', '.gif'),
+    'WEBP': ('image/webp', '.webp'),
+}
+
+
+def max_upload_size():
+    return getattr(settings, 'POSTS_IMAGE_MAX_UPLOAD_SIZE', 10 * 1024 * 1024)
+
+
+def max_pixels():
+    return getattr(settings, 'POSTS_IMAGE_MAX_PIXELS', 40 * 1000 * 1000)
+
+
+def max_dimension():
+    return getattr(settings, 'POSTS_IMAGE_MAX_DIMENSION', 2560)
+
+
+class OversizedUpload(UploadedFile):
+    """
+    Заглушка вместо файла, превысившего допустимый размер.
+    Содержимое файла не сохраняется. Поле ImageField любой формы
+    читает файл при проверке и получает ошибку о размере файла.
+    """
+
+    def __init__(self, name, content_type, size):
+        super().__init__(file=None, name=name, content_type=content_type,
+                         size=size)
+
+    def open(self, mode=None):
+        raise ValueError('Файл превысил допустимый размер и не сохранен.')
+
+    def read(self, *args, **kwargs):
+        limit = filesizeformat(max_upload_size())
+        raise ValidationError(
+            f'Размер файла не должен превышать {limit}.',
+            code='file_too_large',
+        )
+
+
+class SizeLimitUploadHandler(FileUploadHandler):
+    """
+    Прекращает прием файла, как только он превышает
+    `POSTS_IMAGE_MAX_UPLOAD_SIZE`. Следующие обработчики
+    (запись во временный файл на диске) получают данные по частям.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.limit = max_upload_size()
+        self.received = 0
+        self.oversized = False
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.oversized:
+            return None
+        self.received += len(raw_data)
+        if self.received > self.limit:
+            self.oversized = True
+            return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.oversized:
+            return OversizedUpload(self.file_name, self.content_type,
+                                   self.received)
+        return None
+
+
+def normalize_image(upload):
+    """
+    Один раз перекодирует изображение: применяет ориентацию из EXIF,
+    удаляет метаданные и уменьшает до `POSTS_IMAGE_MAX_DIMENSION`.
+    Результат пишется во временный файл на диске.
+    """
+    upload.seek(0)
+    with Image.open(upload) as image:
+        image_format = image.format
+        bound = (max_dimension(), max_dimension())
+        # Для JPEG декодер сразу уменьшает изображение кратно 1/2..1/8,
+        # не раскладывая в память полный размер.
+        image.draft(image.mode, bound)
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(bound)
+        content_type, extension = FORMATS.get(image_format,
+                                              FORMATS['PNG'])
+        save_format = image_format if image_format in FORMATS else 'PNG'
+        options = {}
+        if save_format == 'JPEG':
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            options = {'quality': 85, 'optimize': True}
+        name = os.path.splitext(os.path.basename(upload.name))[0]
+        result = UploadedFile(tempfile.TemporaryFile(),
+                              f'{name}{extension}', content_type)
+        image.save(result.file, save_format, **options)
+    result.size = result.file.tell()
+    result.seek(0)
+    return result
@@ -1,9 +1,8 @@
 from django.conf import settings
 from django.conf.urls import url
 from django.urls import path
-from django.views.static import serve
 
-from . import views
+from . import files, views
 
 urlpatterns = [
     path('',
@@ -18,6 +17,15 @@ urlpatterns = [
     path('follow/',
          views.follow_index,
          name='follow_index'),
+    path('trending/',
+         views.trending_posts,
+         name='trending'),
+    path('search/',
+         views.search_posts,
+         name='search'),
+    path('internal/metrics/',
+         views.metrics_view,
+         name='metrics'),
     path('<str:username>/',
          views.profile,
          name='profile'),
@@ -27,6 +35,9 @@ urlpatterns = [
     path('<str:username>/<int:post_id>/edit/',
          views.post_edit,
          name='post_edit'),
+    path('<str:username>/<int:post_id>/comments/',
+         views.post_comments,
+         name='post_comments'),
     path("<username>/<int:post_id>/comment",
          views.add_comment,
          name="add_comment"),
@@ -46,8 +57,8 @@ urlpatterns = [
 
 if not settings.DEBUG:
     urlpatterns += [
-        url(r'^media/(?P<path>.*)$', serve,
-            {'document_root': settings.MEDIA_ROOT}),
-        url(r'^static/(?P<path>.*)$', serve,
-            {'document_root': settings.STATIC_ROOT}),
+        url(r'^media/(?P<path>.*)$', files.serve,
+            {'document_root': settings.MEDIA_ROOT, 'location': 'media'}),
+        url(r'^static/(?P<path>.*)$', files.serve,
+            {'document_root': settings.STATIC_ROOT, 'location': 'static'}),
     ]
@@ -1,21 +1,37 @@
+import json
+from hmac import compare_digest
+from urllib.parse import urlencode
+
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from django.core.paginator import Paginator
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.template.loader import render_to_string
+from django.utils.functional import SimpleLazyObject
 
+from . import (cache, feeds, follow_graph, metrics, recommendations, search,
+               tasks, trending)
+from .cache import generation_cache_page
+from .conditional import (author_page, author_stats, conditional,
+                          feed_etag, group_etag, post_etag, profile_etag)
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import Follow, Post, User, UserStats
+from .paginators import (POSTS_PER_PAGE, cached_count, comment_paginator,
+                         paginate)
+from .routers import use_replica
 
 
-@cache_page(1 * 20, key_prefix="index_page")
+@use_replica
+@conditional(feed_etag)
+@generation_cache_page('index')
 def index(request):
     """
     Главная страница(index).
     """
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    feed = feeds.index_feed()
+    count = cached_count('index', feed, estimate=True)
+    paginator, page = paginate(request, feed, count=count)
     context = {
         'page': page,
         'paginator': paginator,
@@ -23,22 +39,46 @@ def index(request):
     return render(request, 'index.html', context)
 
 
+@use_replica
+@generation_cache_page('trending', timeout=trending.cache_ttl)
+def trending_posts(request):
+    """
+    Популярные посты и группы.
+    """
+    feed = feeds.trending_feed()
+    count = min(cached_count('trending', feed), trending.size())
+    paginator, page = paginate(request, feed, count=count)
+    context = {
+        'page': page,
+        'paginator': paginator,
+        'groups': trending.top_groups(),
+    }
+    return render(request, 'trending.html', context)
+
+
+def _group_first_page(request, slug):
+    """
+    Кэшируется только первая страница группы: дальше читают редко.
+    """
+    if request.GET and dict(request.GET.items()) != {'page': '1'}:
+        return None
+    return cache.group_namespace(slug)
+
+
+@use_replica
+@conditional(group_etag)
+@generation_cache_page(_group_first_page)
 def group_posts(request, slug):
     """
     Страница всех постов группы.
     """
-    group = get_object_or_404(
-        Group,
-        slug=slug,
-    )
-    posts = group.posts.all()
-    post_list = Post.objects.all()[:12]
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    group = cache.group_meta(slug)
+    if group is None:
+        raise Http404
+    paginator, page = paginate(request, feeds.group_feed(group['id']),
+                               count=group['post_count'])
     context = {
         'group': group,
-        'posts': posts,
         'page': page,
         'paginator': paginator,
     }
@@ -59,41 +99,83 @@ def new_post(request):
     return redirect('index')
     
     
+@use_replica
+@conditional(profile_etag)
 def profile(request, username):
     """
     Страница просмотра профиля пользователя.
     """
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    following = author.following.exists()
+    stats = author_stats(request, username)
+    if stats is None:
+        stats = UserStats.objects.for_user(
+            get_object_or_404(User, username=username))
+    author = stats.user
+    # Страница id уже выбрана для ETag: остается выбрать сами посты.
+    paginator, page = author_page(request, stats)
+    posts = feeds.profile_feed(author).in_bulk(list(page))
+    page.object_list = [posts[pk] for pk in page if pk in posts]
+    following = (request.user.is_authenticated
+                 and follow_graph.is_following(request.user.pk, author.pk))
     context = {
         'author': author,
+        'stats': stats,
         'page': page,
         'paginator': paginator,
         'following': following,
+        'recommendations': (recommendations.for_user(request.user)
+                            if request.user == author else []),
     }
     return render(request, 'profile.html', context)
 
 
+@use_replica
+@conditional(post_etag)
 def post_view(request, username, post_id):
     """
     Отдельная страница просмотра поста.
     """
-    post = get_object_or_404(Post, pk=post_id, author__username=username)
+    post = get_object_or_404(feeds.post_feed(), pk=post_id,
+                             author__username=username)
     form = CommentForm()
-    comments = post.comments.all()
+    comments_after = request.GET.get('comments_after')
+    paginator = comment_paginator(feeds.comment_feed(post))
+    # Объекты ленивые: комментарии выбираются из БД одним
+    # запросом, только если первой страницы нет в кэше шаблона.
+    # Лишняя запись окна нужна только для has_next: в шаблон
+    # передаются страница и QuerySet без нее.
+    window = paginator.window(after=comments_after)
+    comments = window[:paginator.per_page]
+    comments_page = SimpleLazyObject(
+        lambda: paginator.page_from(window, bool(comments_after)))
     context = {
         'author': post.author,
+        'stats': (author_stats(request, username)
+                  or UserStats.objects.for_user(post.author)),
         'post': post,
         'form': form,
         'comments': comments,
+        'comments_page': comments_page,
+        'comments_after': comments_after,
     }
     return render(request, 'post.html', context)
 
 
+def post_comments(request, username, post_id):
+    """
+    Следующая страница комментариев поста в JSON
+    для кнопки "Показать еще".
+    """
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id,
+                             author__username=username)
+    page = comment_paginator(feeds.comment_feed(post)).page(
+        after=request.GET.get('after'))
+    return JsonResponse({
+        'html': render_to_string('comment_items.html', {'comments': page},
+                                 request),
+        'next': page.next_cursor() if page.has_next() else None,
+    })
+
+
 @login_required
 def post_edit(request, username, post_id):
     """
@@ -152,17 +234,18 @@ def add_comment(request, username, post_id):
 
 
 @login_required
+@use_replica
 def follow_index(request):
     """
     Страница с постами избранных авторов.
     """
-    posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    feed = feeds.follow_feed(request.user)
+    paginator, page = paginate(
+        request, feed, count=cached_count(f'follow:{request.user.pk}', feed))
     context = {
         'page': page,
         'paginator': paginator,
+        'recommendations': recommendations.for_user(request.user),
     }
     return render(request, 'follow.html', context)
 
@@ -173,8 +256,8 @@ def profile_follow(request, username):
     Подписка на профиль пользователя.
     """
     author = get_object_or_404(User, username=username)
-    following = author.following.exists()
-    if request.user != author and not following:
+    if (request.user != author
+            and not follow_graph.is_following(request.user.pk, author.pk)):
         Follow.objects.get_or_create(user=request.user, author=author)
     return redirect('profile', username=username)
 
@@ -187,3 +270,48 @@ def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     get_object_or_404(Follow, user=request.user, author=author).delete()
     return redirect('profile', username=username)
+
+
+def search_posts(request):
+    """
+    Поиск по текстам постов и комментариев.
+    """
+    query = request.GET.get('q', '').strip()
+    post_ids = search.get_backend().search_posts(query) if query else []
+    paginator = Paginator(post_ids, POSTS_PER_PAGE)
+    page = paginator.get_page(request.GET.get('page'))
+    posts = feeds.post_feed().in_bulk(page.object_list)
+    page.object_list = [posts[pk] for pk in page.object_list if pk in posts]
+    context = {
+        'query': query,
+        'page': page,
+        'paginator': paginator,
+        'page_query': urlencode({'q': query}) + '&' if query else '',
+    }
+    return render(request, 'search.html', context)
+
+
+def metrics_view(request):
+    """
+    Сводные метрики представлений: текст Prometheus
+    или JSON с образцами медленных запросов (`?format=json`).
+    Доступна персоналу, адресам INTERNAL_IPS и по токену.
+    """
+    token = getattr(settings, 'POSTS_METRICS_TOKEN', '')
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    allowed = (
+        request.user.is_staff
+        or request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS
+        or (token and compare_digest(header, f'Bearer {token}'))
+    )
+    if not allowed:
+        raise Http404
+    if request.GET.get('format') == 'json':
+        return HttpResponse(
+            json.dumps(metrics.registry.snapshot(), ensure_ascii=False),
+            content_type='application/json',
+        )
+    return HttpResponse(
+        metrics.registry.prometheus() + tasks.prometheus_queue_depth(),
+        content_type='text/plain; version=0.0.4',
+    )
@@ -0,0 +1,29 @@
+from django.db.backends.sqlite3 import base
+
+# Настройки соединения по умолчанию. Переопределяются
+# словарем PRAGMAS в описании БД в DATABASES.
+DEFAULT_PRAGMAS = {
+    # Журнал WAL: чтение не блокируется записью из других процессов.
+    'journal_mode': 'WAL',
+    # В режиме WAL достаточно синхронизации при контрольных точках.
+    'synchronous': 'NORMAL',
+    # Ожидание блокировки вместо мгновенной ошибки "database is locked".
+    'busy_timeout': 5000,
+    # Страничный кэш около 20 МБ на соединение.
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+    'mmap_size': 128 * 1024 * 1024,
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite с настройками соединения для работы под нагрузкой.
+    """
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = {**DEFAULT_PRAGMAS, **self.settings_dict.get('PRAGMAS', {})}
+        for name, value in pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
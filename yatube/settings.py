@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -52,6 +53,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'posts.middleware.MetricsMiddleware',
+    'posts.middleware.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,7 +70,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'posts.metrics.InstrumentedTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -95,6 +98,24 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения. Ленты читаются с реплик, запись и
+# чтение сразу после записи идут в основную БД.
+# Для проверки локально: cp db.sqlite3 replica.sqlite3 и
+# YATUBE_REPLICA_SQLITE=replica.sqlite3.
+DATABASE_ROUTERS = ['posts.routers.ReplicaRouter']
+POSTS_REPLICAS = []
+POSTS_REPLICA_SELECTION = 'round_robin'
+POSTS_REPLICA_MAX_LAG = 5
+POSTS_REPLICA_PIN_SECONDS = 5
+
+if os.environ.get('YATUBE_REPLICA_SQLITE'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['YATUBE_REPLICA_SQLITE'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    POSTS_REPLICAS = ['replica']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -143,12 +164,94 @@ SITE_ID = 1
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Cache
+# Бэкенд выбирается переменной окружения YATUBE_CACHE:
+# locmem - отдельный кэш в каждом процессе (разработка),
+# file - общий для процессов кэш на диске,
+# redis - общий кэш в Redis (нужен пакет django-redis).
+# Бэкенды из posts.cache_backends учитывают чтения кэша в метриках.
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'posts.cache_backends.LocMemCache',
+    },
+    'file': {
+        'BACKEND': 'posts.cache_backends.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'yatube_cache'),
+        ),
+    },
+    'redis': {
+        'BACKEND': 'posts.cache_backends.RedisCache',
+        'LOCATION': os.environ.get('YATUBE_CACHE_LOCATION',
+                                   'redis://127.0.0.1:6379/1'),
+    },
+}
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        **CACHE_BACKENDS[os.environ.get('YATUBE_CACHE', 'locmem')],
+        'KEY_PREFIX': 'yatube',
     }
 }
 
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
+
+# Ленты показывают номера не дальше POSTS_MAX_PAGES страниц, дальше
+# листаются курсором. Число постов ленты кэшируется на
+# POSTS_COUNT_CACHE_TTL секунд, а для таблиц PostgreSQL больше
+# POSTS_COUNT_ESTIMATE_THRESHOLD строк берется оценка планировщика.
+POSTS_MAX_PAGES = 100
+POSTS_COUNT_CACHE_TTL = 60
+POSTS_COUNT_ESTIMATE_THRESHOLD = 100000
+
+# Множества подписок и подписчиков хранятся в кэше, если в них
+# не больше POSTS_FOLLOW_CACHE_MAX id.
+POSTS_FOLLOW_CACHE_TTL = 60 * 60 * 24
+POSTS_FOLLOW_CACHE_MAX = 10000
+
+# Предложения "кого почитать" пересчитывает compute_recommendations
+# (например, раз в сутки по расписанию).
+POSTS_RECOMMENDATIONS_PER_USER = 10
+POSTS_RECOMMENDATION_GROUP_WEIGHT = 0.5
+POSTS_RECOMMENDATION_MAX_FANOUT = 1000
+
+# Лента /trending/: оценки постов и групп затухают вдвое за
+# POSTS_TRENDING_HALF_LIFE секунд и обновляются по событиям.
+# Угасшие записи удаляет `manage.py prune_trending` (по расписанию).
+POSTS_TRENDING_HALF_LIFE = 60 * 60 * 24
+POSTS_TRENDING_SIZE = 100
+POSTS_TRENDING_CACHE_TTL = 60
+POSTS_TRENDING_MIN_VALUE = 0.01
+
+# Побочные работы после записи (миниатюры, поисковый индекс, ленты
+# подписчиков, письма) выполняются фоновыми задачами posts.tasks.
+# При разработке они выполняются сразу: SQLite в памяти не дает
+# потокам писать параллельно с тестами. 'db' хранит очередь в БД,
+# ее выполняет `manage.py run_worker`.
+POSTS_TASKS_BACKEND = 'eager' if DEBUG else 'thread'
+POSTS_TASKS_WORKERS = 2
+POSTS_TASKS_MAX_RETRIES = 3
+POSTS_TASKS_RETRY_DELAY = 2
+POSTS_EMAIL_NOTIFICATIONS = False
+
+# Загрузки пишутся на диск по частям, а файлы больше
+# POSTS_IMAGE_MAX_UPLOAD_SIZE перестают приниматься на лету.
+FILE_UPLOAD_HANDLERS = [
+    'posts.uploads.SizeLimitUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+POSTS_IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+POSTS_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+POSTS_IMAGE_MAX_DIMENSION = 2560
+
+# Метрики запросов: гистограммы по представлениям отдаются
+# на /internal/metrics/ персоналу, INTERNAL_IPS или по токену
+# (заголовок "Authorization: Bearer <POSTS_METRICS_TOKEN>").
+POSTS_METRICS_ENABLED = True
+POSTS_METRICS_TOKEN = os.environ.get('POSTS_METRICS_TOKEN', '')
+POSTS_METRICS_SLOW_MS = 500
+POSTS_METRICS_SLOW_SAMPLES = 50
@@ -0,0 +1,129 @@
+"""
+Настройки для production.
+
+Включаются переменной окружения
+DJANGO_SETTINGS_MODULE=yatube.settings_production,
+остальные параметры также берутся из окружения.
+"""
+
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, INSTALLED_APPS, MIDDLEWARE, TEMPLATES
+
+DEBUG = False
+
+# Ключ из settings.py хранится в репозитории и в production
+# не используется.
+SECRET_KEY = os.environ.get('YATUBE_SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('Задайте переменную YATUBE_SECRET_KEY.')
+
+ALLOWED_HOSTS = os.environ.get(
+    'YATUBE_ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',')
+
+# За обратным прокси nginx у всех запросов REMOTE_ADDR 127.0.0.1,
+# поэтому /internal/metrics/ доступна только персоналу и по токену.
+INTERNAL_IPS = []
+
+# debug toolbar не участвует в обработке запросов.
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app != 'debug_toolbar']
+MIDDLEWARE = [middleware for middleware in MIDDLEWARE
+              if not middleware.startswith('debug_toolbar.')]
+
+
+# Database
+# Соединения с БД переиспользуются между запросами в течение
+# YATUBE_CONN_MAX_AGE секунд. YATUBE_DB_ENGINE=postgresql
+# переключает проект на PostgreSQL.
+
+CONN_MAX_AGE = int(os.environ.get('YATUBE_CONN_MAX_AGE', 60))
+
+if os.environ.get('YATUBE_DB_ENGINE') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'yatube'),
+            'USER': os.environ.get('POSTGRES_USER', 'yatube'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            # За пулом PgBouncer в режиме транзакций серверные
+            # курсоры недоступны.
+            'DISABLE_SERVER_SIDE_CURSORS': bool(
+                os.environ.get('YATUBE_PGBOUNCER')),
+        }
+    }
+    # Реплики PostgreSQL: YATUBE_REPLICA_HOSTS=host1,host2.
+    POSTS_REPLICAS = []
+    for number, host in enumerate(
+            filter(None, os.environ.get('YATUBE_REPLICA_HOSTS',
+                                        '').split(','))):
+        alias = f'replica_{number}'
+        DATABASES[alias] = {
+            **DATABASES['default'],
+            'HOST': host,
+            'TEST': {'MIRROR': 'default'},
+        }
+        POSTS_REPLICAS.append(alias)
+    POSTS_REPLICA_SELECTION = os.environ.get('YATUBE_REPLICA_SELECTION',
+                                             'least_lag')
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'yatube.backends.sqlite3',
+            'NAME': os.environ.get('YATUBE_SQLITE_PATH',
+                                   os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+        }
+    }
+    if os.environ.get('YATUBE_REPLICA_SQLITE'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'NAME': os.environ['YATUBE_REPLICA_SQLITE'],
+            'TEST': {'MIRROR': 'default'},
+        }
+
+
+# Templates
+# Скомпилированные шаблоны кэшируются в памяти процесса.
+
+TEMPLATES = [{
+    **TEMPLATES[0],
+    'APP_DIRS': False,
+    'OPTIONS': {
+        **TEMPLATES[0]['OPTIONS'],
+        'loaders': [
+            ('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ]),
+        ],
+    },
+}]
+
+# YATUBE_TASKS_BACKEND=db переносит фоновые задачи в очередь БД
+# и отдельные процессы `manage.py run_worker`.
+POSTS_TASKS_BACKEND = os.environ.get('YATUBE_TASKS_BACKEND', 'thread')
+POSTS_EMAIL_NOTIFICATIONS = (
+    os.environ.get('YATUBE_EMAIL_NOTIFICATIONS', '') == '1'
+)
+
+
+# Static and media files
+# collectstatic пишет статику с хэшем в имени и ее сжатые копии.
+# YATUBE_FILE_OFFLOAD=x-accel-redirect (nginx) или x-sendfile
+# передает отдачу файлов веб-серверу; для nginx нужны internal
+# location из POSTS_ACCEL_REDIRECT_LOCATIONS.
+
+STATICFILES_STORAGE = 'posts.storage.CompressedManifestStaticFilesStorage'
+POSTS_FILE_OFFLOAD = os.environ.get('YATUBE_FILE_OFFLOAD') or None
+POSTS_ACCEL_REDIRECT_LOCATIONS = {
+    'static': '/_protected/static/',
+    'media': '/_protected/media/',
+}
+POSTS_STATIC_MAX_AGE = 60 * 60
+POSTS_MEDIA_MAX_AGE = 60 * 60 * 24